@@ -0,0 +1,121 @@
+"""asyncio facade over the transaction, budget and report managers.
+
+Blocking database work runs on a bounded thread pool, so the event loop is
+never blocked. add_transaction goes through the TransactionManager's
+write-behind queue, so a burst of concurrent small writes pays for a handful
+of group commits instead of one commit each.
+
+    async with AsyncFinanceService('finance.db') as service:
+        await service.add_transaction(user_id, 'expense', 'Food', 12.5)
+        report = await service.generate_monthly_report(user_id)
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from database import DEFAULT_POOL_SIZE, configure_pool, get_pool
+from finance_manager import FinanceManager
+from write_behind import DEFAULT_WRITE_BATCH_SIZE, DEFAULT_WRITE_DELAY
+
+class AsyncFinanceService:
+    """Awaitable versions of the TransactionManager, BudgetManager and ReportGenerator APIs"""
+
+    def __init__(self, db_path='finance.db', max_workers=DEFAULT_POOL_SIZE,
+                 group_size=DEFAULT_WRITE_BATCH_SIZE, group_delay=DEFAULT_WRITE_DELAY):
+        # Every worker thread holds its own pooled connection while it runs
+        if get_pool(db_path).size < max_workers:
+            configure_pool(db_path, size=max_workers)
+        self.manager = FinanceManager(db_path)
+        self.transaction_manager = self.manager.transaction_manager
+        self.budget_manager = self.manager.budget_manager
+        self.report_generator = self.manager.report_generator
+        self.transaction_manager.enable_write_behind(group_size, group_delay)
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='finance-db')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    # Transactions
+
+    async def add_transaction(self, user_id, type, category, amount, description=None,
+                              date=None):
+        """Add a transaction as part of the next group commit; True once committed"""
+        return await asyncio.wrap_future(self.transaction_manager.queue_transaction(
+            user_id, type, category, amount, description, date))
+
+    async def flush(self):
+        """Wait until every write submitted so far has been committed"""
+        await self._run(self.transaction_manager.flush_writes)
+
+    async def add_transactions_bulk(self, user_id, rows, **kwargs):
+        return await self._run(self.transaction_manager.add_transactions_bulk,
+                               user_id, rows, **kwargs)
+
+    async def update_transaction(self, transaction_id, user_id, **changes):
+        return await self._run(self.transaction_manager.update_transaction,
+                               transaction_id, user_id, **changes)
+
+    async def delete_transaction(self, transaction_id, user_id):
+        return await self._run(self.transaction_manager.delete_transaction,
+                               transaction_id, user_id)
+
+    async def get_transactions(self, user_id, **filters):
+        return await self._run(self.transaction_manager.get_transactions, user_id, **filters)
+
+    async def get_transactions_page(self, user_id, *args, **kwargs):
+        return await self._run(self.transaction_manager.get_transactions_page,
+                               user_id, *args, **kwargs)
+
+    async def get_balance(self, user_id):
+        return await self._run(self.transaction_manager.get_balance, user_id)
+
+    # Budgets
+
+    async def set_budget(self, user_id, category, amount, month, year):
+        return await self._run(self.budget_manager.set_budget,
+                               user_id, category, amount, month, year)
+
+    async def get_budgets(self, user_id, month=None, year=None):
+        return await self._run(self.budget_manager.get_budgets, user_id, month, year)
+
+    async def get_budget_status(self, user_id, month=None, year=None):
+        return await self._run(self.budget_manager.get_budget_status, user_id, month, year)
+
+    async def get_budget_history(self, user_id, months=12, month=None, year=None):
+        return await self._run(self.budget_manager.get_budget_history,
+                               user_id, months, month, year)
+
+    async def check_budget_status(self, user_id, month=None, year=None):
+        return await self._run(self.budget_manager.check_budget_status, user_id, month, year)
+
+    # Reports
+
+    async def get_period_totals(self, user_id, start, end):
+        return await self._run(self.report_generator.get_period_totals, user_id, start, end)
+
+    async def generate_monthly_report(self, user_id, month=None, year=None):
+        return await self._run(self.report_generator.generate_monthly_report,
+                               user_id, month, year)
+
+    async def generate_yearly_report(self, user_id, year=None, fiscal_start_month=1):
+        return await self._run(self.report_generator.generate_yearly_report,
+                               user_id, year, fiscal_start_month)
+
+    async def generate_report_bundle(self, user_id, month=None, year=None):
+        return await self._run(self.report_generator.generate_report_bundle,
+                               user_id, month, year)
+
+    async def generate_category_analysis(self, user_id, start_date=None, end_date=None):
+        return await self._run(self.report_generator.generate_category_analysis,
+                               user_id, start_date, end_date)
+
+    async def close(self):
+        """Commit any pending writes, then stop the writer and worker threads"""
+        await self._run(self.transaction_manager.close)
+        self._executor.shutdown(wait=True)
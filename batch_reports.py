@@ -0,0 +1,101 @@
+"""Parallel statement generation for every user.
+
+Users are split into chunks that run on a ProcessPoolExecutor. Each worker
+process opens its own read-only connection, renders one statement per user
+and writes it to <output_dir>/statement_<user_id>.txt. Results stream back
+to the caller chunk by chunk as workers finish.
+
+    for result in iter_statements('finance.db', 'statements', workers=4):
+        print(result.user_id, result.path or result.error)
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import NamedTuple, Optional
+from database import configure_pool, get_pool
+from defaults import DEFAULT_CHUNK_SIZE
+
+class StatementResult(NamedTuple):
+    """Outcome of one user's statement: the file written, or why it failed"""
+    user_id: int
+    username: str
+    path: Optional[str]
+    error: Optional[str]
+
+# Set in each worker process by _init_worker
+_report_generator = None
+
+def _init_worker(db_path):
+    global _report_generator
+    from reports import ReportGenerator
+    configure_pool(db_path, size=1, read_only=True)
+    _report_generator = ReportGenerator(db_path)
+
+def statement_path(output_dir, user_id):
+    return os.path.join(output_dir, f"statement_{user_id}.txt")
+
+def render_statement(bundle, username, month, year):
+    """Join a report bundle into one statement text"""
+    return "\n".join([
+        f"Statement for {username} - {month}/{year}",
+        bundle['monthly'],
+        bundle['yearly'],
+        "Spending by Category",
+        "=" * 40,
+        bundle['category_analysis'],
+        "",
+    ])
+
+def _write_statements(users, output_dir, month, year):
+    """Worker task: write the statements for one chunk of (user_id, username)"""
+    results = []
+    for user_id, username in users:
+        bundle = _report_generator.generate_report_bundle(user_id, month, year)
+        if bundle is None:
+            results.append(StatementResult(user_id, username, None,
+                                           'report generation failed'))
+            continue
+        path = statement_path(output_dir, user_id)
+        try:
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(render_statement(bundle, username, month, year))
+        except OSError as e:
+            results.append(StatementResult(user_id, username, None, str(e)))
+            continue
+        results.append(StatementResult(user_id, username, path, None))
+    return results
+
+def list_users(db_path, user_ids=None):
+    """Return (id, username) for every user, or only for the given ids"""
+    pool = get_pool(db_path)
+    with pool.connection() as conn:
+        rows = conn.execute('SELECT id, username FROM users ORDER BY id').fetchall()
+    if user_ids is not None:
+        wanted = set(user_ids)
+        rows = [row for row in rows if row[0] in wanted]
+    return rows
+
+def iter_statements(db_path, output_dir, month=None, year=None, workers=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, user_ids=None):
+    """Write a monthly/yearly statement per user in parallel.
+
+    Yields a StatementResult per user, in completion order. workers defaults
+    to the number of CPUs.
+    """
+    if not month or not year:
+        current_date = datetime.now()
+        month = month or current_date.month
+        year = year or current_date.year
+    os.makedirs(output_dir, exist_ok=True)
+    users = list_users(db_path, user_ids)
+    chunks = [users[i:i + chunk_size] for i in range(0, len(users), max(1, chunk_size))]
+    if not chunks:
+        return
+
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(db_path,)) as executor:
+        futures = [executor.submit(_write_statements, chunk, output_dir, month, year)
+                   for chunk in chunks]
+        for future in as_completed(futures):
+            yield from future.result()
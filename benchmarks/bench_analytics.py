@@ -0,0 +1,162 @@
+"""Category percentiles, rolling averages and trend slopes: NumPy vs SQL vs pure Python"""
+import argparse
+import os
+import tempfile
+import time
+from collections import defaultdict
+from analytics import (AnalyticsEngine, category_percentiles, rolling_averages,
+                       trend_slopes)
+from benchmarks.bench_bulk_import import generate_rows
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+PERCENTILES = (25, 50, 75, 90)
+WINDOWS = (3, 6, 12)
+
+SQL_PERCENTILE = """
+    WITH ranked AS (
+        SELECT category, amount_cents AS amount,
+               ROW_NUMBER() OVER (PARTITION BY category ORDER BY amount_cents) - 1 AS rank,
+               COUNT(*) OVER (PARTITION BY category) AS n
+        FROM transactions WHERE user_id = ? AND type = 'expense'
+    )
+    SELECT category, n, rank, amount FROM ranked
+    WHERE rank = CAST((n - 1) * ? AS INTEGER) OR rank = CAST((n - 1) * ? AS INTEGER) + 1
+"""
+
+SQL_ROLLING = """
+    SELECT month, total,
+           AVG(total) OVER (ORDER BY month ROWS BETWEEN {preceding} PRECEDING AND CURRENT ROW)
+    FROM (SELECT substr(date, 1, 7) AS month, SUM(amount_cents) AS total
+          FROM transactions WHERE user_id = ? AND type = 'expense' GROUP BY month)
+"""
+
+SQL_SLOPES = """
+    WITH monthly AS (
+        SELECT category,
+               CAST(substr(date, 1, 4) AS INTEGER) * 12 + CAST(substr(date, 6, 2) AS INTEGER) AS x,
+               SUM(amount_cents) AS y
+        FROM transactions WHERE user_id = ? AND type = 'expense'
+        GROUP BY category, x
+    )
+    SELECT category,
+           (COUNT(*) * SUM(x * y) - SUM(x) * SUM(y)) / (COUNT(*) * SUM(x * x) - SUM(x) * SUM(x))
+    FROM monthly GROUP BY category
+"""
+
+def sql_percentiles(conn, user_id):
+    result = {}
+    for p in PERCENTILES:
+        fraction = p / 100.0
+        picks = defaultdict(dict)
+        sizes = {}
+        for category, n, rank, amount in conn.execute(SQL_PERCENTILE,
+                                                      (user_id, fraction, fraction)):
+            picks[category][rank] = amount
+            sizes[category] = n
+        for category, ranks in picks.items():
+            position = (sizes[category] - 1) * fraction
+            low = int(position)
+            high = ranks.get(low + 1, ranks[low])
+            result.setdefault(category, []).append(
+                ranks[low] + (high - ranks[low]) * (position - low))
+    return result
+
+def sql_rolling(conn, user_id):
+    return {w: conn.execute(SQL_ROLLING.format(preceding=w - 1), (user_id,)).fetchall()
+            for w in WINDOWS}
+
+def sql_slopes(conn, user_id):
+    return conn.execute(SQL_SLOPES, (user_id,)).fetchall()
+
+def python_load(conn, user_id):
+    return conn.execute("""
+        SELECT date, amount_cents / 100.0, category FROM transactions
+        WHERE user_id = ? AND type = 'expense' ORDER BY date
+    """, (user_id,)).fetchall()
+
+def python_percentiles(rows):
+    by_category = defaultdict(list)
+    for _, amount, category in rows:
+        by_category[category].append(amount)
+    result = {}
+    for category, amounts in by_category.items():
+        amounts.sort()
+        values = []
+        for p in PERCENTILES:
+            position = (len(amounts) - 1) * p / 100.0
+            low = int(position)
+            high = min(low + 1, len(amounts) - 1)
+            values.append(amounts[low] + (amounts[high] - amounts[low]) * (position - low))
+        result[category] = values
+    return result
+
+def _python_monthly(rows):
+    monthly = defaultdict(lambda: defaultdict(float))
+    for date, amount, category in rows:
+        monthly[category][int(date[:4]) * 12 + int(date[5:7]) - 1] += amount
+    return monthly
+
+def python_rolling(rows):
+    totals = defaultdict(float)
+    for date, amount, _ in rows:
+        totals[int(date[:4]) * 12 + int(date[5:7]) - 1] += amount
+    months = range(min(totals), max(totals) + 1)
+    series = [totals.get(m, 0.0) for m in months]
+    return {w: [sum(series[i - w + 1:i + 1]) / w if i >= w - 1 else None
+                for i in range(len(series))] for w in WINDOWS}
+
+def python_slopes(rows):
+    monthly = _python_monthly(rows)
+    first = min(min(m) for m in monthly.values())
+    last = max(max(m) for m in monthly.values())
+    xs = list(range(last - first + 1))
+    mean_x = sum(xs) / len(xs)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    slopes = {}
+    for category, months in monthly.items():
+        ys = [months.get(first + x, 0.0) for x in xs]
+        mean_y = sum(ys) / len(ys)
+        slopes[category] = sum((x - mean_x) * (y - mean_y)
+                               for x, y in zip(xs, ys)) / denominator
+    return slopes
+
+def measure(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"  {label:<22} {(time.perf_counter() - start) * 1000:>10.1f} ms")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        manager.transaction_manager.add_transactions_bulk(
+            1, generate_rows(args.rows, per_day=max(1, args.rows // 3650)))
+        print(f"{args.rows:,} expense transactions")
+        engine = AnalyticsEngine(manager.db_path)
+
+        print('NumPy')
+        data = measure('load columns', lambda: engine.load(1))
+        measure('percentiles', lambda: category_percentiles(data, PERCENTILES))
+        measure('rolling averages', lambda: rolling_averages(data, WINDOWS))
+        measure('trend slopes', lambda: trend_slopes(data))
+
+        with manager.pool.connection() as conn:
+            print('SQL')
+            measure('percentiles', lambda: sql_percentiles(conn, 1))
+            measure('rolling averages', lambda: sql_rolling(conn, 1))
+            measure('trend slopes', lambda: sql_slopes(conn, 1))
+
+            print('Pure Python')
+            rows = measure('load rows', lambda: python_load(conn, 1))
+            measure('percentiles', lambda: python_percentiles(rows))
+            measure('rolling averages', lambda: python_rolling(rows))
+            measure('trend slopes', lambda: python_slopes(rows))
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Load test: concurrent simulated users against AsyncFinanceService"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from async_service import AsyncFinanceService
+from write_behind import DEFAULT_WRITE_BATCH_SIZE, DEFAULT_WRITE_DELAY
+from database import close_all_pools
+
+async def simulated_user(service, user_id, operations, latencies, rng):
+    for _ in range(operations):
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < 0.8:
+            kind = 'write'
+            await service.add_transaction(user_id, rng.choice(('income', 'expense')),
+                                          rng.choice(('Food', 'Rent', 'Travel')),
+                                          round(rng.uniform(1, 200), 2))
+        elif roll < 0.9:
+            kind = 'read'
+            await service.get_balance(user_id)
+        else:
+            kind = 'read'
+            await service.generate_monthly_report(user_id)
+        latencies[kind].append(time.perf_counter() - start)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def run(db_path, users, operations, group_size, group_delay, workers):
+    latencies = {'write': [], 'read': []}
+    rng = random.Random(42)
+    async with AsyncFinanceService(db_path, max_workers=workers, group_size=group_size,
+                                   group_delay=group_delay) as service:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            simulated_user(service, user_id, operations, latencies,
+                           random.Random(rng.random()))
+            for user_id in range(1, users + 1)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--operations', type=int, default=20, help='Operations per user.')
+    parser.add_argument('--workers', type=int, default=5)
+    args = parser.parse_args()
+
+    for label, group_size, group_delay in (
+            ('one commit per write', 1, 0),
+            ('group commit', DEFAULT_WRITE_BATCH_SIZE, DEFAULT_WRITE_DELAY)):
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed, latencies = asyncio.run(run(
+                os.path.join(tmp, 'bench.db'), args.users, args.operations,
+                group_size, group_delay, args.workers))
+            close_all_pools()
+        total = sum(len(values) for values in latencies.values())
+        print(f"{label}: {args.users:,} users, {total:,} operations in {elapsed:.2f}s "
+              f"= {total / elapsed:,.0f} ops/s")
+        for kind, values in latencies.items():
+            print(f"  {kind:<6} p50 {statistics.median(values) * 1000:8.1f} ms   "
+                  f"p99 {percentile(values, 0.99) * 1000:8.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Balance lookup: full-history SUM versus the materialised user_balances row"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.bench_bulk_import import generate_rows
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+def full_history_balance(pool, user_id):
+    """The previous implementation: two SUMs over every transaction"""
+    with pool.connection() as conn:
+        income = conn.execute("""
+            SELECT COALESCE(SUM(amount_cents), 0) FROM transactions
+            WHERE user_id = ? AND type = 'income'
+        """, (user_id,)).fetchone()[0]
+        expenses = conn.execute("""
+            SELECT COALESCE(SUM(amount_cents), 0) FROM transactions
+            WHERE user_id = ? AND type = 'expense'
+        """, (user_id,)).fetchone()[0]
+        return income - expenses
+
+def measure(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / repeat * 1e6:>12,.1f} us/call")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        tm = manager.transaction_manager
+        tm.add_transactions_bulk(1, generate_rows(args.rows))
+        assert full_history_balance(tm.pool, 1) == tm.get_balance(1).cents
+        print(f"{args.rows:,} transactions")
+        measure('full-history SUM', lambda: full_history_balance(tm.pool, 1), args.repeat)
+        measure('materialised balance', lambda: tm.get_balance(1), args.repeat * 100)
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
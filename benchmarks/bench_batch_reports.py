@@ -0,0 +1,68 @@
+"""Nightly statements for many users: serial loop versus 1..N worker processes"""
+import argparse
+import os
+import tempfile
+import time
+from batch_reports import iter_statements, render_statement, statement_path
+from benchmarks.bench_bulk_import import generate_rows
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+def setup(db_path, users, rows_per_user):
+    manager = FinanceManager(db_path)
+    with manager.pool.connection() as conn:
+        # Placeholder hashes: bcrypt for thousands of users would dominate setup
+        conn.executemany('INSERT INTO users (username, password) VALUES (?, ?)',
+                         [(f'user{n}', b'x') for n in range(1, users + 1)])
+        conn.commit()
+    for user_id in range(1, users + 1):
+        manager.transaction_manager.add_transactions_bulk(
+            user_id, generate_rows(rows_per_user, seed=user_id, per_day=2))
+    return manager
+
+def serial(manager, output_dir, month, year):
+    """The previous approach: one report call per user in a single process"""
+    with manager.pool.connection() as conn:
+        users = conn.execute('SELECT id, username FROM users ORDER BY id').fetchall()
+    for user_id, username in users:
+        bundle = manager.report_generator.generate_report_bundle(user_id, month, year)
+        with open(statement_path(output_dir, user_id), 'w', encoding='utf-8') as file:
+            file.write(render_statement(bundle, username, month, year))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--rows-per-user', type=int, default=500)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=50)
+    args = parser.parse_args()
+    month, year = 6, 2020
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        manager = setup(db_path, args.users, args.rows_per_user)
+        print(f"{args.users:,} users, {args.users * args.rows_per_user:,} transactions")
+
+        output_dir = os.path.join(tmp, 'serial')
+        os.makedirs(output_dir)
+        start = time.perf_counter()
+        serial(manager, output_dir, month, year)
+        elapsed = time.perf_counter() - start
+        print(f"{'serial':<12} {elapsed:8.2f}s  {args.users / elapsed:>10,.0f} users/s")
+
+        counts = sorted({2 ** n for n in range(args.max_workers.bit_length())}
+                        | {args.max_workers})
+        for workers in counts:
+            output_dir = os.path.join(tmp, f'workers{workers}')
+            start = time.perf_counter()
+            count = sum(1 for result in iter_statements(
+                db_path, output_dir, month, year, workers, args.chunk_size)
+                if result.error is None)
+            elapsed = time.perf_counter() - start
+            assert count == args.users
+            print(f"{workers:>2} workers   {elapsed:8.2f}s  "
+                  f"{args.users / elapsed:>10,.0f} users/s")
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Budget status with one aggregated query versus one SUM query per category"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from cache import configure_cache
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+def n_plus_one_status(pool, user_id, month, year, start, end):
+    """The previous implementation: fetch budgets, then SUM each category"""
+    with pool.connection() as conn:
+        budgets = conn.execute("""
+            SELECT category, amount_cents FROM budgets
+            WHERE user_id = ? AND month = ? AND year = ?
+        """, (user_id, month, year)).fetchall()
+        status = []
+        for category, amount in budgets:
+            spent = conn.execute("""
+                SELECT COALESCE(SUM(amount_cents), 0) FROM transactions
+                WHERE user_id = ? AND category = ? AND type = 'expense'
+                AND date >= ? AND date < ?
+            """, (user_id, category, start, end)).fetchone()[0]
+            status.append((category, amount, spent))
+        return status
+
+def measure(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<36} {elapsed / repeat * 1000:>9.2f} ms/call")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--categories', type=int, default=200)
+    parser.add_argument('--rows-per-month', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    categories = [f'Category {i}' for i in range(args.categories)]
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        # Measure the queries themselves, not the result cache
+        configure_cache(manager.db_path, max_entries=0)
+        bm = manager.budget_manager
+        for month in range(1, 13):
+            for category in categories:
+                bm.set_budget(1, category, 500, month, 2024)
+            manager.transaction_manager.add_transactions_bulk(1, (
+                ('expense', rng.choice(categories), rng.uniform(1, 100), None,
+                 f'2024-{month:02d}-{rng.randint(1, 28):02d}')
+                for _ in range(args.rows_per_month)))
+
+        start, end = '2024-06-01', '2024-07-01'
+        assert len(n_plus_one_status(bm.pool, 1, 6, 2024, start, end)) == args.categories
+        measure('N+1 per-category SUMs',
+                lambda: n_plus_one_status(bm.pool, 1, 6, 2024, start, end), args.repeat)
+        measure('single aggregated query',
+                lambda: bm.get_budget_status(1, 6, 2024), args.repeat)
+        measure('12 months, one per call',
+                lambda: [bm.get_budget_status(1, m, 2024) for m in range(1, 13)],
+                max(1, args.repeat // 10))
+        measure('12 months, single query',
+                lambda: bm.get_budget_history(1, 12, 12, 2024), max(1, args.repeat // 10))
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Rows/sec for add_transactions_bulk versus one add_transaction call per row"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from database import close_all_pools
+from finance_manager import FinanceManager
+from transactions import DEFAULT_BATCH_SIZE
+
+CATEGORIES = ['Food', 'Rent', 'Travel', 'Utilities', 'Fun', 'Health']
+
+def generate_rows(count, seed=42, per_day=50):
+    """Yield date-ordered statement rows, like a bank history export"""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, 12, 0, 0)
+    for i in range(count):
+        date = start + timedelta(days=i // per_day, seconds=i % per_day)
+        yield ('expense', rng.choice(CATEGORIES), round(rng.uniform(1, 500), 2),
+               'bench', date.strftime('%Y-%m-%d %H:%M:%S'))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--single-rows', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        tm = manager.transaction_manager
+
+        start = time.perf_counter()
+        for row in generate_rows(args.single_rows):
+            tm.add_transaction(1, row[0], row[1], row[2], row[3], row[4])
+        elapsed = time.perf_counter() - start
+        print(f"add_transaction loop:   {args.single_rows / elapsed:>12,.0f} rows/sec")
+
+        # Materialise the input first so row generation is not part of the timing
+        rows = list(generate_rows(args.rows))
+        start = time.perf_counter()
+        result = tm.add_transactions_bulk(1, iter(rows), args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"add_transactions_bulk:  {result['accepted'] / elapsed:>12,.0f} rows/sec "
+              f"({result['accepted']:,} rows, batch size {args.batch_size})")
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Repeated report and budget requests with and without the result cache.
+
+Simulates a GUI session refreshing the monthly report, yearly report and
+budget status, with an occasional transaction written to a random month.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from benchmarks.bench_bulk_import import generate_rows
+from cache import configure_cache
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+CATEGORIES = ('Food', 'Rent', 'Travel', 'Utilities', 'Fun')
+
+def session(manager, requests, write_every, seed):
+    rng = random.Random(seed)
+    rg, bm = manager.report_generator, manager.budget_manager
+    tm = manager.transaction_manager
+    for i in range(requests):
+        if write_every and i % write_every == write_every - 1:
+            month = rng.randint(1, 12)
+            tm.add_transaction(1, 'expense', rng.choice(CATEGORIES), 12.5, None,
+                               f'2024-{month:02d}-15')
+        kind = i % 3
+        if kind == 0:
+            rg.generate_monthly_report(1, 6, 2024)
+        elif kind == 1:
+            rg.generate_yearly_report(1, 2024)
+        else:
+            bm.check_budget_status(1, 6, 2024)
+
+def measure(label, func, requests):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed / requests * 1e6:>10,.1f} us/request")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--write-every', type=int, default=50,
+                        help='Write one transaction every N requests (0 for none).')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        manager.transaction_manager.add_transactions_bulk(
+            1, generate_rows(args.rows, per_day=max(1, args.rows // 365)))
+        for category in CATEGORIES:
+            manager.budget_manager.set_budget(1, category, 1000, 6, 2024)
+
+        configure_cache(manager.db_path, max_entries=0)
+        uncached = measure('uncached', lambda: session(
+            manager, args.requests, args.write_every, 1), args.requests)
+        cache = configure_cache(manager.db_path)
+        cached = measure('cached', lambda: session(
+            manager, args.requests, args.write_every, 1), args.requests)
+        stats = cache.stats()
+        print(f"speedup {uncached / cached:.1f}x; hits {stats.hits:,}, "
+              f"misses {stats.misses:,}, invalidations {stats.invalidations:,}, "
+              f"hit rate {stats.hit_rate:.1%}")
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Categorising descriptions with compiled rules versus testing each rule in turn.
+
+Rules are made-up merchant names; about half of the descriptions contain one.
+The rule-by-rule loop is timed on a sample and scaled up, as it is far too
+slow to run over every description.
+"""
+import argparse
+import os
+import random
+import re
+import string
+import tempfile
+import time
+from database import close_all_pools
+from finance_manager import FinanceManager
+from rules import Categoriser
+
+CATEGORIES = ['Food', 'Rent', 'Travel', 'Utilities', 'Fun', 'Health']
+
+def make_word(rng, low, high):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+def make_rules(count, seed=5):
+    rng = random.Random(seed)
+    return [(make_word(rng, 4, 10), rng.choice(CATEGORIES), rng.randint(0, 3))
+            for _ in range(count)]
+
+def make_descriptions(count, rules, seed=6):
+    rng = random.Random(seed)
+    for _ in range(count):
+        words = [make_word(rng, 3, 9).upper() for _ in range(3)]
+        if rng.random() < 0.5:
+            words.insert(rng.randrange(4), rng.choice(rules)[0].upper())
+        yield ' '.join(words) + f" #{rng.randrange(10000)}"
+
+def rule_by_rule(compiled, description):
+    """The baseline: every rule's own regex tested against the description"""
+    text = description.lower()
+    best = None
+    for order, (regex, category, priority) in enumerate(compiled):
+        if regex.search(text) and (best is None or (-priority, order) < best[0]):
+            best = ((-priority, order), category)
+    return best[1] if best else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rules', type=int, default=5000)
+    parser.add_argument('--descriptions', type=int, default=1000000)
+    parser.add_argument('--sample', type=int, default=2000)
+    parser.add_argument('--bulk-rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    rules = make_rules(args.rules)
+    descriptions = list(make_descriptions(args.descriptions, rules))
+
+    start = time.perf_counter()
+    categoriser = Categoriser(rules)
+    print(f"compile {len(categoriser):,} rules:      {(time.perf_counter() - start) * 1000:>10.1f} ms")
+
+    start = time.perf_counter()
+    matched = sum(1 for text in descriptions if categoriser.categorise(text) is not None)
+    elapsed = time.perf_counter() - start
+    print(f"compiled matcher:           {len(descriptions) / elapsed:>10,.0f} descriptions/sec "
+          f"({elapsed:.1f}s for {len(descriptions):,}, {matched:,} matched)")
+
+    sample = descriptions[:args.sample]
+    compiled = [(re.compile(r'(?<!\w)' + re.escape(pattern)), category, priority)
+                for pattern, category, priority in rules]
+    start = time.perf_counter()
+    baseline = [rule_by_rule(compiled, text) for text in sample]
+    elapsed = time.perf_counter() - start
+    print(f"rule by rule (sample):      {len(sample) / elapsed:>10,.0f} descriptions/sec "
+          f"(~{elapsed / len(sample) * len(descriptions):.0f}s for {len(descriptions):,})")
+    assert baseline == [categoriser.categorise(text) for text in sample]
+
+    rows = [('expense', None, 10, text, '2024-01-01') for text in descriptions[:args.bulk_rows]]
+    for categorise in (False, True):
+        # A fresh database each time, so both imports start from an empty index
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+            for pattern, category, priority in rules:
+                manager.rule_manager.add_rule(1, pattern, category, priority)
+            start = time.perf_counter()
+            # Without categorise the rows need a category to be accepted
+            result = manager.transaction_manager.add_transactions_bulk(
+                1, rows if categorise else (row[:1] + ('Food',) + row[2:] for row in rows),
+                categorise=categorise)
+            elapsed = time.perf_counter() - start
+            label = 'bulk import, categorised:' if categorise else 'bulk import, plain:'
+            print(f"{label:<27} {result['accepted'] / elapsed:>10,.0f} rows/sec")
+            close_all_pools()
+
+if __name__ == '__main__':
+    main()
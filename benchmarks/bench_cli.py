@@ -0,0 +1,46 @@
+"""CLI throughput: one process per command versus a single batch process"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT = str(Path(__file__).resolve().parent.parent / 'finance_manager.py')
+
+def run(args, env, **kwargs):
+    return subprocess.run([sys.executable, SCRIPT, *args], env=env, check=True,
+                          stdout=subprocess.DEVNULL, **kwargs)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--commands', type=int, default=100,
+                        help='Commands run one process each.')
+    parser.add_argument('--batch-commands', type=int, default=10000,
+                        help='Commands run through a single batch process.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, FINANCE_DB=os.path.join(tmp, 'bench.db'),
+                   FINANCE_SESSION_FILE=os.path.join(tmp, 'session'))
+        run(['register', '--username', 'bench', '--password', 'password'], env)
+        run(['login', '--username', 'bench', '--password', 'password'], env)
+        command = ['add-transaction', '--type', 'expense', '--category', 'Food',
+                   '--amount', '12.50', '--description', 'Lunch']
+
+        start = time.perf_counter()
+        for _ in range(args.commands):
+            run(command, env)
+        per_process = args.commands / (time.perf_counter() - start)
+
+        script = (' '.join(command) + '\n') * args.batch_commands
+        start = time.perf_counter()
+        run(['batch'], env, input=script.encode())
+        batch = args.batch_commands / (time.perf_counter() - start)
+
+        print(f"{'process per command':<24} {per_process:>10,.1f} commands/s")
+        print(f"{'batch':<24} {batch:>10,.1f} commands/s  ({batch / per_process:.0f}x)")
+
+if __name__ == '__main__':
+    main()
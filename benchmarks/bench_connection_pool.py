@@ -0,0 +1,62 @@
+"""Ops/sec for per-call sqlite3.connect() versus the shared connection pool"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+def connect_per_call_insert(db_path, user_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("""
+            INSERT INTO transactions (user_id, type, category, amount_cents, description)
+            VALUES (?, 'expense', 'Food', 100, 'bench')
+        """, (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def connect_per_call_balance(db_path, user_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("""
+            SELECT COALESCE(SUM(amount_cents), 0) FROM transactions
+            WHERE user_id = ? AND type = 'expense'
+        """, (user_id,)).fetchone()
+    finally:
+        conn.close()
+
+def measure(label, func, ops):
+    start = time.perf_counter()
+    for _ in range(ops):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {ops / elapsed:>12,.0f} ops/sec")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ops', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Baseline: default journal mode, a fresh connection per operation
+        before = os.path.join(tmp, 'before.db')
+        FinanceManager(before, pool_size=1)
+        close_all_pools()
+        conn = sqlite3.connect(before)
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.close()
+        measure('insert, connect per call', lambda: connect_per_call_insert(before, 1), args.ops)
+        measure('balance, connect per call', lambda: connect_per_call_balance(before, 1), args.ops)
+
+        after = os.path.join(tmp, 'after.db')
+        manager = FinanceManager(after)
+        tm = manager.transaction_manager
+        measure('insert, pooled', lambda: tm.add_transaction(1, 'expense', 'Food', 1.0, 'bench'), args.ops)
+        measure('balance, pooled', lambda: tm.get_balance(1), args.ops)
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Columnar export throughput, memory by batch size, and incremental snapshots.
+
+Each export runs in a fresh process, which reports its peak Python heap
+(tracemalloc) plus the peak of Arrow's memory pool; these should follow the
+batch size, not the number of rows. Resident size is not used, as it counts
+database pages SQLite memory-maps (mmap_size). The
+last lines compare a monthly aggregate over the Parquet files with the
+strftime query analysts run against a copy of the database.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+CATEGORIES = ['Food', 'Rent', 'Travel', 'Utilities', 'Fun', 'Health']
+
+def generate_rows(count, seed=3):
+    rng = random.Random(seed)
+    start = datetime(2019, 1, 1)
+    for i in range(count):
+        date = start + timedelta(minutes=i * 10)
+        yield (rng.choice(('expense', 'income')), rng.choice(CATEGORIES),
+               round(rng.uniform(1, 500), 2), f"Payment {i}",
+               date.strftime('%Y-%m-%d %H:%M:%S'))
+
+def run_export(db_path, target, incremental, batch_size, trace):
+    """Export in this process; returns (seconds, result, peak memory in MB or None).
+    Tracing slows the export down, so it is timed and traced in separate runs."""
+    import pyarrow as pa
+    from export import SnapshotExporter
+    exporter = SnapshotExporter(db_path)
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = exporter.export(target, incremental=incremental, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    if not trace:
+        return elapsed, result, None
+    peak = tracemalloc.get_traced_memory()[1] + pa.default_memory_pool().max_memory()
+    return elapsed, result, peak / 2 ** 20
+
+def export_in_child(context, db_path, target, incremental=False, batch_size=65536,
+                    trace=False):
+    # maxtasksperchild=1 gives every export its own process
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_export, (db_path, target, incremental, batch_size, trace))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--changes', type=int, default=10000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[1024, 16384, 65536, 262144])
+    args = parser.parse_args()
+
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        manager = FinanceManager(db_path)
+        tm = manager.transaction_manager
+        per_user = args.rows // args.users
+        for user_id in range(1, args.users + 1):
+            tm.add_transactions_bulk(user_id, generate_rows(per_user, seed=user_id),
+                                     batch_size=50000)
+        rows = per_user * args.users
+        print(f"loaded {rows:,} rows for {args.users} users")
+
+        target = os.path.join(tmp, 'export')
+        for batch_size in args.batch_sizes:
+            elapsed, result, _ = export_in_child(context, db_path, target,
+                                                 batch_size=batch_size)
+            _, _, peak = export_in_child(context, db_path, target, batch_size=batch_size,
+                                         trace=True)
+            print(f"full export, batch {batch_size:>7,}: {rows / elapsed:>10,.0f} rows/sec "
+                  f"({elapsed:.1f}s, {len(result['files'])} files, peak {peak:,.1f} MB)")
+
+        rng = random.Random(9)
+        conn = manager.pool.acquire()
+        try:
+            max_id = conn.execute('SELECT MAX(id) FROM transactions').fetchone()[0]
+        finally:
+            manager.pool.release(conn)
+        changed = rng.sample(range(1, max_id + 1), args.changes)
+        for transaction_id in changed[:args.changes // 2]:
+            tm.update_transaction(transaction_id, 1 + (transaction_id - 1) // per_user,
+                                  amount=1)
+        for transaction_id in changed[args.changes // 2:]:
+            tm.delete_transaction(transaction_id, 1 + (transaction_id - 1) // per_user)
+        elapsed, result, _ = export_in_child(context, db_path, target, incremental=True)
+        print(f"incremental, {args.changes:,} changes:   {elapsed * 1000:>10.1f} ms "
+              f"({result['transactions']:,} rows in {len(result['files'])} files)")
+
+        start = time.perf_counter()
+        conn = manager.pool.acquire()
+        try:
+            expected = conn.execute("""
+                SELECT strftime('%Y', date), strftime('%m', date), SUM(amount_cents)
+                FROM transactions WHERE type = 'expense'
+                GROUP BY 1, 2
+            """).fetchall()
+        finally:
+            manager.pool.release(conn)
+        print(f"monthly expenses, SQL strftime:  {(time.perf_counter() - start) * 1000:>10.1f} ms")
+
+        start = time.perf_counter()
+        table = ds.dataset(os.path.join(target, 'transactions'), partitioning='hive').to_table(
+            columns=['id', 'snapshot', 'deleted', 'type', 'amount_cents', 'year', 'month'])
+        # Current state: each id's row from its latest snapshot, unless deleted
+        latest = table.group_by('id').aggregate([('snapshot', 'max')])
+        table = table.join(latest, ['id', 'snapshot'], ['id', 'snapshot_max'],
+                           join_type='inner')
+        table = table.filter(pc.and_(pc.invert(table['deleted']),
+                                     pc.equal(table['type'], 'expense')))
+        totals = table.group_by(['year', 'month']).aggregate([('amount_cents', 'sum')])
+        print(f"monthly expenses, Parquet:       {(time.perf_counter() - start) * 1000:>10.1f} ms")
+        assert sorted(zip(totals['year'].to_pylist(), totals['month'].to_pylist(),
+                          totals['amount_cents_sum'].to_pylist())) == \
+            sorted((int(year), int(month), total) for year, month, total in expected)
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Reports over mixed-currency transactions versus the same rows in one currency.
+
+User 1 holds every row in USD; user 2 holds the same rows split across USD,
+EUR and GBP, converted at month-end rates from a table of daily rates.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from benchmarks.bench_bulk_import import generate_rows
+from cache import configure_cache
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+CURRENCIES = ('USD', 'EUR', 'GBP')
+
+def write_rates(path, years, seed=3):
+    """Write a CSV of daily EUR and GBP rates against USD"""
+    rng = random.Random(seed)
+    rates = {'EUR': 1.10, 'GBP': 1.30}
+    day = date(2020, 1, 1)
+    with open(path, 'w') as file:
+        file.write('date,currency,rate\n')
+        for _ in range(years * 366):
+            for currency in rates:
+                rates[currency] *= 1 + rng.uniform(-0.005, 0.005)
+                file.write(f"{day.isoformat()},{currency},{rates[currency]:.6f}\n")
+            day += timedelta(days=1)
+
+def measure(label, func, repeat):
+    func()  # warm up: page cache, and the first load of the rates
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed / repeat * 1000:>10.2f} ms/call")
+    assert result is not None
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    per_day = max(1, args.rows // (args.years * 365))
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        # Measure the queries and conversion, not the result cache
+        configure_cache(manager.db_path, max_entries=0)
+        rates = os.path.join(tmp, 'rates.csv')
+        write_rates(rates, args.years)
+        print(f"imported {manager.fx_manager.import_csv(rates):,} rates")
+
+        tm = manager.transaction_manager
+        start = time.perf_counter()
+        tm.add_transactions_bulk(1, generate_rows(args.rows, per_day=per_day),
+                                 batch_size=50000)
+        tm.add_transactions_bulk(2, (row + (CURRENCIES[i % 3],) for i, row in enumerate(
+            generate_rows(args.rows, per_day=per_day))), batch_size=50000)
+        print(f"loaded 2 x {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+        rg = manager.report_generator
+        cases = [
+            ('yearly report', lambda user: rg.generate_yearly_report(user, 2021)),
+            ('category analysis, all time',
+             lambda user: rg.generate_category_analysis(user)),
+            ('category analysis, raw scan',
+             lambda user: rg.generate_category_analysis(user, '2021-01-01',
+                                                        '2021-12-15')),
+            ('period totals, raw scan',
+             lambda user: rg.get_period_totals(user, '2021-01-01', '2021-12-15')),
+        ]
+        for label, report in cases:
+            single = measure(f"{label}, USD only", lambda: report(1), args.repeat)
+            mixed = measure(f"{label}, mixed", lambda: report(2), args.repeat)
+            print(f"{'':<40} mixed/single {mixed / single:.2f}x")
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
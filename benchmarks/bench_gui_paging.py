@@ -0,0 +1,72 @@
+"""Scrolling the GUI transaction history: page fetch latency and memory held.
+
+Drives finance_gui.PageWindow through a user's whole history the way
+TransactionGrid does, without a display, and reports the slowest page fetch
+and the peak memory allocated while scrolling.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from benchmarks.bench_bulk_import import generate_rows
+from database import close_all_pools
+from finance_gui import PageWindow
+from finance_manager import FinanceManager
+
+def scroll(tm, window, step, at_end):
+    """Fetch pages from step() until it returns None, holding only the window's rows.
+
+    Returns (pages fetched, slowest fetch in seconds).
+    """
+    pages = 0
+    slowest = 0
+    held = deque()
+    while (request := step()) is not None:
+        index, cursor = request
+        start = time.perf_counter()
+        rows, next_cursor = tm.get_transactions_page(1, window.page_size, cursor)
+        slowest = max(slowest, time.perf_counter() - start)
+        drop = window.add(index, rows, next_cursor)
+        if at_end:
+            held.extend(rows)
+            for _ in range(drop):
+                held.popleft()
+        else:
+            held.extendleft(reversed(rows))
+            for _ in range(drop):
+                held.pop()
+        pages += 1
+    return pages, slowest
+
+def measure(label, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    pages, slowest = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<20} {pages:>6,} pages  {elapsed / pages * 1000:>7.2f} ms/page avg  "
+          f"{slowest * 1000:>7.2f} ms worst  {peak / 1e6:>6.1f} MB peak")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--page-size', type=int, default=200)
+    parser.add_argument('--max-pages', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        tm = manager.transaction_manager
+        tm.add_transactions_bulk(1, generate_rows(args.rows), batch_size=50000)
+
+        window = PageWindow(args.page_size, args.max_pages)
+        measure('scroll to bottom', lambda: scroll(tm, window, window.next_page, True))
+        measure('scroll back to top',
+                lambda: scroll(tm, window, window.previous_page, False))
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Throughput and peak RSS of the streaming statement ingestion pipeline.
+
+Each size is ingested in a fresh subprocess so peak RSS is measured
+independently; it should stay flat as the statement grows.
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+PAYEES = ['TESCO STORES', 'SHELL FUEL', 'NETFLIX', 'ACME PAYROLL', 'RENT LTD',
+          'CORNER CAFE', 'AMAZON MKTPLACE', 'CITY WATER']
+
+def write_statement(path, rows, seed=7):
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    with open(path, 'w', newline='') as file:
+        file.write('Date,Description,Amount\n')
+        for i in range(rows):
+            day = (start + timedelta(days=i // 100)).strftime('%d/%m/%Y')
+            amount = rng.uniform(-300, 300) or 1
+            file.write(f'{day},{rng.choice(PAYEES)},{amount:.2f}\n')
+
+def run_worker(statement, db_path, batch_size):
+    from finance_manager import FinanceManager
+    from ingest import ingest_file
+    manager = FinanceManager(db_path)
+    start = time.perf_counter()
+    result = ingest_file(statement, manager.transaction_manager, 1,
+                         category_map={'tesco': 'Groceries', 'payroll': 'Salary'},
+                         batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{result['accepted']:>12,} rows {result['accepted'] / elapsed:>12,.0f} rows/sec "
+          f"peak RSS {peak_kib / 1024:>8.1f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--worker', nargs=2, metavar=('STATEMENT', 'DB'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], args.worker[1], args.batch_size)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            statement = os.path.join(tmp, f'statement_{size}.csv')
+            write_statement(statement, size)
+            db_path = os.path.join(tmp, f'ingest_{size}.db')
+            subprocess.run([sys.executable, '-m', 'benchmarks.bench_ingest',
+                            '--batch-size', str(args.batch_size),
+                            '--worker', statement, db_path], check=True)
+            os.remove(statement)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""SUM over REAL dollar amounts versus INTEGER cents: speed and exactness"""
+import argparse
+import random
+import sqlite3
+import time
+from decimal import Decimal
+
+def measure(label, conn, query, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = conn.execute(query).fetchone()[0]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed / repeat * 1000:>9.1f} ms/sum   -> {result}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (amount REAL NOT NULL, amount_cents INTEGER NOT NULL)')
+    exact = 0
+    batch = []
+    for _ in range(args.rows):
+        cents = rng.randint(1, 50000)
+        exact += cents
+        batch.append((cents / 100, cents))
+        if len(batch) == 100000:
+            conn.executemany('INSERT INTO t VALUES (?, ?)', batch)
+            batch.clear()
+    conn.executemany('INSERT INTO t VALUES (?, ?)', batch)
+    conn.commit()
+
+    print(f"{args.rows:,} rows, exact total {Decimal(exact).scaleb(-2)}")
+    real = measure('SUM(amount) REAL', conn, 'SELECT SUM(amount) FROM t', args.repeat)
+    cents = measure('SUM(amount_cents)', conn, 'SELECT SUM(amount_cents) FROM t',
+                    args.repeat)
+    print(f"REAL error: {Decimal(real) - Decimal(exact).scaleb(-2):.10f}; "
+          f"integer error: {cents - exact}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""The recurring transactions scheduler over a large number of rules.
+
+Monthly rules start on random days of one month, so a daily run finds about
+a twenty-eighth of them due. The runs measured are a daily run, a rerun with
+nothing left due, and a catch-up after downtime. Finding the due rules
+through the next_due index is compared with a scan of every rule, and the
+batched writes with one add_transaction per occurrence, timed on a sample.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+CATEGORIES = ['Rent', 'Salary', 'Subscriptions', 'Utilities', 'Insurance', 'Gym']
+
+def generate_rules(count, users, start, seed=4):
+    rng = random.Random(seed)
+    for _ in range(count):
+        first = (start + timedelta(days=rng.randrange(28))).isoformat() + ' 00:00:00'
+        yield (rng.randint(1, users), rng.choice(('income', 'expense')),
+               rng.choice(CATEGORIES), rng.randrange(100, 200000), 'USD',
+               'Standing order', 'month', 1, first, first)
+
+def timed_run(label, manager, as_of, batch_size):
+    start = time.perf_counter()
+    result = manager.recurring_manager.run_scheduler(as_of, batch_size)
+    elapsed = time.perf_counter() - start
+    rate = f"{result['transactions'] / elapsed:>10,.0f} rows/sec" if result['transactions'] else ''
+    print(f"{label:<30} {elapsed * 1000:>10.1f} ms  {result['rules']:>9,} rules "
+          f"{result['transactions']:>9,} transactions  {rate}")
+
+def scan_time(manager, as_of, indexed):
+    """Time finding the due rules, with or without the next_due index"""
+    conn = manager.pool.acquire()
+    try:
+        start = time.perf_counter()
+        count = len(conn.execute(f"""
+            SELECT id FROM recurring_transactions {'' if indexed else 'NOT INDEXED'}
+            WHERE next_due <= ?
+        """, (as_of,)).fetchall())
+        return time.perf_counter() - start, count
+    finally:
+        manager.pool.release(conn)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rules', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--downtime-days', type=int, default=60)
+    parser.add_argument('--batch-size', type=int, default=20000)
+    parser.add_argument('--sample', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        start_day = date(2024, 1, 1)
+        # Loaded with SQL, as add_recurring commits once per rule
+        conn = manager.pool.acquire()
+        try:
+            conn.executemany('INSERT INTO users (username, password) VALUES (?, ?)',
+                             ((f"user{i}", 'x') for i in range(args.users)))
+            conn.executemany("""
+                INSERT INTO recurring_transactions
+                    (user_id, type, category, amount_cents, currency, description,
+                     interval_unit, interval_count, start_date, next_due)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, generate_rules(args.rules, args.users, start_day))
+            conn.commit()
+        finally:
+            manager.pool.release(conn)
+        print(f"loaded {args.rules:,} monthly rules for {args.users:,} users")
+
+        # Bring every rule up to date, so the daily run sees one day's rules
+        manager.recurring_manager.run_scheduler('2024-02-09', args.batch_size)
+        day = '2024-02-10 00:00:00'
+        for indexed in (True, False):
+            elapsed, count = scan_time(manager, day, indexed)
+            label = 'find due rules, next_due index:' if indexed else 'find due rules, full scan:'
+            print(f"{label:<34} {elapsed * 1000:>10.1f} ms  {count:>9,} rules")
+        timed_run('daily run', manager, day, args.batch_size)
+        timed_run('rerun, nothing due', manager, day, args.batch_size)
+        catch_up = str(datetime.fromisoformat(day) + timedelta(days=args.downtime_days))
+        timed_run(f"catch-up after {args.downtime_days} days", manager, catch_up,
+                  args.batch_size)
+
+        conn = manager.pool.acquire()
+        try:
+            sample = conn.execute("""
+                SELECT user_id, type, category, amount_cents, description, next_due
+                FROM recurring_transactions ORDER BY next_due LIMIT ?
+            """, (args.sample,)).fetchall()
+        finally:
+            manager.pool.release(conn)
+        tm = manager.transaction_manager
+        start = time.perf_counter()
+        for user_id, type, category, cents, description, due in sample:
+            tm.add_transaction(user_id, type, category, cents / 100, description, due)
+        elapsed = time.perf_counter() - start
+        print(f"{'add_transaction per occurrence':<30} {elapsed / len(sample) * 1e6:>10.0f} us/row "
+              f"{len(sample) / elapsed:>36,.0f} rows/sec")
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Reports read from monthly_category_totals versus raw scans of transactions"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.bench_bulk_import import generate_rows
+from cache import configure_cache
+from database import close_all_pools
+from finance_manager import FinanceManager
+from periods import year_range
+
+RAW_PERIOD_TOTALS = """
+    SELECT substr(date, 1, 7) AS month, type, category,
+           COUNT(*), SUM(amount_cents), MIN(amount_cents), MAX(amount_cents)
+    FROM transactions
+    WHERE user_id = ? AND type IN ('income', 'expense')
+    AND date >= ? AND date < ?
+    GROUP BY month, type, category
+"""
+
+RAW_CATEGORY_ANALYSIS = """
+    SELECT category, COUNT(*), SUM(amount_cents) AS total_amount, AVG(amount_cents),
+           MIN(amount_cents), MAX(amount_cents)
+    FROM transactions
+    WHERE user_id = ? AND type = 'expense'
+    GROUP BY category ORDER BY total_amount DESC
+"""
+
+def measure(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed / repeat * 1000:>10.2f} ms/call")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    per_day = max(1, args.rows // (args.years * 365))
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        # Measure the queries themselves, not the result cache
+        configure_cache(manager.db_path, max_entries=0)
+        rg = manager.report_generator
+        start = time.perf_counter()
+        manager.transaction_manager.add_transactions_bulk(
+            1, generate_rows(args.rows, per_day=per_day), batch_size=50000)
+        print(f"loaded {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+        year = 2021
+        start, end = year_range(year)
+        with rg.pool.connection() as conn:
+            measure('yearly totals, raw scan',
+                    lambda: conn.execute(RAW_PERIOD_TOTALS, (1, start, end)).fetchall(),
+                    args.repeat)
+            measure('yearly totals, rollup',
+                    lambda: rg.get_period_totals(1, start, end), args.repeat)
+            measure('category analysis, raw scan',
+                    lambda: conn.execute(RAW_CATEGORY_ANALYSIS, (1,)).fetchall(),
+                    args.repeat)
+            measure('category analysis, rollup',
+                    lambda: rg.generate_category_analysis(1), args.repeat)
+        measure('monthly report (rollup)',
+                lambda: rg.generate_monthly_report(1, 6, year), args.repeat)
+        measure('yearly report (rollup)',
+                lambda: rg.generate_yearly_report(1, year), args.repeat)
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Full-text search_transactions versus a LIKE scan, on a large multi-user table.
+
+Descriptions are drawn from a vocabulary of merchants and words, so queries
+range from rare (a single merchant) to common (a word in many rows).
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+MERCHANTS = [f"{prefix}{suffix}" for prefix in
+             ('Acme', 'Blue', 'Corner', 'Delta', 'Eagle', 'Fresh', 'Green', 'Harbor',
+              'Island', 'Jade', 'Kings', 'Lakeside', 'Metro', 'North', 'Oak', 'Pine')
+             for suffix in ('mart', 'foods', 'books', 'air', 'fuel', 'pharmacy', 'cafe',
+                            'hardware', 'cinema', 'gym')]
+WORDS = ['grocery', 'store', 'online', 'payment', 'refund', 'subscription', 'monthly',
+         'ticket', 'dinner', 'lunch', 'coffee', 'rent', 'deposit', 'transfer', 'fee',
+         'card', 'invoice', 'order', 'delivery', 'taxi']
+CATEGORIES = ['Food', 'Rent', 'Travel', 'Utilities', 'Fun', 'Health']
+
+def generate_rows(count, seed=11):
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    for i in range(count):
+        description = ' '.join([rng.choice(MERCHANTS)] + rng.sample(WORDS, 2) +
+                               [f"#{rng.randrange(100000)}"])
+        date = start + timedelta(seconds=i * 30)
+        yield ('expense', rng.choice(CATEGORIES), round(rng.uniform(1, 500), 2),
+               description, date.strftime('%Y-%m-%d %H:%M:%S'))
+
+def measure(label, func, repeat):
+    result = func()  # warm up the page cache
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<44} {elapsed * 1000:>9.2f} ms/search  {len(result):>5} rows")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=5000000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        tm = manager.transaction_manager
+        start = time.perf_counter()
+        per_user = args.rows // args.users
+        for user_id in range(1, args.users + 1):
+            tm.add_transactions_bulk(user_id, generate_rows(per_user, seed=user_id),
+                                     batch_size=50000)
+        print(f"loaded {per_user * args.users:,} rows for {args.users} users "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        conn = manager.pool.acquire()
+        try:
+            conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('optimize')")
+            conn.commit()
+        finally:
+            manager.pool.release(conn)
+
+        def like(text):
+            conn = manager.pool.acquire()
+            try:
+                return conn.execute("""
+                    SELECT id FROM transactions
+                    WHERE user_id = 1 AND description LIKE ? LIMIT ?
+                """, (f"%{text}%", args.limit)).fetchall()
+            finally:
+                manager.pool.release(conn)
+
+        queries = [('rare merchant', 'jadecinema'), ('merchant prefix', 'jadeci'),
+                   ('common word', 'grocery'), ('common prefix', 'groc'),
+                   ('two words', 'coffee delivery'), ('word and category', 'refund health'),
+                   ('no match', 'zzzz')]
+        for label, query in queries:
+            measure(f"FTS5 {label} '{query}'",
+                    lambda: tm.search_transactions(1, query, args.limit)[0], args.repeat)
+        # Past the first matches LIKE must scan the user's whole history
+        measure("LIKE scan 'jadecinema'", lambda: like('jadecinema'), args.repeat)
+        measure("LIKE scan 'zzzz'", lambda: like('zzzz'), args.repeat)
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
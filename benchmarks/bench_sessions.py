@@ -0,0 +1,40 @@
+"""Per-command authentication: bcrypt password check versus session token"""
+import argparse
+import os
+import tempfile
+import time
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+def measure(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / repeat * 1e6:>12,.1f} us/call")
+    return elapsed / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--commands', type=int, default=1000,
+                        help='Script length used to project total auth cost.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'bench.db'))
+        manager.register_user('bench', 'password')
+        token = manager.login('bench', 'password')
+        sm = manager.session_manager
+
+        bcrypt_cost = measure('bcrypt authenticate_user',
+                              lambda: manager.authenticate_user('bench', 'password'),
+                              args.repeat)
+        token_cost = measure('session validate_token',
+                             lambda: sm.validate_token(token), args.repeat * 1000)
+        print(f"{args.commands:,} commands: {bcrypt_cost * args.commands:.1f}s of bcrypt "
+              f"versus {token_cost * args.commands * 1000:.1f}ms of token checks")
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
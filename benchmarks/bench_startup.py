@@ -0,0 +1,64 @@
+"""CLI cold start: import time of finance_manager and wall-clock per command"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def import_time(root):
+    """Cumulative microseconds to import finance_manager, per -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import finance_manager'],
+                            cwd=root, capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == 'finance_manager':
+            return int(parts[1])
+    raise RuntimeError('finance_manager not found in -X importtime output')
+
+def wall_clock(script, args, env, repeat):
+    """Median seconds to run one CLI command in a fresh process"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, *args], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--root', default=str(ROOT),
+                        help='Checkout to measure, e.g. a worktree of an older commit.')
+    args = parser.parse_args()
+    script = os.path.join(args.root, 'finance_manager.py')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, FINANCE_DB=os.path.join(tmp, 'bench.db'),
+                   FINANCE_SESSION_FILE=os.path.join(tmp, 'session'))
+        subprocess.run([sys.executable, script, 'register', '--username', 'bench',
+                        '--password', 'password'], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        subprocess.run([sys.executable, script, 'login', '--username', 'bench',
+                        '--password', 'password'], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+        imports = statistics.median(import_time(args.root) for _ in range(args.repeat))
+        print(f"{'import finance_manager':<24} {imports / 1000:>8.1f} ms")
+        commands = (
+            ('--help', ['--help']),
+            ('add-transaction', ['add-transaction', '--type', 'expense', '--category',
+                                 'Food', '--amount', '12.50', '--description', 'Lunch']),
+            ('check-budget', ['check-budget']),
+        )
+        for label, command in commands:
+            seconds = wall_clock(script, command, env, args.repeat)
+            print(f"{label:<24} {seconds * 1000:>8.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Concurrent inserts: add_transaction per thread versus the write-behind queue"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from database import close_all_pools
+from finance_manager import FinanceManager
+
+def run(threads, per_thread, write):
+    """Start `threads` producers calling write(worker, i); return once they finish
+
+    Returns the perf_counter() value at which the producers were released.
+    """
+    barrier = threading.Barrier(threads + 1)
+
+    def producer(worker):
+        barrier.wait()
+        for i in range(per_thread):
+            write(worker, i)
+
+    workers = [threading.Thread(target=producer, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--rows', type=int, default=500, help='Rows per thread.')
+    args = parser.parse_args()
+    total = args.threads * args.rows
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = FinanceManager(os.path.join(tmp, 'direct.db'))
+        tm = manager.transaction_manager
+        failures = []
+        def direct(worker, i):
+            if not tm.add_transaction(worker + 1, 'expense', 'Food', 1.0, f'row {i}'):
+                failures.append(i)
+        start = run(args.threads, args.rows, direct)
+        elapsed = time.perf_counter() - start
+        print(f"{'add_transaction':<16} {total / elapsed:>10,.0f} rows/s  "
+              f"({len(failures)} failed)")
+
+        manager = FinanceManager(os.path.join(tmp, 'queued.db'))
+        tm = manager.transaction_manager
+        futures = [None] * total
+        def queued(worker, i):
+            futures[worker * args.rows + i] = tm.queue_transaction(
+                worker + 1, 'expense', 'Food', 1.0, f'row {i}')
+        start = run(args.threads, args.rows, queued)
+        tm.flush_writes()
+        elapsed = time.perf_counter() - start
+        failed = sum(not future.result() for future in futures)
+        print(f"{'write-behind':<16} {total / elapsed:>10,.0f} rows/s  ({failed} failed)")
+        tm.close()
+        close_all_pools()
+
+if __name__ == '__main__':
+    main()
@@ -1,52 +1,71 @@
 import sqlite3
 from datetime import datetime
-from tabulate import tabulate
+from typing import NamedTuple
+from cache import get_cache, month_number
+from database import get_pool
+from fx import FxManager, MissingRateError, base_currency, month_end
+from money import Money
+from presentation import render_budgets, render_budget_status
+
+class BudgetStatus(NamedTuple):
+    """Spending against one category budget for one month"""
+    year: int
+    month: int
+    category: str
+    budget: Money
+    spent: Money
+    percentage: float
+    exceeded: bool
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from (year, month, category, budget cents, spent cents, currency)"""
+        year, month, category, budget, spent, currency = row
+        percentage = (spent / budget) * 100 if budget > 0 else 0
+        return cls(year, month, category, Money(budget, currency), Money(spent, currency),
+                   percentage, spent > budget)
 
 class BudgetManager:
     def __init__(self, db_path='finance.db'):
         self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self.cache = get_cache(db_path)
+        self.fx = FxManager(db_path)
 
     def set_budget(self, user_id, category, amount, month, year):
-        """Set or update a budget for a specific category"""
-        conn = sqlite3.connect(self.db_path)
+        """Set or update a budget for a category, in the user's base currency by default"""
+        conn = self.pool.acquire()
         cursor = conn.cursor()
 
         try:
-            # Check if budget already exists
+            amount = Money.parse(amount, base_currency(conn, user_id))
+            # Insert, or update the existing row for this category and month
             cursor.execute("""
-                SELECT id FROM budgets 
-                WHERE user_id = ? AND category = ? AND month = ? AND year = ?
-            """, (user_id, category, month, year))
-            existing = cursor.fetchone()
-
-            if existing:
-                # Update existing budget
-                cursor.execute("""
-                    UPDATE budgets 
-                    SET amount = ? 
-                    WHERE user_id = ? AND category = ? AND month = ? AND year = ?
-                """, (amount, user_id, category, month, year))
-            else:
-                # Create new budget
-                cursor.execute("""
-                    INSERT INTO budgets (user_id, category, amount, month, year)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (user_id, category, amount, month, year))
+                INSERT INTO budgets (user_id, category, amount_cents, currency, month, year)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, category, month, year)
+                DO UPDATE SET amount_cents = excluded.amount_cents,
+                              currency = excluded.currency
+            """, (user_id, category, amount.cents, amount.currency, month, year))
 
             conn.commit()
+            self.cache.invalidate(user_id, (month_number(year, month),))
             return True
-        except sqlite3.Error as e:
+        except (sqlite3.Error, ValueError) as e:
             print(f"Error setting budget: {e}")
             return False
         finally:
-            conn.close()
+            self.pool.release(conn)
 
     def get_budgets(self, user_id, month=None, year=None):
         """Get all budgets for a user with optional month/year filter"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.acquire()
         cursor = conn.cursor()
 
-        query = "SELECT category, amount, month, year FROM budgets WHERE user_id = ?"
+        query = """
+            SELECT category, amount_cents, currency, month, year FROM budgets
+            WHERE user_id = ?
+        """
         params = [user_id]
 
         if month:
@@ -58,69 +77,112 @@ class BudgetManager:
 
         try:
             cursor.execute(query, params)
-            budgets = cursor.fetchall()
-            headers = ['Category', 'Budget Amount', 'Month', 'Year']
-            return tabulate(budgets, headers=headers, tablefmt='grid')
+            budgets = [(category, Money(cents, currency), month, year)
+                       for category, cents, currency, month, year in cursor.fetchall()]
+            return render_budgets(budgets)
         except sqlite3.Error as e:
             print(f"Error retrieving budgets: {e}")
             return None
         finally:
-            conn.close()
+            self.pool.release(conn)
 
-    def check_budget_status(self, user_id, month=None, year=None):
-        """Check budget status and return warnings for categories exceeding budget"""
+    def get_budget_status(self, user_id, month=None, year=None):
+        """Return BudgetStatus records for one month from the category rollup"""
         if not month or not year:
             current_date = datetime.now()
             month = month or current_date.month
             year = year or current_date.year
+        current = month_number(year, month)
+        return self.cache.get_or_compute(
+            user_id, 'budget_status', (current, current), (),
+            lambda: self._read_budget_status(user_id, month, year))
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
+    def _read_budget_status(self, user_id, month, year):
+        conn = self.pool.acquire()
         try:
-            # Get all budgets for the specified month/year
-            cursor.execute("""
-                SELECT category, amount 
-                FROM budgets 
-                WHERE user_id = ? AND month = ? AND year = ?
-            """, (user_id, month, year))
-            budgets = cursor.fetchall()
-
-            status = []
-            for category, budget_amount in budgets:
-                # Get total expenses for this category
-                cursor.execute("""
-                    SELECT COALESCE(SUM(amount), 0) 
-                    FROM transactions 
-                    WHERE user_id = ? 
-                    AND category = ? 
-                    AND type = 'expense' 
-                    AND strftime('%m', date) = ? 
-                    AND strftime('%Y', date) = ?
-                """, (user_id, category, str(month).zfill(2), str(year)))
-                spent = cursor.fetchone()[0]
-
-                percentage = (spent / budget_amount) * 100 if budget_amount > 0 else 0
-                status.append({
-                    'category': category,
-                    'budget': budget_amount,
-                    'spent': spent,
-                    'percentage': percentage,
-                    'exceeded': spent > budget_amount
-                })
-
-            # Format status report
-            report_data = [
-                [s['category'], s['budget'], s['spent'], 
-                 f"{s['percentage']:.1f}%", 
-                 'EXCEEDED!' if s['exceeded'] else 'Within budget']
-                for s in status
-            ]
-            headers = ['Category', 'Budget', 'Spent', 'Used %', 'Status']
-            return tabulate(report_data, headers=headers, tablefmt='grid')
-
-        except sqlite3.Error as e:
+            rows = conn.execute("""
+                SELECT b.year, b.month, b.category, b.amount_cents, b.currency,
+                       m.total, m.currency
+                FROM budgets b
+                LEFT JOIN monthly_category_totals m
+                ON m.user_id = b.user_id AND m.year = b.year AND m.month = b.month
+                AND m.type = 'expense' AND m.category = b.category
+                WHERE b.user_id = ? AND b.month = ? AND b.year = ?
+                ORDER BY b.category
+            """, (user_id, month, year)).fetchall()
+            return self._fold_currencies(conn, user_id, rows)
+        except (sqlite3.Error, MissingRateError) as e:
             print(f"Error checking budget status: {e}")
             return None
         finally:
-            conn.close()
\ No newline at end of file
+            self.pool.release(conn)
+
+    def get_budget_history(self, user_id, months=12, month=None, year=None):
+        """Return BudgetStatus records for the `months` months ending at month/year.
+
+        All months come from a single query rather than one call per month.
+        """
+        if not month or not year:
+            current_date = datetime.now()
+            month = month or current_date.month
+            year = year or current_date.year
+        last = month_number(year, month)
+        first = last - months + 1
+        return self.cache.get_or_compute(
+            user_id, 'budget_history', (first, last), (),
+            lambda: self._read_budget_history(user_id, first, last))
+
+    def _read_budget_history(self, user_id, first, last):
+        conn = self.pool.acquire()
+        try:
+            rows = conn.execute("""
+                SELECT b.year, b.month, b.category, b.amount_cents, b.currency,
+                       m.total, m.currency
+                FROM budgets b
+                LEFT JOIN monthly_category_totals m
+                ON m.user_id = b.user_id AND m.year = b.year AND m.month = b.month
+                AND m.type = 'expense' AND m.category = b.category
+                WHERE b.user_id = ? AND b.year * 12 + b.month - 1 BETWEEN ? AND ?
+                ORDER BY b.year, b.month, b.category
+            """, (user_id, first, last)).fetchall()
+            return self._fold_currencies(conn, user_id, rows)
+        except (sqlite3.Error, MissingRateError) as e:
+            print(f"Error checking budget history: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
+
+    def _fold_currencies(self, conn, user_id, rows):
+        """Build BudgetStatus records in the user's base currency.
+
+        rows are (year, month, category, budget cents, budget currency, spent
+        cents, spent currency), one per currency spent in, ordered so that a
+        budget's rows are adjacent. Amounts are converted at the month-end rate.
+        """
+        base = base_currency(conn, user_id)
+        factor = self.fx.rate_to(base)
+        statuses = []
+        key = None
+        for year, month, category, budget, budget_currency, spent, currency in rows:
+            date = month_end(f"{year:04d}-{month:02d}")
+            if (year, month, category) != key:
+                key = (year, month, category)
+                statuses.append([year, month, category,
+                                 round(budget * factor(budget_currency, date)), 0, base])
+            if spent is not None:
+                statuses[-1][4] += round(spent * factor(currency, date))
+        return [BudgetStatus.from_row(status) for status in statuses]
+
+    def check_budget_status(self, user_id, month=None, year=None):
+        """Check budget status and return warnings for categories exceeding budget"""
+        if not month or not year:
+            current_date = datetime.now()
+            month = month or current_date.month
+            year = year or current_date.year
+        current = month_number(year, month)
+
+        def render():
+            status = self.get_budget_status(user_id, month, year)
+            return None if status is None else render_budget_status(status)
+        return self.cache.get_or_compute(user_id, 'budget_check', (current, current), (),
+                                         render)
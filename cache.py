@@ -0,0 +1,175 @@
+"""In-process cache of report and budget results, invalidated on write.
+
+Entries are keyed by (user, kind, months, params), where months is the
+inclusive (first, last) span of month numbers the result depends on, with
+None for an open end. TransactionManager and BudgetManager invalidate
+exactly the user and months each committed write touched, so cached reports
+for other users and other periods survive. Entries also expire after a TTL,
+which bounds staleness from writes made by other processes.
+"""
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import NamedTuple
+from database import get_pool
+
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_TTL = 60.0  # seconds
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int      # dropped for size or age
+    invalidations: int  # dropped because a write changed their data
+    size: int
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+def month_number(year, month):
+    """Months since year 0, so consecutive months are consecutive integers"""
+    return year * 12 + month - 1
+
+def month_span(start=None, end=None, end_exclusive=True):
+    """Return the (first, last) month numbers a 'YYYY-MM-DD' date range touches"""
+    first = last = None
+    if start:
+        first = month_number(int(start[0:4]), int(start[5:7]))
+    if end:
+        last = month_number(int(end[0:4]), int(end[5:7]))
+        # An exclusive bound on the 1st at midnight stops before that month
+        if end_exclusive and end[7:] in ('-01', '-01 00:00:00'):
+            last -= 1
+    return first, last
+
+def _copy(value):
+    """Shallow-copy containers so callers cannot modify a cached result"""
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+class ResultCache:
+    """Thread-safe LRU cache with a TTL and per-user, per-month invalidation"""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._by_user = {}             # user_id -> set of keys
+        self._generations = {}         # user_id -> count of invalidations
+        self._epoch = 0                # count of clear() calls
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get_or_compute(self, user_id, kind, months, params, compute):
+        """Return the cached result for the key, or compute and cache it.
+
+        None results (errors) are not cached. A result computed while a
+        write for the same user committed is returned but not cached, since
+        it may predate that write.
+        """
+        key = (user_id, kind, months, params)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return _copy(entry[0])
+                self._discard(key)
+                self.evictions += 1
+            self.misses += 1
+            generation = (self._epoch, self._generations.get(user_id, 0))
+
+        value = compute()
+        if value is None or self.max_entries <= 0:
+            return value
+        with self._lock:
+            if (self._epoch, self._generations.get(user_id, 0)) == generation:
+                self._entries[key] = (value, time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                self._by_user.setdefault(user_id, set()).add(key)
+                while len(self._entries) > self.max_entries:
+                    self._discard(next(iter(self._entries)))
+                    self.evictions += 1
+        return _copy(value)
+
+    def _discard(self, key):
+        del self._entries[key]
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def invalidate(self, user_id, months=None):
+        """Drop a user's entries that depend on any of the given month numbers.
+
+        With months=None every entry for the user is dropped.
+        """
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for key in list(self._by_user.get(user_id, ())):
+                if months is None or self._overlaps(key[2], months):
+                    self._discard(key)
+                    self.invalidations += 1
+
+    def invalidate_months(self, touched):
+        """Invalidate a {user_id: month numbers} mapping, e.g. RollupDelta.touched()"""
+        for user_id, months in touched.items():
+            self.invalidate(user_id, months)
+
+    @staticmethod
+    def _overlaps(span, months):
+        if span is None:
+            return True
+        first, last = span
+        return any((first is None or month >= first) and (last is None or month <= last)
+                   for month in months)
+
+    def clear(self):
+        """Drop every entry, e.g. after the rollups are rebuilt"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._epoch += 1
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(self.hits, self.misses, self.evictions, self.invalidations,
+                              len(self._entries))
+
+# One cache per connection pool, so a closed or replaced pool (a deleted
+# database, a forked worker) never serves results cached through the old one
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+def get_cache(db_path='finance.db'):
+    """Return the result cache shared by every manager of a database"""
+    pool = get_pool(db_path)
+    with _caches_lock:
+        cache = _caches.get(pool)
+        if cache is None:
+            cache = _caches[pool] = ResultCache()
+        return cache
+
+def configure_cache(db_path='finance.db', max_entries=DEFAULT_CACHE_SIZE,
+                    ttl=DEFAULT_CACHE_TTL):
+    """Resize the shared cache for a database, emptying it and resetting its stats.
+
+    max_entries=0 disables caching.
+    """
+    cache = get_cache(db_path)
+    cache.clear()
+    with cache._lock:
+        cache.max_entries = max_entries
+        cache.ttl = ttl
+        cache.hits = cache.misses = cache.evictions = cache.invalidations = 0
+    return cache
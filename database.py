@@ -0,0 +1,300 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_TIMEOUT = 30.0
+
+# Applied to every connection when it is opened. Negative cache_size is in KiB.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'mmap_size': 268435456,
+}
+
+class ConnectionPool:
+    """Thread-aware pool of long-lived SQLite connections for one database file"""
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 pragmas=None, read_only=False):
+        self.db_path = db_path
+        self.closed = False
+        self.pid = os.getpid()
+        # Guards the idle stack, the open count and the generations, and wakes
+        # borrowers waiting for a connection whenever one is returned or closed
+        self._cond = threading.Condition()
+        self._idle = []
+        self._created = 0
+        self._local = threading.local()
+        # The settings each open connection was made with, by generation
+        self._generation = 0
+        self._generations = {}
+        self._apply(size, timeout, pragmas, read_only)
+
+    def _apply(self, size, timeout, pragmas, read_only):
+        self.read_only = read_only
+        # Every connection to ':memory:' is a separate database, so share one
+        self.size = 1 if self.db_path == ':memory:' else max(1, size)
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+
+    def configure(self, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, pragmas=None,
+                  read_only=False):
+        """Change the settings in place, so everyone holding the pool uses them.
+
+        Connections opened with the old settings are closed, idle ones now and
+        borrowed ones when they are returned.
+        """
+        with self._cond:
+            self._apply(size, timeout, pragmas, read_only)
+            self._generation += 1
+            stale = self._drain_idle()
+        self._close_all(stale)
+
+    def _connect(self):
+        """Open a new connection and apply the configured PRAGMAs"""
+        if self.read_only:
+            uri = Path(os.path.abspath(self.db_path)).as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, timeout=self.timeout,
+                                   check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout,
+                                   check_same_thread=False)
+        for name, value in self.pragmas.items():
+            # The journal mode is a property of the file; only writers set it
+            if self.read_only and name == 'journal_mode':
+                continue
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _drain_idle(self):
+        """Forget every idle connection and return them for closing; hold _cond"""
+        stale, self._idle = self._idle, []
+        for conn in stale:
+            self._generations.pop(conn, None)
+        self._created -= len(stale)
+        self._cond.notify_all()
+        return stale
+
+    @staticmethod
+    def _close_all(connections):
+        # Outside _cond: closing the last connection checkpoints the WAL
+        for conn in connections:
+            conn.close()
+
+    def _take(self):
+        """Take an idle connection, opening a new one while under the size limit"""
+        deadline = None
+        stale = []
+        try:
+            with self._cond:
+                while True:
+                    while self._idle:
+                        conn = self._idle.pop()
+                        if self._generations.get(conn) == self._generation:
+                            return conn
+                        # Returned after configure() changed the settings
+                        self._generations.pop(conn, None)
+                        self._created -= 1
+                        stale.append(conn)
+                    if self._created < self.size:
+                        self._created += 1
+                        generation = self._generation
+                        break
+                    if deadline is None:
+                        deadline = time.monotonic() + self.timeout
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise sqlite3.OperationalError(
+                            f"Connection pool exhausted for {self.db_path}")
+                    self._cond.wait(remaining)
+        finally:
+            self._close_all(stale)
+
+        try:
+            conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._generations[conn] = generation
+        return conn
+
+    def _put(self, conn):
+        """Return a connection to the pool, discarding uncommitted work"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            # Checked under the same lock configure() takes, so a connection
+            # made stale meanwhile is never handed out again
+            keep = not self.closed and self._generations.get(conn) == self._generation
+            if keep:
+                self._idle.append(conn)
+            else:
+                self._generations.pop(conn, None)
+                self._created -= 1
+            self._cond.notify()
+        if not keep:
+            conn.close()
+
+    def acquire(self):
+        """Borrow a connection; pair every call with release().
+
+        Nested borrows on the same thread share the outer connection, so helpers
+        can take part in their caller's transaction. If the caller has one open,
+        the helper's work runs in a savepoint (see SavepointConnection), so its
+        commit() and rollback() cannot end the caller's transaction.
+        """
+        local = self._local
+        if getattr(local, 'conn', None) is not None:
+            local.depth += 1
+            conn = local.conn
+            if conn.in_transaction:
+                nested = SavepointConnection(conn, f"nested_{local.depth}")
+                local.savepoints.append(nested)
+                return nested
+            local.savepoints.append(None)
+            return conn
+
+        conn = self._take()
+        local.conn = conn
+        local.depth = 1
+        local.savepoints = []
+        return conn
+
+    def release(self, conn):
+        """Give back a connection obtained from acquire()"""
+        local = self._local
+        local.depth -= 1
+        if local.depth > 0:
+            nested = local.savepoints.pop()
+            if nested is not None:
+                nested.end()
+            return
+        local.conn = None
+        self._put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed when returned"""
+        with self._cond:
+            self.closed = True
+            stale = self._drain_idle()
+        self._close_all(stale)
+
+class SavepointConnection:
+    """A nested borrow of a connection whose transaction the caller owns.
+
+    The borrower's work runs in a savepoint: commit() releases it into the
+    caller's transaction, rollback() undoes only the borrower's work, and
+    BEGIN is skipped. Everything else is passed to the connection.
+    """
+
+    def __init__(self, conn, name):
+        self._conn = conn
+        self._name = name
+        conn.execute(f"SAVEPOINT {name}")
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def execute(self, sql, *args, **kwargs):
+        if sql.lstrip()[:5].upper() == 'BEGIN':
+            return self._conn.cursor()
+        return self._conn.execute(sql, *args, **kwargs)
+
+    def commit(self):
+        # Keep a savepoint open for whatever the borrower does next
+        self._conn.execute(f"RELEASE {self._name}")
+        self._conn.execute(f"SAVEPOINT {self._name}")
+
+    def rollback(self):
+        self._conn.execute(f"ROLLBACK TO {self._name}")
+
+    def end(self):
+        """Discard uncommitted work, as returning a connection to the pool does"""
+        if self._conn.in_transaction:
+            self._conn.execute(f"ROLLBACK TO {self._name}")
+            self._conn.execute(f"RELEASE {self._name}")
+
+_pools = {}
+_pools_lock = threading.Lock()
+# Pools inherited from a parent process. They are kept referenced so their
+# connections are never closed (and finalised) in the child.
+_inherited_pools = []
+
+def _pool_key(db_path):
+    return db_path if db_path == ':memory:' else os.path.abspath(db_path)
+
+def _forget_inherited_pools():
+    """Drop pools created by a parent process; call with _pools_lock held.
+
+    SQLite connections must not be used across fork(), so a child process
+    opens its own connections and never touches the inherited ones.
+    """
+    pid = os.getpid()
+    for key, pool in list(_pools.items()):
+        if pool.pid != pid:
+            _inherited_pools.append(_pools.pop(key))
+
+def get_pool(db_path='finance.db'):
+    """Return the shared connection pool for a database, creating it on first use"""
+    key = _pool_key(db_path)
+    with _pools_lock:
+        _forget_inherited_pools()
+        pool = _pools.get(key)
+        if pool is None or pool.closed:
+            pool = ConnectionPool(db_path)
+            _pools[key] = pool
+        return pool
+
+def configure_pool(db_path='finance.db', size=DEFAULT_POOL_SIZE,
+                   timeout=DEFAULT_TIMEOUT, pragmas=None, read_only=False):
+    """Apply the given settings to the shared pool for a database.
+
+    An existing pool is changed in place (see ConnectionPool.configure), so
+    managers already holding it use the new settings. With read_only=True
+    connections are opened with mode=ro, e.g. for report workers that must
+    never write.
+    """
+    key = _pool_key(db_path)
+    with _pools_lock:
+        _forget_inherited_pools()
+        pool = _pools.get(key)
+        if pool is None or pool.closed:
+            pool = _pools[key] = ConnectionPool(db_path, size=size, timeout=timeout,
+                                                pragmas=pragmas, read_only=read_only)
+            return pool
+    pool.configure(size, timeout, pragmas, read_only)
+    return pool
+
+def close_pool(db_path='finance.db'):
+    """Close and forget the shared pool for a database"""
+    with _pools_lock:
+        _forget_inherited_pools()
+        pool = _pools.pop(_pool_key(db_path), None)
+    if pool is not None:
+        pool.close()
+
+def close_all_pools():
+    """Close every shared pool, e.g. before deleting database files"""
+    with _pools_lock:
+        _forget_inherited_pools()
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,20 @@
+"""Defaults and choices shared by the CLI and the modules behind it.
+
+This module imports nothing, so the CLI can use these values for its
+options without loading the modules that use them.
+"""
+# transactions
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_PAGE_SIZE = 50
+# ingest
+STATEMENT_FORMATS = ('csv', 'ofx', 'qif')
+# sessions
+DEFAULT_SESSION_TTL = 8 * 60 * 60  # seconds
+# batch_reports
+DEFAULT_CHUNK_SIZE = 50
+# export
+DEFAULT_EXPORT_BATCH_SIZE = 65536
+EXPORT_FORMATS = ('parquet', 'arrow')
+# recurring
+INTERVAL_UNITS = ('day', 'week', 'month', 'year')
+DEFAULT_SCHEDULER_BATCH_SIZE = 20000
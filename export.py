@@ -0,0 +1,312 @@
+"""Columnar snapshots of transactions and budgets for offline analytics.
+
+Rows are streamed out of SQLite in fixed-size batches and written as
+Parquet (or Arrow IPC) files under Hive-style year/month partitions, so
+analysts can query the files with pyarrow, pandas, DuckDB or Spark instead
+of re-running strftime aggregates against a copy of the database:
+
+    out/transactions/year=2024/month=01/part-000001.parquet
+    out/budgets/year=2024/month=01/part-000001.parquet
+
+Rows are read in partition order, so only one file is open at a time and
+memory stays at one batch whatever the size of the export.
+
+The first export to a directory is full. Later ones are incremental: each
+snapshot records a watermark (the last transaction id and the last entry of
+the export_changes log), and the next writes only rows added, changed or
+deleted since, as new part files. Every row carries the snapshot it was
+written in; deleted rows are written as markers with deleted = true. To read
+the current state, keep each id's row from its latest snapshot and drop it
+if deleted. Nothing is logged until a first export starts, and log entries
+that every export directory has seen are pruned.
+
+pyarrow is an optional dependency; only this module needs it.
+"""
+import os
+import shutil
+import sqlite3
+from database import get_pool
+from defaults import DEFAULT_EXPORT_BATCH_SIZE, EXPORT_FORMATS as FORMATS
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # optional dependency
+    pa = None
+
+EXPORT_FORMATS = {format: f".{format}" for format in FORMATS}
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+# Every query yields the exported columns, then deleted (0/1), then the
+# 'YYYY-MM' partition, ordered by partition. {user} is empty or USER_FILTER.
+USER_FILTER = 'AND user_id = :user_id'
+
+FULL_TRANSACTIONS = """
+    SELECT id, user_id, type, category, amount_cents, currency, description, date,
+           0, substr(date, 1, 7)
+    FROM transactions
+    WHERE 1 {user}
+    ORDER BY date, id
+"""
+
+CHANGED_TRANSACTIONS = """
+    SELECT id, user_id, type, category, amount_cents, currency, description, date,
+           0, substr(date, 1, 7)
+    FROM transactions
+    WHERE id > :last_id {user}
+    UNION ALL
+    SELECT id, user_id, type, category, amount_cents, currency, description, date,
+           0, substr(date, 1, 7)
+    FROM transactions
+    WHERE id <= :last_id AND id IN (
+        SELECT row_id FROM export_changes
+        WHERE table_name = 'transactions' AND seq > :last_seq) {user}
+    UNION ALL
+    SELECT row_id, user_id, NULL, NULL, NULL, NULL, NULL, NULL, 1, period
+    FROM export_changes c
+    WHERE seq IN (
+        SELECT MAX(seq) FROM export_changes
+        WHERE table_name = 'transactions' AND seq > :last_seq
+        GROUP BY row_id)
+    AND NOT EXISTS (SELECT 1 FROM transactions t WHERE t.id = c.row_id) {user}
+    ORDER BY 10, 1
+"""
+
+FULL_BUDGETS = """
+    SELECT id, user_id, category, amount_cents, currency, year, month,
+           0, printf('%04d-%02d', year, month)
+    FROM budgets
+    WHERE 1 {user}
+    ORDER BY year, month, id
+"""
+
+CHANGED_BUDGETS = """
+    SELECT id, user_id, category, amount_cents, currency, year, month,
+           0, printf('%04d-%02d', year, month)
+    FROM budgets
+    WHERE id IN (
+        SELECT row_id FROM export_changes
+        WHERE table_name = 'budgets' AND seq > :last_seq) {user}
+    UNION ALL
+    SELECT row_id, user_id, NULL, NULL, NULL, NULL, NULL, 1, period
+    FROM export_changes c
+    WHERE seq IN (
+        SELECT MAX(seq) FROM export_changes
+        WHERE table_name = 'budgets' AND seq > :last_seq
+        GROUP BY row_id)
+    AND NOT EXISTS (SELECT 1 FROM budgets b WHERE b.id = c.row_id) {user}
+    ORDER BY 9, 1
+"""
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("export requires pyarrow; install it with 'pip install pyarrow'")
+
+def transaction_schema():
+    return pa.schema([
+        ('id', pa.int64()), ('user_id', pa.int64()), ('type', pa.string()),
+        ('category', pa.string()), ('amount_cents', pa.int64()),
+        ('currency', pa.string()), ('description', pa.string()),
+        ('date', pa.timestamp('s')), ('deleted', pa.bool_()), ('snapshot', pa.int32()),
+    ])
+
+def budget_schema():
+    return pa.schema([
+        ('id', pa.int64()), ('user_id', pa.int64()), ('category', pa.string()),
+        ('amount_cents', pa.int64()), ('currency', pa.string()), ('year', pa.int32()),
+        ('month', pa.int32()), ('deleted', pa.bool_()), ('snapshot', pa.int32()),
+    ])
+
+def _record_batch(rows, schema, snapshot):
+    """Build a RecordBatch from query rows (the trailing partition is dropped)"""
+    columns = list(zip(*rows))
+    arrays = []
+    for index, field in enumerate(schema):
+        if field.name == 'snapshot':
+            arrays.append(pa.repeat(pa.scalar(snapshot, pa.int32()), len(rows)))
+        elif field.name == 'deleted':
+            arrays.append(pa.array(columns[index], pa.int8()).cast(pa.bool_()))
+        elif field.name == 'date':
+            # Stored as 'YYYY-MM-DD HH:MM:SS' text
+            arrays.append(pc.strptime(pa.array(columns[index], pa.string()),
+                                      format='%Y-%m-%d %H:%M:%S', unit='s',
+                                      error_is_null=True))
+        else:
+            arrays.append(pa.array(columns[index], field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def _partition_dir(base, period):
+    """year=YYYY/month=MM under base for a 'YYYY-MM' period"""
+    year, _, month = (period or '').partition('-')
+    if not (year.isdigit() and month.isdigit()):
+        year = month = NULL_PARTITION
+    return os.path.join(base, f"year={year}", f"month={month}")
+
+def _open_writer(path, schema, format):
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(path, schema)
+    return pa.ipc.new_file(path, schema)
+
+def write_partitions(cursor, base, schema, snapshot, format='parquet',
+                     batch_size=DEFAULT_EXPORT_BATCH_SIZE, files=None):
+    """Stream a partition-ordered query into one file per partition.
+
+    Returns the number of rows written; the paths written are appended to files.
+    """
+    files = [] if files is None else files
+    opened = {}
+    writer = None
+    period = None
+    written = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            start = 0
+            for end in range(1, len(rows) + 1):
+                if end < len(rows) and rows[end][-1] == rows[start][-1]:
+                    continue
+                if writer is None or rows[start][-1] != period:
+                    if writer is not None:
+                        writer.close()
+                    period = rows[start][-1]
+                    directory = _partition_dir(base, period)
+                    os.makedirs(directory, exist_ok=True)
+                    # Periods that are not dates share a directory; number their files
+                    count = opened[directory] = opened.get(directory, 0) + 1
+                    suffix = f"-{count}" if count > 1 else ''
+                    files.append(os.path.join(
+                        directory, f"part-{snapshot:06d}{suffix}{EXPORT_FORMATS[format]}"))
+                    writer = _open_writer(files[-1], schema, format)
+                writer.write_batch(_record_batch(rows[start:end], schema, snapshot))
+                written += end - start
+                start = end
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+class SnapshotExporter:
+    def __init__(self, db_path='finance.db'):
+        _require_pyarrow()
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+
+    def last_snapshot(self, directory):
+        """Return (snapshot, user_id, last_transaction_id, last_change_seq) for the
+        most recent export to directory, or None if there was none"""
+        conn = self.pool.acquire()
+        try:
+            return conn.execute("""
+                SELECT snapshot, user_id, last_transaction_id, last_change_seq
+                FROM export_snapshots
+                WHERE target = ? AND snapshot > 0
+                ORDER BY id DESC LIMIT 1
+            """, (os.path.abspath(directory),)).fetchone()
+        finally:
+            self.pool.release(conn)
+
+    def export(self, directory, user_id=None, incremental=True, format='parquet',
+               batch_size=DEFAULT_EXPORT_BATCH_SIZE):
+        """Export one user's (or, with user_id None, every user's) data to directory.
+
+        Incremental exports write only what changed since the last snapshot in
+        directory, or everything if there is none. A full export replaces the
+        transactions and budgets files already there. A directory holds the
+        export of one user, or of all users. Returns a dict with 'snapshot',
+        'incremental', 'transactions' and 'budgets' row counts and 'files', or
+        None on error.
+        """
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"unknown export format {format!r}")
+        target = os.path.abspath(directory)
+        previous = self.last_snapshot(target) if incremental else None
+        if previous and previous[1] != user_id:
+            print(f"Error exporting snapshot: {target} holds an export for "
+                  f"{'all users' if previous[1] is None else f'user {previous[1]}'}")
+            return None
+        snapshot = previous[0] + 1 if previous else 1
+        params = {'user_id': user_id,
+                  'last_id': previous[2] if previous else 0,
+                  'last_seq': previous[3] if previous else 0}
+        user = '' if user_id is None else USER_FILTER
+        if previous:
+            queries = (CHANGED_TRANSACTIONS.format(user=user),
+                       CHANGED_BUDGETS.format(user=user))
+        else:
+            queries = (FULL_TRANSACTIONS.format(user=user), FULL_BUDGETS.format(user=user))
+
+        files = []
+        conn = self.pool.acquire()
+        try:
+            if not previous:
+                # Forget the old watermark first, so a failed export is redone in full.
+                # The pending row (snapshot 0) turns on the export_changes triggers
+                # before the rows are read, so no later change goes unlogged
+                conn.execute('DELETE FROM export_snapshots WHERE target = ?', (target,))
+                conn.execute("""
+                    INSERT INTO export_snapshots
+                        (target, user_id, snapshot, last_transaction_id, last_change_seq)
+                    SELECT ?, ?, 0, 0, COALESCE(MAX(seq), 0) FROM export_changes
+                """, (target, user_id))
+                conn.commit()
+                for table in ('transactions', 'budgets'):
+                    shutil.rmtree(os.path.join(target, table), ignore_errors=True)
+            # One read transaction, so the watermark matches the rows exported
+            conn.execute('BEGIN')
+            last_id = conn.execute(
+                'SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+            last_seq = conn.execute(
+                'SELECT COALESCE(MAX(seq), 0) FROM export_changes').fetchone()[0]
+            counts = {}
+            for table, query, schema in zip(('transactions', 'budgets'), queries,
+                                            (transaction_schema(), budget_schema())):
+                counts[table] = write_partitions(
+                    conn.execute(query, params), os.path.join(target, table), schema,
+                    snapshot, format, batch_size, files)
+            conn.rollback()
+            conn.execute("""
+                INSERT INTO export_snapshots
+                    (target, user_id, snapshot, last_transaction_id, last_change_seq)
+                VALUES (?, ?, ?, ?, ?)
+            """, (target, user_id, snapshot, last_id, last_seq))
+            conn.execute('DELETE FROM export_snapshots WHERE target = ? AND snapshot < ?',
+                         (target, snapshot))
+            # Changes every export directory has seen are not needed again; with
+            # one export directory that is the whole log up to its watermark
+            conn.execute("""
+                DELETE FROM export_changes
+                WHERE seq <= (SELECT MIN(last_change_seq) FROM export_snapshots)
+            """)
+            conn.commit()
+        except (sqlite3.Error, OSError, pa.ArrowException) as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not previous:
+                self._forget_pending(conn, target)
+            # Leave no part files that the recorded watermark does not cover
+            for path in files:
+                if os.path.exists(path):
+                    os.remove(path)
+            print(f"Error exporting snapshot: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
+        return {'snapshot': snapshot, 'incremental': bool(previous), 'files': files,
+                **counts}
+
+    def _forget_pending(self, conn, target):
+        """Drop a failed full export's pending row, so it stops holding the log"""
+        try:
+            conn.execute('DELETE FROM export_snapshots WHERE target = ? AND snapshot = 0',
+                         (target,))
+            conn.execute("""
+                DELETE FROM export_changes
+                WHERE NOT EXISTS (SELECT 1 FROM export_snapshots)
+                OR seq <= (SELECT MIN(last_change_seq) FROM export_snapshots)
+            """)
+            conn.commit()
+        except sqlite3.Error:
+            pass
@@ -1,15 +1,193 @@
+import queue
 import tkinter as tk
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, messagebox
 from finance_manager import FinanceManager
+from money import Money
+from presentation import format_money
 from datetime import datetime
 import sqlite3
 
+class BackgroundWorker:
+    """Runs blocking calls (bcrypt, queries, reports) off the Tk main loop.
+
+    Tk may only be used from the thread running mainloop, so finished calls
+    are queued and their callbacks run from a poll scheduled with root.after.
+    One worker thread keeps the calls in the order they were made.
+    """
+    POLL_MS = 20
+
+    def __init__(self, root):
+        self.root = root
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='finance-gui')
+        self._done = queue.SimpleQueue()
+        self._pending = 0
+
+    def submit(self, func, *args, on_done=None, on_error=None):
+        """Call func(*args) on the worker; on_done(result) or on_error(exc) runs on Tk"""
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda f: self._done.put((f, on_done, on_error)))
+        if not self._pending:
+            self.root.config(cursor='watch')
+            self.root.after(self.POLL_MS, self._poll)
+        self._pending += 1
+
+    def _poll(self):
+        while True:
+            try:
+                future, on_done, on_error = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            try:
+                result = future.result()
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                else:
+                    messagebox.showerror("Error", str(e))
+                continue
+            if on_done:
+                on_done(result)
+        if self._pending:
+            self.root.after(self.POLL_MS, self._poll)
+        else:
+            self.root.config(cursor='')
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class PageWindow:
+    """Which pages of a newest-first, keyset-paginated listing are on screen.
+
+    At most max_pages pages are held at a time, so memory stays flat however
+    far the user scrolls. Only the start cursor of each page seen is kept, to
+    fetch pages again when scrolling back up.
+    """
+
+    def __init__(self, page_size=200, max_pages=3):
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.starts = [None]    # start cursor of every page seen
+        self.first = 0          # index of the first page held
+        self.sizes = deque()    # row counts of the pages held
+        self.last_page = None   # index of the final page, once reached
+
+    def next_page(self):
+        """(index, cursor) of the page after the window, or None at the end"""
+        index = self.first + len(self.sizes)
+        if self.last_page is not None and index > self.last_page:
+            return None
+        return index, self.starts[index]
+
+    def previous_page(self):
+        """(index, cursor) of the page before the window, or None at the top"""
+        if self.first == 0:
+            return None
+        return self.first - 1, self.starts[self.first - 1]
+
+    def add(self, index, rows, next_cursor):
+        """Record a fetched page; returns how many rows to drop from the far end"""
+        if index == self.first + len(self.sizes):
+            self.sizes.append(len(rows))
+            if next_cursor is None:
+                self.last_page = index
+            elif index + 1 == len(self.starts):
+                self.starts.append(next_cursor)
+            if len(self.sizes) > self.max_pages:
+                self.first += 1
+                return self.sizes.popleft()
+        elif index == self.first - 1:
+            self.first = index
+            self.sizes.appendleft(len(rows))
+            if len(self.sizes) > self.max_pages:
+                return self.sizes.pop()
+        else:
+            raise ValueError(f"page {index} is not next to the window")
+        return 0
+
+class TransactionGrid(ttk.Frame):
+    """A Treeview over a user's full history, fetching pages as it is scrolled"""
+    COLUMNS = ('Date', 'Type', 'Category', 'Amount', 'Description')
+    EDGE = 0.1  # fraction of the scroll range from either end that loads more
+
+    def __init__(self, master, worker, fetch_page, page_size=200, max_pages=3):
+        """fetch_page(cursor, page_size) returns (rows, next_cursor), as
+        TransactionManager.get_transactions_page does"""
+        super().__init__(master)
+        self.worker = worker
+        self.fetch_page = fetch_page
+        self.window = PageWindow(page_size, max_pages)
+        self._loading = False
+
+        self.tree = ttk.Treeview(self, columns=self.COLUMNS, show='headings')
+        for column in self.COLUMNS:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=160 if column == 'Description' else 100,
+                             anchor=tk.E if column == 'Amount' else tk.W)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree['yscrollcommand'] = self._on_scroll
+        self.tree.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self._load(self.window.next_page())
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._loading:
+            return
+        if float(last) > 1 - self.EDGE:
+            self._load(self.window.next_page())
+        elif float(first) < self.EDGE:
+            self._load(self.window.previous_page())
+
+    def _load(self, request):
+        if request is None:
+            return
+        index, cursor = request
+        self._loading = True
+        self.worker.submit(self.fetch_page, cursor, self.window.page_size,
+                           on_done=lambda page: self._show(index, page),
+                           on_error=self._failed)
+
+    def _failed(self, error):
+        self._loading = False
+        if not self.winfo_exists():
+            return
+        messagebox.showerror("Error", f"Failed to load transactions: {error}")
+
+    def _show(self, index, page):
+        self._loading = False
+        # The page may arrive after its window was closed
+        if page is None or not self.winfo_exists():
+            return
+        rows, next_cursor = page
+        prepend = index < self.window.first
+        children = self.tree.get_children()
+        top = round(self.tree.yview()[0] * len(children))
+        drop = self.window.add(index, rows, next_cursor)
+
+        for row in (reversed(rows) if prepend else rows):
+            # A deleted row can shift a re-fetched page onto one still shown
+            if not self.tree.exists(row.id):
+                self.tree.insert('', 0 if prepend else tk.END, iid=row.id, values=(
+                    row.date, row.type, row.category, format_money(row.amount),
+                    row.description or ''))
+        if drop:
+            self.tree.delete(*(children[-drop:] if prepend else children[:drop]))
+        # Keep the same rows in view while the window slides
+        top += len(rows) if prepend else -drop
+        count = len(self.tree.get_children())
+        self.tree.yview_moveto(max(top, 0) / count if count else 0)
+
 class FinanceManagerGUI:
     def __init__(self, root):
         self.root = root
         self.root.title('Personal Finance Manager')
         self.root.geometry('800x600')
         self.finance_manager = FinanceManager()
+        self.worker = BackgroundWorker(root)
+        self.root.protocol('WM_DELETE_WINDOW', self.close)
         self.current_user_id = None
         
         self.setup_styles()
@@ -92,6 +270,14 @@ class FinanceManagerGUI:
                    command=self.show_yearly_report).grid(column=1, row=0, padx=5)
         ttk.Button(reports_frame, text="Budget Status", 
                    command=self.show_budget_status).grid(column=2, row=0, padx=5)
+        ttk.Button(reports_frame, text="Transaction History",
+                   command=self.show_transaction_history).grid(column=3, row=0, padx=5)
+        self.search_entry = ttk.Entry(reports_frame)
+        self.search_entry.grid(column=0, row=1, columnspan=3, padx=5, pady=5,
+                               sticky=(tk.W, tk.E))
+        self.search_entry.bind('<Return>', lambda event: self.search_transactions())
+        ttk.Button(reports_frame, text="Search",
+                   command=self.search_transactions).grid(column=3, row=1, padx=5)
 
         # Logout Button
         ttk.Button(self.main_frame, text="Logout", 
@@ -100,7 +286,10 @@ class FinanceManagerGUI:
     def login(self):
         username = self.username_entry.get()
         password = self.password_entry.get()
-        user_id = self.finance_manager.authenticate_user(username, password)
+        self.worker.submit(self.finance_manager.authenticate_user, username, password,
+                           on_done=self.logged_in)
+
+    def logged_in(self, user_id):
         if user_id:
             self.current_user_id = user_id
             messagebox.showinfo("Success", "Login successful!")
@@ -111,63 +300,89 @@ class FinanceManagerGUI:
     def register(self):
         username = self.username_entry.get()
         password = self.password_entry.get()
-        if self.finance_manager.register_user(username, password):
-            messagebox.showinfo("Success", "Registration successful!")
+
+        def registered(success):
+            if success:
+                messagebox.showinfo("Success", "Registration successful!")
+            else:
+                messagebox.showerror("Error", "Username already exists!")
+        self.worker.submit(self.finance_manager.register_user, username, password,
+                           on_done=registered)
+
+    def base_currency(self):
+        return self.finance_manager.fx_manager.get_base_currency(self.current_user_id)
+
+    def invalid_amount(self, error):
+        if isinstance(error, ValueError):
+            messagebox.showerror("Error", "Please enter a valid amount!")
         else:
-            messagebox.showerror("Error", "Username already exists!")
+            messagebox.showerror("Error", str(error))
 
     def add_transaction(self):
-        try:
-            type = self.transaction_type.get()
-            category = self.category_entry.get()
-            amount = float(self.amount_entry.get())
-            description = self.description_entry.get()
-
-            if self.finance_manager.transaction_manager.add_transaction(
-                self.current_user_id, type, category, amount, description):
+        user_id = self.current_user_id
+        type = self.transaction_type.get()
+        category = self.category_entry.get()
+        amount = self.amount_entry.get()
+        description = self.description_entry.get()
+
+        def add():
+            return self.finance_manager.transaction_manager.add_transaction(
+                user_id, type, category, Money.parse(amount, self.base_currency()),
+                description)
+
+        def added(success):
+            if success:
                 messagebox.showinfo("Success", "Transaction added successfully!")
                 self.clear_transaction_entries()
             else:
                 messagebox.showerror("Error", "Failed to add transaction!")
-        except ValueError:
-            messagebox.showerror("Error", "Please enter a valid amount!")
+        self.worker.submit(add, on_done=added, on_error=self.invalid_amount)
 
     def set_budget(self):
-        try:
-            category = self.budget_category_entry.get()
-            amount = float(self.budget_amount_entry.get())
-            current_date = datetime.now()
-
-            if self.finance_manager.budget_manager.set_budget(
-                self.current_user_id, category, amount, current_date.month, current_date.year):
+        user_id = self.current_user_id
+        category = self.budget_category_entry.get()
+        amount = self.budget_amount_entry.get()
+        current_date = datetime.now()
+
+        def set_budget():
+            return self.finance_manager.budget_manager.set_budget(
+                user_id, category, Money.parse(amount, self.base_currency()),
+                current_date.month, current_date.year)
+
+        def budget_set(success):
+            if success:
                 messagebox.showinfo("Success", "Budget set successfully!")
                 self.clear_budget_entries()
             else:
                 messagebox.showerror("Error", "Failed to set budget!")
-        except ValueError:
-            messagebox.showerror("Error", "Please enter a valid amount!")
+        self.worker.submit(set_budget, on_done=budget_set, on_error=self.invalid_amount)
 
     def show_monthly_report(self):
-        report = self.finance_manager.report_generator.generate_monthly_report(
-            self.current_user_id)
-        self.show_report("Monthly Report", report)
+        self.worker.submit(self.finance_manager.report_generator.generate_monthly_report,
+                           self.current_user_id,
+                           on_done=lambda report: self.show_report("Monthly Report", report))
 
     def show_yearly_report(self):
-        report = self.finance_manager.report_generator.generate_yearly_report(
-            self.current_user_id)
-        self.show_report("Yearly Report", report)
+        self.worker.submit(self.finance_manager.report_generator.generate_yearly_report,
+                           self.current_user_id,
+                           on_done=lambda report: self.show_report("Yearly Report", report))
 
     def show_budget_status(self):
-        status = self.finance_manager.budget_manager.check_budget_status(
-            self.current_user_id)
-        self.show_report("Budget Status", status)
+        self.worker.submit(self.finance_manager.budget_manager.check_budget_status,
+                           self.current_user_id,
+                           on_done=lambda status: self.show_report("Budget Status", status))
 
     def show_report(self, title, content):
+        if content is None:
+            messagebox.showerror("Error", f"Failed to generate {title.lower()}!")
+            return
         report_window = tk.Toplevel(self.root)
         report_window.title(title)
         report_window.geometry('600x400')
 
-        text_widget = tk.Text(report_window, wrap=tk.WORD, padx=10, pady=10)
+        # Reports are a few dozen lines; no wrapping keeps their tables aligned
+        text_widget = tk.Text(report_window, wrap=tk.NONE, padx=10, pady=10,
+                              font=('Courier', 10))
         text_widget.insert(tk.END, content)
         text_widget.config(state=tk.DISABLED)
         text_widget.pack(expand=True, fill=tk.BOTH)
@@ -176,6 +391,34 @@ class FinanceManagerGUI:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         text_widget['yscrollcommand'] = scrollbar.set
 
+    def show_transaction_history(self):
+        user_id = self.current_user_id
+        manager = self.finance_manager.transaction_manager
+        history_window = tk.Toplevel(self.root)
+        history_window.title("Transaction History")
+        history_window.geometry('700x450')
+        TransactionGrid(
+            history_window, self.worker,
+            lambda cursor, page_size: manager.get_transactions_page(user_id, page_size,
+                                                                    cursor)
+        ).pack(expand=True, fill=tk.BOTH)
+
+    def search_transactions(self):
+        user_id = self.current_user_id
+        query = self.search_entry.get().strip()
+        if not query:
+            return
+        manager = self.finance_manager.transaction_manager
+        search_window = tk.Toplevel(self.root)
+        search_window.title(f"Search: {query}")
+        search_window.geometry('700x450')
+        # Search pages are numbered by offset, which works as the grid's cursor
+        TransactionGrid(
+            search_window, self.worker,
+            lambda offset, page_size: manager.search_transactions(user_id, query, page_size,
+                                                                  offset or 0)
+        ).pack(expand=True, fill=tk.BOTH)
+
     def clear_transaction_entries(self):
         self.transaction_type.set('')
         self.category_entry.delete(0, tk.END)
@@ -186,6 +429,10 @@ class FinanceManagerGUI:
         self.budget_category_entry.delete(0, tk.END)
         self.budget_amount_entry.delete(0, tk.END)
 
+    def close(self):
+        self.worker.shutdown()
+        self.root.destroy()
+
     def logout(self):
         self.current_user_id = None
         self.main_frame.grid_remove()
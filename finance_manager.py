@@ -1,69 +1,91 @@
 import click
+import shlex
 import sqlite3
-import bcrypt
-from datetime import datetime
-from pathlib import Path
-from transactions import TransactionManager
-from budget import BudgetManager
-from reports import ReportGenerator
+from functools import cached_property
+from database import get_pool, configure_pool
+from defaults import (DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_SIZE, DEFAULT_EXPORT_BATCH_SIZE,
+                      DEFAULT_PAGE_SIZE, DEFAULT_SCHEDULER_BATCH_SIZE, DEFAULT_SESSION_TTL,
+                      EXPORT_FORMATS, INTERVAL_UNITS, STATEMENT_FORMATS)
+from migrations import migrate
+
+# Startup time matters for a CLI run once per command, so bcrypt, tabulate and
+# the manager modules are imported by the methods and commands that use them.
+# Their option defaults come from defaults, which imports nothing.
 
 class FinanceManager:
-    def __init__(self, db_path='finance.db'):
+    def __init__(self, db_path='finance.db', pool_size=None):
         self.db_path = db_path
+        if pool_size:
+            configure_pool(db_path, size=pool_size)
+        self.pool = get_pool(db_path)
         self.setup_database()
-        self.transaction_manager = TransactionManager(db_path)
-        self.budget_manager = BudgetManager(db_path)
-        self.report_generator = ReportGenerator(db_path)
+
+    @cached_property
+    def transaction_manager(self):
+        from transactions import TransactionManager
+        return TransactionManager(self.db_path)
+
+    @cached_property
+    def budget_manager(self):
+        from budget import BudgetManager
+        return BudgetManager(self.db_path)
+
+    @cached_property
+    def report_generator(self):
+        from reports import ReportGenerator
+        return ReportGenerator(self.db_path)
+
+    @cached_property
+    def fx_manager(self):
+        from fx import FxManager
+        return FxManager(self.db_path)
+
+    @cached_property
+    def rule_manager(self):
+        from rules import RuleManager
+        return RuleManager(self.db_path)
+
+    @cached_property
+    def recurring_manager(self):
+        from recurring import RecurringManager
+        return RecurringManager(self.db_path)
+
+    @cached_property
+    def session_manager(self):
+        from sessions import SessionManager
+        return SessionManager(self.db_path)
 
     def setup_database(self):
-        """Initialize database with required tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Create users table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
-
-        # Create transactions table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            type TEXT NOT NULL,
-            category TEXT NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT,
-            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        """)
-
-        # Create budgets table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS budgets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            category TEXT NOT NULL,
-            amount REAL NOT NULL,
-            month INTEGER NOT NULL,
-            year INTEGER NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        """)
-
-        conn.commit()
-        conn.close()
+        """Initialize the database by applying any pending schema migrations"""
+        conn = self.pool.acquire()
+        try:
+            migrate(conn)
+        finally:
+            self.pool.release(conn)
+
+    def rebuild_rollups(self):
+        """Recompute balance and monthly rollups from scratch.
+
+        Returns the mismatches found against live sums before rebuilding.
+        """
+        from cache import get_cache
+        from rollups import check_rollups, rebuild_rollups
+        conn = self.pool.acquire()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            mismatches = check_rollups(conn)
+            rebuild_rollups(conn)
+            conn.commit()
+            get_cache(self.db_path).clear()
+            return mismatches
+        finally:
+            self.pool.release(conn)
 
     def register_user(self, username, password):
         """Register a new user"""
+        import bcrypt
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
 
             # Hash the password
@@ -79,139 +101,698 @@ class FinanceManager:
         except sqlite3.IntegrityError:
             return False
         finally:
-            conn.close()
+            self.pool.release(conn)
 
     def authenticate_user(self, username, password):
         """Authenticate a user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT id, password FROM users WHERE username = ?', (username,))
-        result = cursor.fetchone()
-        conn.close()
+        import bcrypt
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, password FROM users WHERE username = ?', (username,))
+            result = cursor.fetchone()
+        finally:
+            self.pool.release(conn)
 
         if result and bcrypt.checkpw(password.encode('utf-8'), result[1]):
             return result[0]  # Return user_id
         return None
 
+    def login(self, username, password, ttl=DEFAULT_SESSION_TTL):
+        """Authenticate a user and start a session; returns its token or None"""
+        user_id = self.authenticate_user(username, password)
+        if not user_id:
+            return None
+        return self.session_manager.create_session(user_id, ttl)
+
+class CliState:
+    """State shared by the commands of one CLI process, shell or batch run"""
+
+    def __init__(self, db_path='finance.db'):
+        self.db_path = db_path
+        self.token = None
+        self._manager = None
+
+    @property
+    def manager(self):
+        """The FinanceManager for this process, opened on first use"""
+        if self._manager is None:
+            self._manager = FinanceManager(self.db_path)
+        return self._manager
+
+def fail(message):
+    """Report that a command failed and exit with status 1.
+
+    Commands call this instead of just printing, so scripts, shell and
+    batch runs see the failure.
+    """
+    click.echo(message)
+    click.get_current_context().exit(1)
+
+def resolve_user(state, username=None, password=None):
+    """Return the user_id for a command: the session, else prompted credentials"""
+    from sessions import load_token
+    manager = state.manager
+    if username is None and password is None:
+        user_id = manager.session_manager.validate_token(state.token or load_token())
+        if user_id:
+            return user_id
+    if username is None:
+        username = click.prompt('Username')
+    if password is None:
+        password = click.prompt('Password', hide_input=True)
+    return manager.authenticate_user(username, password)
+
+def parse_cursor(ctx, param, value):
+    """Turn a --after 'DATE|ID' cursor into (date, id)"""
+    if value is None:
+        return None
+    from transactions import normalize_date
+    date, _, transaction_id = value.rpartition('|')
+    try:
+        date = normalize_date(date)
+        transaction_id = int(transaction_id)
+    except ValueError:
+        date = None
+    if date is None:
+        raise click.BadParameter('expected DATE|ID, as printed after the previous page')
+    return date, transaction_id
+
 @click.group()
-def cli():
+@click.option('--db', 'db_path', default='finance.db', envvar='FINANCE_DB',
+              show_default=True, help='SQLite database file.')
+@click.pass_context
+def cli(ctx, db_path):
     """Personal Finance Management System"""
-    pass
+    # shell and batch pass in their own state so every line shares it
+    if ctx.obj is None:
+        ctx.obj = CliState(db_path)
 
 @cli.command()
 @click.option('--username', prompt=True)
 @click.option('--password', prompt=True, hide_input=True)
-def register(username, password):
+@click.pass_obj
+def register(state, username, password):
     """Register a new user"""
-    manager = FinanceManager()
+    manager = state.manager
     if manager.register_user(username, password):
         click.echo('Registration successful!')
     else:
-        click.echo('Username already exists!')
+        fail('Username already exists!')
 
 @cli.command()
 @click.option('--username', prompt=True)
 @click.option('--password', prompt=True, hide_input=True)
-def login(username, password):
-    """Login to the system"""
-    manager = FinanceManager()
-    user_id = manager.authenticate_user(username, password)
-    if user_id:
+@click.option('--ttl', type=click.IntRange(min=1), default=DEFAULT_SESSION_TTL,
+              show_default=True, help='Session lifetime in seconds.')
+@click.pass_obj
+def login(state, username, password, ttl):
+    """Login and keep a session for later commands"""
+    from sessions import save_token
+    manager = state.manager
+    token = manager.login(username, password, ttl)
+    if token:
+        save_token(token)
+        state.token = token
         click.echo('Login successful!')
-        return user_id
     else:
-        click.echo('Invalid credentials!')
-        return None
+        fail('Invalid credentials!')
+
+@cli.command()
+@click.option('--all', 'revoke_all', is_flag=True,
+              help="End all of this user's sessions, not just this one.")
+@click.pass_obj
+def logout(state, revoke_all):
+    """End the current session"""
+    from sessions import load_token, clear_token
+    manager = state.manager
+    token = state.token or load_token()
+    user_id = manager.session_manager.validate_token(token)
+    if revoke_all and user_id:
+        manager.session_manager.revoke_user_sessions(user_id)
+    elif token:
+        manager.session_manager.revoke_token(token)
+    clear_token()
+    state.token = None
+    click.echo('Logged out.')
 
 @cli.command()
 @click.option('--type', type=click.Choice(['income', 'expense']), prompt=True)
 @click.option('--category', prompt=True)
 @click.option('--amount', type=float, prompt=True)
 @click.option('--description', prompt=True)
-@click.option('--username', prompt=True)
-@click.option('--password', prompt=True, hide_input=True)
-def add_transaction(type, category, amount, description, username, password):
+@click.option('--currency', default=None,
+              help="ISO 4217 code; defaults to the user's base currency.")
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def add_transaction(state, type, category, amount, description, currency, username,
+                    password):
     """Add a new transaction"""
-    manager = FinanceManager()
-    user_id = manager.authenticate_user(username, password)
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
     if user_id:
-        if manager.transaction_manager.add_transaction(user_id, type, category, amount, description):
+        if manager.transaction_manager.add_transaction(user_id, type, category, amount,
+                                                       description, currency=currency):
             click.echo('Transaction added successfully!')
         else:
-            click.echo('Failed to add transaction!')
+            fail('Failed to add transaction!')
     else:
-        click.echo('Authentication failed!')
+        fail('Authentication failed!')
+
+@cli.command()
+@click.option('--type', 'transaction_type', type=click.Choice(['income', 'expense']),
+              default=None)
+@click.option('--category', default=None)
+@click.option('--start-date', default=None)
+@click.option('--end-date', default=None)
+@click.option('--page-size', type=click.IntRange(min=1), default=DEFAULT_PAGE_SIZE,
+              show_default=True)
+@click.option('--after', default=None, callback=parse_cursor,
+              help='Cursor printed at the end of the previous page.')
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def view_transactions(state, transaction_type, category, start_date, end_date,
+                      page_size, after, username, password):
+    """View transactions one page at a time, newest first"""
+    from presentation import render_transactions
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
+    if user_id:
+        page = manager.transaction_manager.get_transactions_page(
+            user_id, page_size, after, start_date, end_date, transaction_type, category)
+        if page is None:
+            fail('Failed to retrieve transactions!')
+        rows, next_cursor = page
+        click.echo(render_transactions(rows))
+        if next_cursor:
+            click.echo(f"More transactions: --after '{next_cursor[0]}|{next_cursor[1]}'")
+    else:
+        fail('Authentication failed!')
+
+@cli.command()
+@click.argument('query')
+@click.option('--limit', type=click.IntRange(min=1), default=DEFAULT_PAGE_SIZE,
+              show_default=True)
+@click.option('--offset', type=click.IntRange(min=0), default=0)
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def search(state, query, limit, offset, username, password):
+    """Search transaction descriptions and categories, best matches first"""
+    from presentation import render_transactions
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
+    if user_id:
+        page = manager.transaction_manager.search_transactions(user_id, query, limit,
+                                                               offset)
+        if page is None:
+            fail('Search failed!')
+        rows, next_offset = page
+        click.echo(render_transactions(rows))
+        if next_offset is not None:
+            click.echo(f"More matches: --offset {next_offset}")
+    else:
+        fail('Authentication failed!')
+
+@cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'statement_format', type=click.Choice(STATEMENT_FORMATS),
+              default=None,
+              help='Statement format; detected from the file extension by default.')
+@click.option('--batch-size', type=click.IntRange(min=1), default=DEFAULT_BATCH_SIZE,
+              show_default=True)
+@click.option('--date-format', default=None,
+              help="strptime format such as '%m/%d/%Y', for statements whose "
+                   "dates could be read more than one way.")
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def import_transactions(state, path, statement_format, batch_size, date_format, username,
+                        password):
+    """Import transactions from a CSV, OFX or QIF bank statement.
+
+    CSV files need a header row with date, amount (or debit/credit) and
+    description columns; type and category columns are optional.
+    """
+    from ingest import ingest_file
+    manager = state.manager
+
+    def report_rejected(row_number, reason):
+        # Streamed as they happen; the result keeps only the first few
+        click.echo(f"Record {row_number}: {reason}", err=True)
+
+    user_id = resolve_user(state, username, password)
+    if user_id:
+        result = ingest_file(path, manager.transaction_manager, user_id,
+                             format=statement_format, batch_size=batch_size,
+                             date_format=date_format, on_error=report_rejected)
+        click.echo(f"Imported {result['accepted']} transactions, "
+                   f"rejected {result['rejected']}.")
+        if result['error']:
+            fail(f"Import stopped: {result['error']}")
+    else:
+        fail('Authentication failed!')
 
 @cli.command()
 @click.option('--category', prompt=True)
 @click.option('--amount', type=float, prompt=True)
 @click.option('--month', type=int, prompt=True)
 @click.option('--year', type=int, prompt=True)
-@click.option('--username', prompt=True)
-@click.option('--password', prompt=True, hide_input=True)
-def set_budget(category, amount, month, year, username, password):
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def set_budget(state, category, amount, month, year, username, password):
     """Set a budget for a category"""
-    manager = FinanceManager()
-    user_id = manager.authenticate_user(username, password)
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
     if user_id:
         if manager.budget_manager.set_budget(user_id, category, amount, month, year):
             click.echo('Budget set successfully!')
         else:
-            click.echo('Failed to set budget!')
+            fail('Failed to set budget!')
     else:
-        click.echo('Authentication failed!')
+        fail('Authentication failed!')
+
+@cli.command()
+@click.argument('currency')
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def set_currency(state, currency, username, password):
+    """Set the currency reports, balances and budget checks are shown in"""
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
+    if user_id:
+        if manager.fx_manager.set_base_currency(user_id, currency):
+            click.echo(f'Base currency set to {currency.upper()}.')
+        else:
+            fail('Failed to set base currency!')
+    else:
+        fail('Authentication failed!')
+
+@cli.command()
+@click.argument('pattern')
+@click.argument('category')
+@click.option('--priority', type=int, default=0, show_default=True,
+              help='The highest priority wins when several rules match.')
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def add_rule(state, pattern, category, priority, username, password):
+    """Categorise transactions with a word starting with PATTERN as CATEGORY.
+
+    Rules fill in categories missing from imported statements.
+    """
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
+    if user_id:
+        if manager.rule_manager.add_rule(user_id, pattern, category, priority):
+            click.echo('Rule saved.')
+        else:
+            fail('Failed to save rule!')
+    else:
+        fail('Authentication failed!')
+
+@cli.command()
+@click.option('--delete', 'rule_id', type=int, default=None,
+              help='Delete the rule with this ID.')
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def rules(state, rule_id, username, password):
+    """List categorisation rules, highest priority first"""
+    from presentation import render_rules
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
+    if not user_id:
+        fail('Authentication failed!')
+    elif rule_id is not None:
+        if manager.rule_manager.delete_rule(user_id, rule_id):
+            click.echo('Rule deleted.')
+        else:
+            fail('Rule not found!')
+    else:
+        rows = manager.rule_manager.get_rules(user_id)
+        if rows is None:
+            fail('Failed to retrieve rules!')
+        else:
+            click.echo(render_rules(rows))
+
+@cli.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--reference', default='USD', show_default=True,
+              help='Currency the rates are quoted in.')
+@click.pass_obj
+def import_rates(state, path, reference):
+    """Import exchange rates from a CSV file with date, currency and rate columns.
+
+    A rate is the value of one unit of the currency in the reference currency.
+    """
+    count = state.manager.fx_manager.import_csv(path, reference)
+    if count is None:
+        fail('Failed to import exchange rates!')
+    else:
+        click.echo(f'Imported {count} exchange rates.')
 
 @cli.command()
 @click.option('--month', type=int, default=None)
 @click.option('--year', type=int, default=None)
-@click.option('--username', prompt=True)
-@click.option('--password', prompt=True, hide_input=True)
-def monthly_report(month, year, username, password):
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def monthly_report(state, month, year, username, password):
     """Generate monthly financial report"""
-    manager = FinanceManager()
-    user_id = manager.authenticate_user(username, password)
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
     if user_id:
         report = manager.report_generator.generate_monthly_report(user_id, month, year)
         if report:
             click.echo(report)
         else:
-            click.echo('Failed to generate report!')
+            fail('Failed to generate report!')
     else:
-        click.echo('Authentication failed!')
+        fail('Authentication failed!')
 
 @cli.command()
 @click.option('--year', type=int, default=None)
-@click.option('--username', prompt=True)
-@click.option('--password', prompt=True, hide_input=True)
-def yearly_report(year, username, password):
+@click.option('--fiscal-start-month', type=click.IntRange(1, 12), default=1)
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def yearly_report(state, year, fiscal_start_month, username, password):
     """Generate yearly financial report"""
-    manager = FinanceManager()
-    user_id = manager.authenticate_user(username, password)
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
     if user_id:
-        report = manager.report_generator.generate_yearly_report(user_id, year)
+        report = manager.report_generator.generate_yearly_report(
+            user_id, year, fiscal_start_month)
         if report:
             click.echo(report)
         else:
-            click.echo('Failed to generate report!')
+            fail('Failed to generate report!')
     else:
-        click.echo('Authentication failed!')
+        fail('Authentication failed!')
 
 @cli.command()
-@click.option('--username', prompt=True)
-@click.option('--password', prompt=True, hide_input=True)
-def check_budget(username, password):
+@click.option('--months', type=click.IntRange(min=1), default=1,
+              help='Show adherence for this many months up to the current one.')
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def check_budget(state, months, username, password):
     """Check current budget status"""
-    manager = FinanceManager()
-    user_id = manager.authenticate_user(username, password)
+    from presentation import render_budget_history
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
     if user_id:
-        status = manager.budget_manager.check_budget_status(user_id)
+        if months > 1:
+            history = manager.budget_manager.get_budget_history(user_id, months)
+            status = render_budget_history(history) if history is not None else None
+        else:
+            status = manager.budget_manager.check_budget_status(user_id)
         if status:
             click.echo(status)
         else:
-            click.echo('Failed to check budget status!')
+            fail('Failed to check budget status!')
+    else:
+        fail('Authentication failed!')
+
+@cli.command()
+@click.option('--type', type=click.Choice(['income', 'expense']), prompt=True)
+@click.option('--category', prompt=True)
+@click.option('--amount', type=float, prompt=True)
+@click.option('--description', prompt=True)
+@click.option('--interval', type=click.Choice(INTERVAL_UNITS), default='month',
+              show_default=True)
+@click.option('--every', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Repeat every this many intervals.')
+@click.option('--start', 'start_date', default=None,
+              help='First occurrence, YYYY-MM-DD; defaults to now.')
+@click.option('--end', 'end_date', default=None, help='Last day, YYYY-MM-DD.')
+@click.option('--currency', default=None,
+              help="ISO 4217 code; defaults to the user's base currency.")
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def add_recurring(state, type, category, amount, description, interval, every,
+                  start_date, end_date, currency, username, password):
+    """Add a transaction that repeats, such as rent or a salary"""
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
+    if not user_id:
+        fail('Authentication failed!')
+    elif manager.recurring_manager.add_recurring(user_id, type, category, amount,
+                                                 description, interval, every,
+                                                 start_date, end_date, currency):
+        click.echo('Recurring transaction added successfully!')
+    else:
+        fail('Failed to add recurring transaction!')
+
+@cli.command()
+@click.option('--delete', 'recurring_id', type=int, default=None,
+              help='Stop the recurring transaction with this ID.')
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def recurring(state, recurring_id, username, password):
+    """List recurring transactions, soonest due first"""
+    from presentation import render_recurring
+    manager = state.manager
+    user_id = resolve_user(state, username, password)
+    if not user_id:
+        fail('Authentication failed!')
+    elif recurring_id is not None:
+        if manager.recurring_manager.delete_recurring(user_id, recurring_id):
+            click.echo('Recurring transaction stopped.')
+        else:
+            fail('Recurring transaction not found!')
+    else:
+        rows = manager.recurring_manager.get_recurring(user_id)
+        if rows is None:
+            fail('Failed to retrieve recurring transactions!')
+        else:
+            click.echo(render_recurring(rows))
+
+@cli.command()
+@click.option('--as-of', default=None,
+              help='Add occurrences due by this date instead of now.')
+@click.option('--batch-size', type=click.IntRange(min=1),
+              default=DEFAULT_SCHEDULER_BATCH_SIZE, show_default=True,
+              help='Recurring transactions written per database transaction.')
+@click.pass_obj
+def run_scheduler(state, as_of, batch_size):
+    """Add every due recurring transaction, for all users.
+
+    Safe to run as often as wanted, e.g. from cron: occurrences are added
+    once, and a run after downtime adds every occurrence missed.
+    """
+    result = state.manager.recurring_manager.run_scheduler(as_of, batch_size)
+    if result is None:
+        fail('Scheduler run failed!')
     else:
-        click.echo('Authentication failed!')
+        click.echo(f"Added {result['transactions']} transactions "
+                   f"from {result['rules']} recurring transactions.")
+
+@cli.command()
+@click.pass_obj
+def rebuild(state):
+    """Recompute balance and monthly rollups and verify them against live sums"""
+    manager = state.manager
+    mismatches = manager.rebuild_rollups()
+    for mismatch in mismatches:
+        click.echo(mismatch)
+    if mismatches:
+        click.echo(f'Rebuilt rollups; {len(mismatches)} mismatches were corrected.')
+    else:
+        click.echo('Rebuilt rollups; they matched the live sums.')
+
+@cli.command()
+@click.option('--output-dir', type=click.Path(file_okay=False), default='statements',
+              show_default=True)
+@click.option('--month', type=click.IntRange(1, 12), default=None)
+@click.option('--year', type=int, default=None)
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+              help='Worker processes; defaults to the number of CPUs.')
+@click.option('--chunk-size', type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE,
+              show_default=True, help='Users handed to a worker at a time.')
+@click.pass_obj
+def statements(state, output_dir, month, year, workers, chunk_size):
+    """Write monthly and yearly statements for every user, in parallel"""
+    from batch_reports import iter_statements
+    state.manager  # apply any pending migrations before the workers start
+    written = failed = 0
+    for result in iter_statements(state.db_path, output_dir, month, year, workers,
+                                  chunk_size):
+        if result.error:
+            failed += 1
+            click.echo(f"User {result.user_id} ({result.username}): {result.error}",
+                       err=True)
+        else:
+            written += 1
+    click.echo(f"Wrote {written} statements to {output_dir}; {failed} failed.")
+    if failed:
+        click.get_current_context().exit(1)
+
+@cli.command()
+@click.argument('output_dir', type=click.Path(file_okay=False))
+@click.option('--all-users', is_flag=True, help="Export every user's data.")
+@click.option('--full', is_flag=True,
+              help='Rewrite the whole export instead of only what changed.')
+@click.option('--format', 'export_format', type=click.Choice(EXPORT_FORMATS),
+              default='parquet', show_default=True)
+@click.option('--batch-size', type=click.IntRange(min=1), default=DEFAULT_EXPORT_BATCH_SIZE,
+              show_default=True)
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def export(state, output_dir, all_users, full, export_format, batch_size, username,
+           password):
+    """Export transactions and budgets as partitioned Parquet or Arrow files.
+
+    The first export to a directory is full; later ones add files holding
+    only the rows added, changed or deleted since.
+    """
+    try:
+        from export import SnapshotExporter
+        exporter = SnapshotExporter(state.manager.db_path)
+    except ImportError as e:
+        raise click.ClickException(str(e))
+    user_id = None
+    if not all_users:
+        user_id = resolve_user(state, username, password)
+        if not user_id:
+            fail('Authentication failed!')
+    result = exporter.export(output_dir, user_id, incremental=not full,
+                             format=export_format, batch_size=batch_size)
+    if result is None:
+        fail('Export failed!')
+    kind = 'incremental' if result['incremental'] else 'full'
+    click.echo(f"Wrote {kind} snapshot {result['snapshot']} to {output_dir}: "
+               f"{result['transactions']} transactions and {result['budgets']} budgets "
+               f"in {len(result['files'])} files.")
+
+def start_session(state, username=None, password=None):
+    """Authenticate once for a shell or batch run, reusing a saved session if valid"""
+    from sessions import load_token
+    if username is None and password is None:
+        token = load_token()
+        if state.manager.session_manager.validate_token(token):
+            state.token = token
+            return True
+    if username is None:
+        username = click.prompt('Username')
+    if password is None:
+        password = click.prompt('Password', hide_input=True)
+    state.token = state.manager.login(username, password)
+    return state.token is not None
+
+def run_command_line(state, line):
+    """Run one line of shell or batch input against the shared state.
+
+    Returns False if the line could not be parsed or the command failed,
+    i.e. exited with a non-zero status or raised.
+    """
+    try:
+        args = shlex.split(line, comments=True)
+    except ValueError as e:
+        click.echo(f"Error: {e}", err=True)
+        return False
+    if not args:
+        return True
+    if args[0] in ('shell', 'batch'):
+        click.echo(f"Error: '{args[0]}' cannot be run from {args[0]} or batch input",
+                   err=True)
+        return False
+
+    try:
+        # Without standalone mode an exit status is returned, not raised
+        status = cli.main(args, prog_name='finance', obj=state, standalone_mode=False)
+        return not status
+    except click.ClickException as e:
+        e.show()
+    except click.Abort:
+        click.echo('Error: missing input', err=True)
+    except SystemExit as e:
+        return e.code in (None, 0)
+    except Exception as e:
+        # One bad line must not end the whole shell or batch run
+        click.echo(f"Error: {e!r}", err=True)
+    return False
+
+@cli.command()
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_obj
+def shell(state, username, password):
+    """Run commands interactively against one database and session"""
+    try:
+        import readline  # noqa: F401  (line editing and history for input())
+    except ImportError:
+        pass
+    if not start_session(state, username, password):
+        fail('Authentication failed!')
+    click.echo("Type a command such as 'monthly-report --month 5', "
+               "'help' for the list, or 'exit' to quit.")
+    while True:
+        try:
+            line = input('finance> ')
+        except EOFError:
+            click.echo()
+            break
+        except KeyboardInterrupt:
+            click.echo()
+            continue
+        command = line.strip()
+        if command in ('exit', 'quit'):
+            break
+        run_command_line(state, '--help' if command == 'help' else line)
+
+@cli.command()
+@click.argument('script', type=click.File('r'), default='-')
+@click.option('--stop-on-error', is_flag=True, help='Stop at the first failing line.')
+@click.option('--username', default=None, help='Defaults to the logged-in session.')
+@click.option('--password', default=None,
+              help='Prompted for, without echo, if needed.')
+@click.pass_context
+def batch(ctx, script, stop_on_error, username, password):
+    """Run newline-delimited commands from SCRIPT (default: stdin) in one process.
+
+    Each line is a command with its options, as typed after finance_manager.py;
+    blank lines and '#' comments are skipped.
+    """
+    state = ctx.obj
+    if not start_session(state, username, password):
+        fail('Authentication failed!')
+    # Read the whole script first, so a command prompting for a missing option
+    # on stdin hits end of input instead of consuming the following lines
+    lines = script.readlines()
+    failed = 0
+    for number, line in enumerate(lines, 1):
+        if not run_command_line(state, line):
+            failed += 1
+            click.echo(f"Line {number} failed: {line.strip()}", err=True)
+            if stop_on_error:
+                break
+    if failed:
+        click.echo(f"{failed} lines failed.", err=True)
+        ctx.exit(1)
 
 if __name__ == '__main__':
     cli()
\ No newline at end of file
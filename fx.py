@@ -0,0 +1,189 @@
+"""Foreign-exchange rates for converting amounts to a user's base currency.
+
+Rates are imported from a local CSV file into the fx_rates table and served
+from memory: each currency's rates are kept sorted by date, and the rate for
+a day is the latest one on or before it, found by binary search. Reports
+convert whole (month, currency) groups from the rollups at the month-end
+rate, so a mixed-currency report costs one lookup per group, not per row.
+
+The CSV needs a header row:
+
+    date,currency,rate
+    2024-01-31,EUR,1.0835
+
+where rate is the value of one unit of currency in the reference currency
+named when importing (USD by default). The reference currency is always 1.
+"""
+import sqlite3
+import threading
+import weakref
+from bisect import bisect_right
+from database import get_pool
+from money import DEFAULT_CURRENCY
+
+class MissingRateError(LookupError):
+    """No rate is known for a currency on or before a date"""
+
+def month_end(month):
+    """A date bound that sorts after every day of a 'YYYY-MM' month"""
+    return month + '-31'
+
+def base_currency(conn, user_id):
+    """Return a user's base currency, or DEFAULT_CURRENCY for unknown users"""
+    row = conn.execute('SELECT base_currency FROM users WHERE id = ?', (user_id,)).fetchone()
+    return row[0] if row else DEFAULT_CURRENCY
+
+class FxRates:
+    """Date-indexed rates held in memory"""
+
+    def __init__(self, reference=DEFAULT_CURRENCY, rows=()):
+        """rows are (currency, 'YYYY-MM-DD', rate), sorted by currency and date"""
+        self.reference = reference
+        self._dates = {}
+        self._rates = {}
+        self._factors = {}
+        for currency, date, rate in rows:
+            self._dates.setdefault(currency, []).append(date)
+            self._rates.setdefault(currency, []).append(rate)
+
+    def rate(self, currency, date):
+        """Value of one unit of currency in the reference currency on a date"""
+        if currency == self.reference:
+            return 1.0
+        dates = self._dates.get(currency)
+        index = bisect_right(dates, date) if dates else 0
+        if not index:
+            raise MissingRateError(f"no {currency} rate on or before {date}")
+        return self._rates[currency][index - 1]
+
+    def factor(self, source, target, date):
+        """Multiplier converting amounts in source to target on a date"""
+        if source == target:
+            return 1.0
+        key = (source, target, date)
+        factor = self._factors.get(key)
+        if factor is None:
+            # Reports ask for the same month-end factors again and again
+            factor = self._factors[key] = self.rate(source, date) / self.rate(target, date)
+        return factor
+
+    def convert(self, cents, source, target, date):
+        """Convert integer cents between currencies, rounding to the nearest cent"""
+        if source == target or cents is None:
+            return cents
+        return round(cents * self.factor(source, target, date))
+
+# One FxRates per connection pool, reloaded when another import bumps fx_version
+_rates = weakref.WeakKeyDictionary()
+_rates_lock = threading.Lock()
+
+class FxManager:
+    def __init__(self, db_path='finance.db'):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+
+    def import_csv(self, path, reference=DEFAULT_CURRENCY):
+        """Import rates from a CSV file, replacing any for the same currency and day.
+
+        Returns the number of rates imported, or None on error.
+        """
+        import csv
+        from datetime import date
+        reference = reference.upper()
+        conn = self.pool.acquire()
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as file:
+                rows = [(row['currency'].strip().upper(),
+                         date.fromisoformat(row['date'].strip()).isoformat(),
+                         float(row['rate']))
+                        for row in csv.DictReader(file)]
+            if any(not rate > 0 for _, _, rate in rows):
+                raise ValueError('rates must be positive')
+            conn.execute('BEGIN IMMEDIATE')
+            stored = conn.execute(
+                "SELECT value FROM settings WHERE name = 'fx_reference'").fetchone()
+            if stored and stored[0] != reference:
+                # Rates against different references cannot be mixed
+                conn.execute('DELETE FROM fx_rates')
+            conn.executemany(
+                'INSERT OR REPLACE INTO fx_rates (currency, date, rate) VALUES (?, ?, ?)',
+                rows)
+            conn.execute("""
+                INSERT OR REPLACE INTO settings (name, value) VALUES ('fx_reference', ?)
+            """, (reference,))
+            conn.execute("""
+                INSERT INTO settings (name, value) VALUES ('fx_version', 1)
+                ON CONFLICT (name) DO UPDATE SET value = value + 1
+            """)
+            conn.commit()
+        except (OSError, KeyError, ValueError, TypeError, AttributeError,
+                sqlite3.Error) as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"Error importing exchange rates: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
+        from cache import get_cache
+        get_cache(self.db_path).clear()
+        return len(rows)
+
+    def rates(self):
+        """Return the in-memory FxRates, reloading them after an import"""
+        conn = self.pool.acquire()
+        try:
+            settings = dict(conn.execute("""
+                SELECT name, value FROM settings WHERE name IN ('fx_version', 'fx_reference')
+            """).fetchall())
+            version = settings.get('fx_version', 0)
+            with _rates_lock:
+                cached = _rates.get(self.pool)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            rates = FxRates(settings.get('fx_reference', DEFAULT_CURRENCY), conn.execute(
+                'SELECT currency, date, rate FROM fx_rates ORDER BY currency, date'))
+        finally:
+            self.pool.release(conn)
+        with _rates_lock:
+            _rates[self.pool] = (version, rates)
+        return rates
+
+    def rate_to(self, target):
+        """Return factor(currency, date), the multiplier from currency into target.
+
+        Rates are loaded on first use, so amounts already in target never touch them.
+        """
+        rates = None
+
+        def factor(currency, date):
+            nonlocal rates
+            if currency == target:
+                return 1.0
+            if rates is None:
+                rates = self.rates()
+            return rates.factor(currency, target, date)
+        return factor
+
+    def get_base_currency(self, user_id):
+        conn = self.pool.acquire()
+        try:
+            return base_currency(conn, user_id)
+        finally:
+            self.pool.release(conn)
+
+    def set_base_currency(self, user_id, currency):
+        """Set the currency a user's reports and budget checks are converted to"""
+        from cache import get_cache
+        from transactions import normalize_currency
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute('UPDATE users SET base_currency = ? WHERE id = ?',
+                                  (normalize_currency(currency), user_id))
+            conn.commit()
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error setting base currency: {e}")
+            return False
+        finally:
+            self.pool.release(conn)
+        get_cache(self.db_path).invalidate(user_id)
+        return cursor.rowcount > 0
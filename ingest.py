@@ -0,0 +1,306 @@
+"""Streaming bank statement ingestion.
+
+Every stage is a generator, so a statement is never held in memory as a
+whole: parse -> normalise -> categorise -> write through TransactionManager
+in batches.
+
+    records = read_statement(path)
+    rows = categorise(normalise(records), {'tesco': 'Groceries'})
+    result = write_transactions(rows, transaction_manager, user_id)
+"""
+import csv
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from defaults import DEFAULT_BATCH_SIZE, STATEMENT_FORMATS as FORMATS
+from rules import DEFAULT_CATEGORY
+
+READ_CHUNK_SIZE = 64 * 1024
+DATE_CACHE_SIZE = 4096
+DATE_DETECT_ROWS = 10000
+
+# Common bank export header names for each normalised field
+CSV_HEADER_ALIASES = {
+    'date': ('date', 'transaction date', 'posted date', 'posting date', 'booking date'),
+    'amount': ('amount', 'value', 'transaction amount'),
+    'debit': ('debit', 'withdrawal', 'paid out', 'money out'),
+    'credit': ('credit', 'deposit', 'paid in', 'money in'),
+    'description': ('description', 'payee', 'memo', 'details', 'narrative', 'name'),
+    'category': ('category',),
+    'type': ('type',),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y', '%m/%d/%Y',
+                '%d.%m.%Y', '%Y%m%d', '%Y%m%d%H%M%S', '%m/%d/%y', "%m/%d'%y")
+
+def detect_format(path):
+    """Guess the statement format from the file extension"""
+    suffix = Path(path).suffix.lower().lstrip('.')
+    return suffix if suffix in FORMATS else 'csv'
+
+# Parse stage: yield raw record dicts with any of the CSV_HEADER_ALIASES keys
+
+def read_csv(file, columns=None, delimiter=','):
+    """Yield records from a CSV statement with a header row.
+
+    columns optionally maps field names ('date', 'amount', ...) to the header
+    used by this bank; otherwise headers are matched by CSV_HEADER_ALIASES.
+    """
+    reader = csv.reader(file, delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        return
+    normalised = [h.strip().lower() for h in header]
+
+    positions = {}
+    for field, aliases in CSV_HEADER_ALIASES.items():
+        wanted = (columns or {}).get(field)
+        candidates = (wanted.strip().lower(),) if wanted else aliases
+        for alias in candidates:
+            if alias in normalised:
+                positions[field] = normalised.index(alias)
+                break
+    fields = list(positions.items())
+
+    for line in reader:
+        if not line:
+            continue
+        yield {field: line[index] if index < len(line) else None
+               for field, index in fields}
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+_OFX_FIELDS = {'DTPOSTED': 'date', 'TRNAMT': 'amount', 'NAME': 'description',
+               'MEMO': 'memo'}
+
+def _ofx_tokens(file):
+    """Yield (closing, tag, text) tokens, reading the file in fixed-size chunks"""
+    buffer = ''
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        # Only tokenise up to the last tag start; it may continue in the next chunk
+        cut = buffer.rfind('<')
+        for match in _OFX_TAG.finditer(buffer, 0, cut):
+            yield match.group(1) == '/', match.group(2).upper(), match.group(3).strip()
+        buffer = buffer[cut:]
+    for match in _OFX_TAG.finditer(buffer):
+        yield match.group(1) == '/', match.group(2).upper(), match.group(3).strip()
+
+def read_ofx(file):
+    """Yield records from the <STMTTRN> blocks of an OFX (SGML or XML) statement"""
+    record = None
+    for closing, tag, text in _ofx_tokens(file):
+        if tag == 'STMTTRN':
+            if closing and record is not None:
+                if not record.get('description'):
+                    record['description'] = record.get('memo')
+                record.pop('memo', None)
+                yield record
+                record = None
+            elif not closing:
+                record = {}
+        elif record is not None and not closing and tag in _OFX_FIELDS:
+            value = text
+            if tag == 'DTPOSTED':
+                # 20240131120000.000[-5:EST] -> 20240131120000
+                value = re.split(r'[.\[]', value, 1)[0]
+            record[_OFX_FIELDS[tag]] = value
+
+def read_qif(file):
+    """Yield records from a QIF statement, one per '^'-terminated entry"""
+    record = {}
+    for line in file:
+        line = line.rstrip('\r\n')
+        if not line or line.startswith('!'):
+            continue
+        code, value = line[0], line[1:].strip()
+        if code == '^':
+            if record:
+                yield record
+            record = {}
+        elif code == 'D':
+            record['date'] = value
+        elif code in ('T', 'U'):
+            record['amount'] = value
+        elif code == 'P':
+            record['description'] = value
+        elif code == 'M':
+            record.setdefault('description', value)
+        elif code == 'L' and not value.startswith('['):
+            # [Account] entries are transfers, not categories
+            record['category'] = value.split(':', 1)[0]
+    if record:
+        yield record
+
+READERS = {'csv': read_csv, 'ofx': read_ofx, 'qif': read_qif}
+
+def read_statement(path, format=None, **options):
+    """Open a statement file and yield its raw records"""
+    format = format or detect_format(path)
+    if format not in READERS:
+        raise ValueError(f"Unsupported statement format: {format}")
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as file:
+        yield from READERS[format](file, **options)
+
+# Normalise stage: raw records -> (type, category, amount, description, date)
+
+def parse_amount(value):
+    """Parse a bank amount such as '-1,234.50', '(12.00)' or '£9.99'"""
+    if value is None:
+        return None
+    text = str(value).strip().replace(',', '')
+    negative = text.startswith('(') and text.endswith(')')
+    text = re.sub(r'[^0-9.+-]', '', text)
+    if not text:
+        return None
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        return None
+    return -amount if negative else amount
+
+def _reading(value, fmt):
+    """value parsed with one format, in storage format, or None if it does not fit"""
+    try:
+        return datetime.strptime(str(value).strip(), fmt).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+def _check_readings(rows, formats):
+    """Raise ValueError if formats read any held row's date differently"""
+    for row in rows:
+        readings = {_reading(row[4], fmt) for fmt in formats} - {None}
+        if len(readings) > 1:
+            raise ValueError(
+                f"ambiguous date {row[4]!r} could be {' or '.join(sorted(readings))}; "
+                f"pass date_format, one of {', '.join(formats)}")
+
+def normalise(records, date_formats=DATE_FORMATS, date_format=None):
+    """Turn raw records into transaction rows.
+
+    Signed amounts (or debit/credit columns) become a type plus a positive
+    amount. Values that cannot be parsed are passed through as-is so the
+    write stage rejects the row with a reason instead of silently dropping it.
+
+    A statement is read with one date format throughout: date_format, or the
+    one of date_formats that fits every date. It is detected when normalise
+    is called, reading ahead until only one format fits, up to
+    DATE_DETECT_ROWS rows; if several still fit and read some date
+    differently (01/05/2024 as 1 May or 5 January), ValueError asks for
+    date_format before any row is returned. Dates that do not fit the format
+    are passed through as-is, so the write stage rejects them unless they
+    are ISO dates, which cannot be misread.
+    """
+    formats = [date_format] if date_format else list(date_formats)
+    records = iter(records)
+    held = []
+    # Detect the format before any row is yielded, so an ambiguous statement
+    # fails before the write stage has committed anything
+    for record in records:
+        row = _normalise_record(record)
+        held.append(row)
+        if row[4]:
+            # Narrow to the formats that fit every date so far
+            formats = [fmt for fmt in formats if _reading(row[4], fmt)] or formats
+        if len(formats) == 1:
+            break
+        if len(held) >= DATE_DETECT_ROWS:
+            _check_readings(held, formats)
+            raise ValueError(f"cannot tell the date format from the first "
+                             f"{len(held)} rows; pass date_format")
+    else:
+        # Every format left reads these dates the same way
+        _check_readings(held, formats)
+    return _with_dates(held, records, formats[0])
+
+def _with_dates(held, records, fmt):
+    """Yield the held rows, then the remaining records, with dates read by fmt"""
+    # Statements repeat the same dates many times; keep recent parses
+    parsed_dates = {}
+
+    def with_date(row):
+        raw_date = row[4]
+        date = parsed_dates.get(raw_date)
+        if date is None:
+            date = (_reading(raw_date, fmt) if raw_date else None) or raw_date
+            if len(parsed_dates) >= DATE_CACHE_SIZE:
+                parsed_dates.clear()
+            parsed_dates[raw_date] = date
+        return row[:4] + (date,)
+
+    yield from map(with_date, held)
+    held.clear()
+    for record in records:
+        yield with_date(_normalise_record(record))
+
+def _normalise_record(record):
+    """(type, category, amount, description, raw date) for one raw record"""
+    amount = parse_amount(record.get('amount'))
+    if amount is None:
+        credit = parse_amount(record.get('credit'))
+        debit = parse_amount(record.get('debit'))
+        if credit:
+            amount = abs(credit)
+        elif debit:
+            amount = -abs(debit)
+
+    type = (record.get('type') or '').strip().lower() or None
+    if amount is None:
+        amount = record.get('amount')
+    elif type is None:
+        type = 'expense' if amount < 0 else 'income'
+        amount = abs(amount)
+
+    description = (record.get('description') or '').strip() or None
+    category = (record.get('category') or '').strip() or None
+    return (type, category, amount, description, record.get('date'))
+
+# Categorise stage: fill in missing categories
+
+def categorise(rows, mapping=None, default=DEFAULT_CATEGORY):
+    """Fill missing categories from description keywords.
+
+    mapping is {keyword: category}; the first keyword found (case-insensitive)
+    in the description wins, otherwise the default category is used. With
+    default=None the category stays missing, for the write stage to fill in.
+    """
+    keywords = [(keyword.lower(), category) for keyword, category in (mapping or {}).items()]
+    for type, category, amount, description, date in rows:
+        if not category:
+            text = (description or '').lower()
+            category = next((c for keyword, c in keywords if keyword in text), default)
+        yield (type, category, amount, description, date)
+
+# Write stage
+
+def write_transactions(rows, transaction_manager, user_id, batch_size=DEFAULT_BATCH_SIZE,
+                       categorise=False, on_error=None):
+    """Write rows through TransactionManager.add_transactions_bulk"""
+    return transaction_manager.add_transactions_bulk(user_id, rows, batch_size, categorise,
+                                                     on_error)
+
+def ingest_file(path, transaction_manager, user_id, format=None, category_map=None,
+                batch_size=DEFAULT_BATCH_SIZE, date_format=None, on_error=None,
+                **reader_options):
+    """Run the whole pipeline over one statement file.
+
+    Categories come from the statement, then category_map, then the user's
+    rules (see rules.py), else DEFAULT_CATEGORY. date_format is a strptime
+    format, needed only when the statement's dates are ambiguous. on_error
+    is called with each rejected row's number and reason.
+
+    Returns the add_transactions_bulk result. A statement whose date format
+    cannot be told is not imported at all; its result holds the reason in
+    'error'.
+    """
+    records = read_statement(path, format, **reader_options)
+    try:
+        rows = normalise(records, date_format=date_format)
+    except ValueError as e:
+        return {'accepted': 0, 'rejected': 0, 'errors': [], 'error': str(e)}
+    rows = categorise(rows, category_map, default=None)
+    return write_transactions(rows, transaction_manager, user_id, batch_size,
+                              categorise=True, on_error=on_error)
@@ -0,0 +1,629 @@
+import sqlite3
+
+# Ordered schema history. Each entry is (version, description, steps) where a
+# step is either an SQL statement or a callable taking the open connection.
+# Never edit an applied migration; append a new one instead.
+MIGRATIONS = [
+    (1, 'Create users, transactions and budgets tables', [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS budgets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            month INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+    ]),
+    (2, 'Index transactions by user, type/category and date', [
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_type_date
+        ON transactions (user_id, type, date)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_category_date
+        ON transactions (user_id, category, date)
+        """,
+    ]),
+    (3, 'Make budgets unique per user, category and month', [
+        # Keep the most recently written row for any duplicated budget
+        """
+        DELETE FROM budgets WHERE id NOT IN (
+            SELECT MAX(id) FROM budgets GROUP BY user_id, category, month, year
+        )
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_budgets_user_category_period
+        ON budgets (user_id, category, month, year)
+        """,
+    ]),
+    (4, 'Index transactions by user and date for keyset pagination', [
+        # The rowid (id) is implicitly the last key column, giving (user_id, date, id)
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_date
+        ON transactions (user_id, date)
+        """,
+    ]),
+    (5, 'Make the type and category indexes covering for aggregates', [
+        # Carrying amount (and the other filter column) in the index lets
+        # report and budget sums run without a table lookup per row
+        'DROP INDEX IF EXISTS idx_transactions_user_type_date',
+        """
+        CREATE INDEX idx_transactions_user_type_date
+        ON transactions (user_id, type, date, category, amount)
+        """,
+        'DROP INDEX IF EXISTS idx_transactions_user_category_date',
+        """
+        CREATE INDEX idx_transactions_user_category_date
+        ON transactions (user_id, category, date, type, amount)
+        """,
+    ]),
+    (6, 'Add per-user balance and monthly income/expense rollups', [
+        """
+        CREATE TABLE IF NOT EXISTS user_balances (
+            user_id INTEGER PRIMARY KEY,
+            income REAL NOT NULL DEFAULT 0,
+            expenses REAL NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS monthly_totals (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            income REAL NOT NULL DEFAULT 0,
+            expenses REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, year, month)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO monthly_totals (user_id, year, month, income, expenses)
+        SELECT user_id,
+               CAST(strftime('%Y', date) AS INTEGER) AS year,
+               CAST(strftime('%m', date) AS INTEGER) AS month,
+               COALESCE(SUM(CASE WHEN type = 'income' THEN amount END), 0),
+               COALESCE(SUM(CASE WHEN type = 'expense' THEN amount END), 0)
+        FROM transactions
+        WHERE user_id IS NOT NULL AND type IN ('income', 'expense')
+        GROUP BY user_id, year, month
+        """,
+        """
+        INSERT INTO user_balances (user_id, income, expenses)
+        SELECT user_id, SUM(income), SUM(expenses)
+        FROM monthly_totals
+        GROUP BY user_id
+        """,
+    ]),
+    (7, 'Add monthly per-type, per-category rollups', [
+        """
+        CREATE TABLE IF NOT EXISTS monthly_category_totals (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            minimum REAL,
+            maximum REAL,
+            PRIMARY KEY (user_id, year, month, type, category)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO monthly_category_totals
+            (user_id, year, month, type, category, count, total, minimum, maximum)
+        SELECT user_id,
+               CAST(strftime('%Y', date) AS INTEGER) AS year,
+               CAST(strftime('%m', date) AS INTEGER) AS month,
+               type, category, COUNT(*), SUM(amount), MIN(amount), MAX(amount)
+        FROM transactions
+        WHERE user_id IS NOT NULL AND type IN ('income', 'expense')
+        GROUP BY user_id, year, month, type, category
+        """,
+    ]),
+    (8, 'Add login sessions and the settings table holding their signing key', [
+        """
+        CREATE TABLE IF NOT EXISTS settings (
+            name TEXT PRIMARY KEY,
+            value BLOB NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)',
+    ]),
+    (9, 'Store amounts as integer cents with a currency', [
+        # SQLite cannot change a column's type, so rebuild each table, copying
+        # REAL amounts as rounded integer cents; ids and AUTOINCREMENT survive
+        """
+        CREATE TABLE transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            currency TEXT NOT NULL DEFAULT 'USD',
+            description TEXT,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        """
+        INSERT INTO transactions_new
+            (id, user_id, type, category, amount_cents, description, date)
+        SELECT id, user_id, type, category, CAST(ROUND(amount * 100) AS INTEGER),
+               description, date
+        FROM transactions
+        """,
+        'DROP TABLE transactions',
+        'ALTER TABLE transactions_new RENAME TO transactions',
+        """
+        CREATE INDEX idx_transactions_user_type_date
+        ON transactions (user_id, type, date, category, amount_cents)
+        """,
+        """
+        CREATE INDEX idx_transactions_user_category_date
+        ON transactions (user_id, category, date, type, amount_cents)
+        """,
+        'CREATE INDEX idx_transactions_user_date ON transactions (user_id, date)',
+        """
+        CREATE TABLE budgets_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            category TEXT NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            currency TEXT NOT NULL DEFAULT 'USD',
+            month INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        """
+        INSERT INTO budgets_new (id, user_id, category, amount_cents, month, year)
+        SELECT id, user_id, category, CAST(ROUND(amount * 100) AS INTEGER), month, year
+        FROM budgets
+        """,
+        'DROP TABLE budgets',
+        'ALTER TABLE budgets_new RENAME TO budgets',
+        """
+        CREATE UNIQUE INDEX idx_budgets_user_category_period
+        ON budgets (user_id, category, month, year)
+        """,
+        # The rollups keep their column names but now hold integer cents
+        'DROP TABLE user_balances',
+        'DROP TABLE monthly_totals',
+        'DROP TABLE monthly_category_totals',
+        """
+        CREATE TABLE user_balances (
+            user_id INTEGER PRIMARY KEY,
+            income INTEGER NOT NULL DEFAULT 0,
+            expenses INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE monthly_totals (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            income INTEGER NOT NULL DEFAULT 0,
+            expenses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, year, month)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE monthly_category_totals (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            minimum INTEGER,
+            maximum INTEGER,
+            PRIMARY KEY (user_id, year, month, type, category)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO monthly_category_totals
+            (user_id, year, month, type, category, count, total, minimum, maximum)
+        SELECT user_id,
+               CAST(strftime('%Y', date) AS INTEGER) AS year,
+               CAST(strftime('%m', date) AS INTEGER) AS month,
+               type, category, COUNT(*), SUM(amount_cents), MIN(amount_cents),
+               MAX(amount_cents)
+        FROM transactions
+        WHERE user_id IS NOT NULL AND type IN ('income', 'expense')
+        GROUP BY user_id, year, month, type, category
+        """,
+        """
+        INSERT INTO monthly_totals (user_id, year, month, income, expenses)
+        SELECT user_id, year, month,
+               SUM(CASE WHEN type = 'income' THEN total ELSE 0 END),
+               SUM(CASE WHEN type = 'expense' THEN total ELSE 0 END)
+        FROM monthly_category_totals
+        GROUP BY user_id, year, month
+        """,
+        """
+        INSERT INTO user_balances (user_id, income, expenses)
+        SELECT user_id, SUM(income), SUM(expenses)
+        FROM monthly_totals
+        GROUP BY user_id
+        """,
+    ]),
+    (10, 'Add FX rates, user base currencies and per-currency rollups', [
+        "ALTER TABLE users ADD COLUMN base_currency TEXT NOT NULL DEFAULT 'USD'",
+        # rate is the value of one unit of currency in the reference currency
+        # recorded in settings ('fx_reference') when the rates were loaded
+        """
+        CREATE TABLE IF NOT EXISTS fx_rates (
+            currency TEXT NOT NULL,
+            date TEXT NOT NULL,
+            rate REAL NOT NULL,
+            PRIMARY KEY (currency, date)
+        ) WITHOUT ROWID
+        """,
+        # Rollups gain a currency key so each currency can be converted apart
+        'DROP TABLE user_balances',
+        'DROP TABLE monthly_totals',
+        'DROP TABLE monthly_category_totals',
+        """
+        CREATE TABLE user_balances (
+            user_id INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            income INTEGER NOT NULL DEFAULT 0,
+            expenses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, currency)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE monthly_totals (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            income INTEGER NOT NULL DEFAULT 0,
+            expenses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, year, month, currency)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE monthly_category_totals (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            minimum INTEGER,
+            maximum INTEGER,
+            PRIMARY KEY (user_id, year, month, type, category, currency)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO monthly_category_totals
+            (user_id, year, month, type, category, currency,
+             count, total, minimum, maximum)
+        SELECT user_id,
+               CAST(strftime('%Y', date) AS INTEGER) AS year,
+               CAST(strftime('%m', date) AS INTEGER) AS month,
+               type, category, currency, COUNT(*), SUM(amount_cents),
+               MIN(amount_cents), MAX(amount_cents)
+        FROM transactions
+        WHERE user_id IS NOT NULL AND type IN ('income', 'expense')
+        GROUP BY user_id, year, month, type, category, currency
+        """,
+        """
+        INSERT INTO monthly_totals (user_id, year, month, currency, income, expenses)
+        SELECT user_id, year, month, currency,
+               SUM(CASE WHEN type = 'income' THEN total ELSE 0 END),
+               SUM(CASE WHEN type = 'expense' THEN total ELSE 0 END)
+        FROM monthly_category_totals
+        GROUP BY user_id, year, month, currency
+        """,
+        """
+        INSERT INTO user_balances (user_id, currency, income, expenses)
+        SELECT user_id, currency, SUM(income), SUM(expenses)
+        FROM monthly_totals
+        GROUP BY user_id, currency
+        """,
+    ]),
+    (11, 'Add full-text search over transaction descriptions and categories', [
+        # Contentless index keyed by user_id * 2^32 + id, so each user's rows
+        # form one rowid range and a search reads only that user's entries.
+        # The text itself stays in transactions; results join back on the id
+        """
+        CREATE VIRTUAL TABLE transactions_fts USING fts5(
+            description, category, content='',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        """,
+        # A row here (only ever inside a writer's own transaction) pauses the
+        # per-row insert trigger while a bulk write indexes its rows in one
+        # statement; FTS5 is several times faster fed a set than row by row
+        'CREATE TABLE fts_deferred (id INTEGER PRIMARY KEY)',
+        """
+        CREATE TRIGGER transactions_fts_insert AFTER INSERT ON transactions
+        WHEN new.user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM fts_deferred) BEGIN
+            INSERT INTO transactions_fts (rowid, description, category)
+            VALUES (new.user_id * 4294967296 + new.id, new.description, new.category);
+        END
+        """,
+        # A contentless index deletes by being handed the indexed values again
+        """
+        CREATE TRIGGER transactions_fts_delete AFTER DELETE ON transactions
+        WHEN old.user_id IS NOT NULL BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, category)
+            VALUES ('delete', old.user_id * 4294967296 + old.id, old.description,
+                    old.category);
+        END
+        """,
+        """
+        CREATE TRIGGER transactions_fts_update
+        AFTER UPDATE OF description, category, user_id ON transactions BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, category)
+            SELECT 'delete', old.user_id * 4294967296 + old.id, old.description,
+                   old.category
+            WHERE old.user_id IS NOT NULL;
+            INSERT INTO transactions_fts (rowid, description, category)
+            SELECT new.user_id * 4294967296 + new.id, new.description, new.category
+            WHERE new.user_id IS NOT NULL;
+        END
+        """,
+        """
+        INSERT INTO transactions_fts (rowid, description, category)
+        SELECT user_id * 4294967296 + id, description, category FROM transactions
+        WHERE user_id IS NOT NULL
+        """,
+    ]),
+    (12, 'Add per-user categorisation rules', [
+        """
+        CREATE TABLE category_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            pattern TEXT NOT NULL,
+            category TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE (user_id, pattern)
+        )
+        """,
+        # Bumped on every rule change so compiled matchers know to recompile
+        'ALTER TABLE users ADD COLUMN rules_version INTEGER NOT NULL DEFAULT 0',
+    ]),
+    (13, 'Track changes for incremental columnar exports', [
+        # New transactions are found by id, past the last exported one. This
+        # log covers what ids cannot: updated and deleted transactions, and
+        # every budget write. period ('YYYY-MM') places a deleted row's marker
+        """
+        CREATE TABLE export_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            user_id INTEGER,
+            period TEXT
+        )
+        """,
+        """
+        CREATE TRIGGER transactions_export_update AFTER UPDATE ON transactions BEGIN
+            INSERT INTO export_changes (table_name, row_id, user_id, period)
+            VALUES ('transactions', old.id, old.user_id, substr(old.date, 1, 7));
+        END
+        """,
+        """
+        CREATE TRIGGER transactions_export_delete AFTER DELETE ON transactions BEGIN
+            INSERT INTO export_changes (table_name, row_id, user_id, period)
+            VALUES ('transactions', old.id, old.user_id, substr(old.date, 1, 7));
+        END
+        """,
+        """
+        CREATE TRIGGER budgets_export_insert AFTER INSERT ON budgets BEGIN
+            INSERT INTO export_changes (table_name, row_id, user_id, period)
+            VALUES ('budgets', new.id, new.user_id,
+                    printf('%04d-%02d', new.year, new.month));
+        END
+        """,
+        """
+        CREATE TRIGGER budgets_export_update AFTER UPDATE ON budgets BEGIN
+            INSERT INTO export_changes (table_name, row_id, user_id, period)
+            VALUES ('budgets', old.id, old.user_id,
+                    printf('%04d-%02d', old.year, old.month));
+        END
+        """,
+        """
+        CREATE TRIGGER budgets_export_delete AFTER DELETE ON budgets BEGIN
+            INSERT INTO export_changes (table_name, row_id, user_id, period)
+            VALUES ('budgets', old.id, old.user_id,
+                    printf('%04d-%02d', old.year, old.month));
+        END
+        """,
+        # One row per completed export: the watermark the next one starts from
+        """
+        CREATE TABLE export_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            target TEXT NOT NULL,
+            user_id INTEGER,
+            snapshot INTEGER NOT NULL,
+            last_transaction_id INTEGER NOT NULL,
+            last_change_seq INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        'CREATE INDEX idx_export_snapshots_target ON export_snapshots (target, user_id)',
+    ]),
+    (14, 'Add recurring transactions', [
+        # occurrences counts the dates materialised so far; next_due is the
+        # date of the next one, or NULL once the rule has ended
+        """
+        CREATE TABLE recurring_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            description TEXT,
+            interval_unit TEXT NOT NULL,
+            interval_count INTEGER NOT NULL DEFAULT 1,
+            start_date TIMESTAMP NOT NULL,
+            end_date TIMESTAMP,
+            next_due TIMESTAMP,
+            occurrences INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        # The scheduler reads only the due end of this index, never every rule
+        """
+        CREATE INDEX idx_recurring_next_due ON recurring_transactions (next_due)
+        WHERE next_due IS NOT NULL
+        """,
+        'CREATE INDEX idx_recurring_user ON recurring_transactions (user_id)',
+        # Each occurrence is inserted at most once, even if a run is repeated
+        'ALTER TABLE transactions ADD COLUMN recurring_id INTEGER',
+        """
+        CREATE UNIQUE INDEX idx_transactions_recurring ON transactions (recurring_id, date)
+        WHERE recurring_id IS NOT NULL
+        """,
+    ]),
+    (15, 'Log export changes only once something has been exported', [
+        # Until the first export records a snapshot, no export can need the
+        # log, so writes skip it and it cannot grow unread
+        'DROP TRIGGER transactions_export_update',
+        'DROP TRIGGER transactions_export_delete',
+        'DROP TRIGGER budgets_export_insert',
+        'DROP TRIGGER budgets_export_update',
+        'DROP TRIGGER budgets_export_delete',
+        """
+        CREATE TRIGGER transactions_export_update AFTER UPDATE ON transactions
+        WHEN EXISTS (SELECT 1 FROM export_snapshots) BEGIN
+            INSERT INTO export_changes (table_name, row_id, user_id, period)
+            VALUES ('transactions', old.id, old.user_id, substr(old.date, 1, 7));
+        END
+        """,
+        """
+        CREATE TRIGGER transactions_export_delete AFTER DELETE ON transactions
+        WHEN EXISTS (SELECT 1 FROM export_snapshots) BEGIN
+            INSERT INTO export_changes (table_name, row_id, user_id, period)
+            VALUES ('transactions', old.id, old.user_id, substr(old.date, 1, 7));
+        END
+        """,
+        """
+        CREATE TRIGGER budgets_export_insert AFTER INSERT ON budgets
+        WHEN EXISTS (SELECT 1 FROM export_snapshots) BEGIN
+            INSERT INTO export_changes (table_name, row_id, user_id, period)
+            VALUES ('budgets', new.id, new.user_id,
+                    printf('%04d-%02d', new.year, new.month));
+        END
+        """,
+        """
+        CREATE TRIGGER budgets_export_update AFTER UPDATE ON budgets
+        WHEN EXISTS (SELECT 1 FROM export_snapshots) BEGIN
+            INSERT INTO export_changes (table_name, row_id, user_id, period)
+            VALUES ('budgets', old.id, old.user_id,
+                    printf('%04d-%02d', old.year, old.month));
+        END
+        """,
+        """
+        CREATE TRIGGER budgets_export_delete AFTER DELETE ON budgets
+        WHEN EXISTS (SELECT 1 FROM export_snapshots) BEGIN
+            INSERT INTO export_changes (table_name, row_id, user_id, period)
+            VALUES ('budgets', old.id, old.user_id,
+                    printf('%04d-%02d', old.year, old.month));
+        END
+        """,
+        'DELETE FROM export_changes WHERE NOT EXISTS (SELECT 1 FROM export_snapshots)',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def _ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def current_version(conn):
+    """Return the highest applied migration version, or 0 for a new database"""
+    _ensure_version_table(conn)
+    return conn.execute(
+        'SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def migrate(conn, target=LATEST_VERSION):
+    """Apply pending migrations in order, each in its own transaction.
+
+    Returns the list of versions applied by this call.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    # PRAGMA user_version mirrors the latest applied version in the database
+    # header, so an up-to-date database is recognised without touching any table
+    if conn.execute('PRAGMA user_version').fetchone()[0] == target:
+        return []
+    version = current_version(conn)
+    if version >= target:
+        conn.execute(f'PRAGMA user_version = {int(version)}')
+        conn.commit()
+        return []
+
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version > target:
+            break
+        # Take the write lock before checking, so concurrent processes
+        # cannot apply the same migration twice
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description))
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
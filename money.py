@@ -0,0 +1,147 @@
+"""Exact money amounts held as integer minor units (cents).
+
+Amounts are stored in INTEGER columns and summed by SQLite as integers, so
+totals never drift the way REAL sums do. Managers return Money values;
+they compare equal to the plain numbers they represent and format like
+Decimals, e.g. f"${amount:,.2f}".
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from functools import total_ordering
+
+DEFAULT_CURRENCY = 'USD'
+CENTS = Decimal('0.01')
+
+def to_cents(value):
+    """Convert a major-unit amount (12.5, '12.50', Decimal, Money) to integer cents.
+
+    Floats go through their shortest repr, so 0.1 + 0.2 becomes 30 cents.
+    Fractions of a cent round half up. Raises ValueError if value is not a number.
+    """
+    if isinstance(value, Money):
+        return value.cents
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value * 100
+    if isinstance(value, float) and -1e9 < value < 1e9:
+        # Fast path: away from a half-cent tie, float rounding error cannot
+        # change the result, so skip the Decimal round trip
+        scaled = value * 100
+        cents = round(scaled)
+        if abs(abs(scaled - cents) - 0.5) > 1e-3:
+            return cents
+    try:
+        amount = Decimal(repr(value) if isinstance(value, float) else str(value).strip())
+    except ArithmeticError:
+        raise ValueError(f"invalid amount {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"invalid amount {value!r}")
+    return int(amount.quantize(CENTS, rounding=ROUND_HALF_UP).scaleb(2))
+
+@total_ordering
+class Money:
+    """An amount of one currency, in integer cents"""
+    __slots__ = ('cents', 'currency')
+
+    def __init__(self, cents=0, currency=DEFAULT_CURRENCY):
+        self.cents = cents
+        self.currency = currency
+
+    @classmethod
+    def parse(cls, value, currency=None):
+        """Build a Money from a major-unit amount; see to_cents"""
+        if isinstance(value, Money):
+            return value
+        return cls(to_cents(value), currency or DEFAULT_CURRENCY)
+
+    def to_decimal(self):
+        return Decimal(self.cents).scaleb(-2)
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __repr__(self):
+        return f"Money('{self}', {self.currency!r})"
+
+    def __str__(self):
+        return str(self.to_decimal())
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec)
+
+    def _other_cents(self, other):
+        """Cents of another Money in the same currency, or of a plain number"""
+        if isinstance(other, Money):
+            if other.currency != self.currency:
+                raise ValueError(f"cannot combine {self.currency} and {other.currency}")
+            return other.cents
+        return to_cents(other)
+
+    def __add__(self, other):
+        if isinstance(other, (Money, int, Decimal, float)):
+            return Money(self.cents + self._other_cents(other), self.currency)
+        return NotImplemented
+
+    __radd__ = __add__  # so sum() can start from 0
+
+    def __sub__(self, other):
+        if isinstance(other, (Money, int, Decimal, float)):
+            return Money(self.cents - self._other_cents(other), self.currency)
+        return NotImplemented
+
+    def __rsub__(self, other):
+        if isinstance(other, (int, Decimal, float)):
+            return Money(to_cents(other) - self.cents, self.currency)
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.cents, self.currency)
+
+    def __abs__(self):
+        return Money(abs(self.cents), self.currency)
+
+    def __mul__(self, factor):
+        """Scale by a number, rounding half up to the cent"""
+        if isinstance(factor, int):
+            return Money(self.cents * factor, self.currency)
+        if isinstance(factor, (Decimal, float)):
+            cents = (Decimal(self.cents) * Decimal(repr(factor) if isinstance(factor, float)
+                                                   else factor))
+            return Money(int(cents.quantize(Decimal(1), rounding=ROUND_HALF_UP)),
+                         self.currency)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        """Money / Money is a plain ratio; Money / n is an amount rounded to the cent"""
+        if isinstance(other, Money):
+            return self.cents / self._other_cents(other)
+        if isinstance(other, (int, Decimal, float)):
+            cents = Decimal(self.cents) / Decimal(repr(other) if isinstance(other, float)
+                                                  else other)
+            return Money(int(cents.quantize(Decimal(1), rounding=ROUND_HALF_UP)),
+                         self.currency)
+        return NotImplemented
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents and self.currency == other.currency
+        if isinstance(other, float):
+            return float(self) == other
+        if isinstance(other, (int, Decimal)):
+            return self.to_decimal() == other
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < self._other_cents(other)
+        if isinstance(other, float):
+            return float(self) < other
+        if isinstance(other, (int, Decimal)):
+            return self.to_decimal() < other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.to_decimal())
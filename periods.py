@@ -0,0 +1,82 @@
+from datetime import date
+
+# Report and budget queries filter with half-open ranges, date >= start AND
+# date < end, so the (user_id, ..., date) indexes can be used. Bounds are
+# 'YYYY-MM-DD' strings, which compare correctly against stored timestamps.
+
+def _first_of(year, month):
+    """First day of a month, normalising month overflow into later years"""
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return date(year, month, 1)
+
+def _range(year, month, months):
+    start = _first_of(year, month)
+    end = _first_of(year, month + months)
+    return start.isoformat(), end.isoformat()
+
+def month_range(year, month):
+    """Return the (start, end) bounds of a calendar month"""
+    if not 1 <= month <= 12:
+        raise ValueError(f"Invalid month: {month}")
+    return _range(year, month, 1)
+
+def quarter_range(year, quarter):
+    """Return the (start, end) bounds of a calendar quarter (1-4)"""
+    if not 1 <= quarter <= 4:
+        raise ValueError(f"Invalid quarter: {quarter}")
+    return _range(year, (quarter - 1) * 3 + 1, 3)
+
+def year_range(year):
+    """Return the (start, end) bounds of a calendar year"""
+    return _range(year, 1, 12)
+
+def fiscal_year_range(year, start_month=1):
+    """Return the (start, end) bounds of a fiscal year.
+
+    Fiscal years are named by the calendar year they start in, so with
+    start_month=4 fiscal year 2024 runs from 2024-04-01 up to 2025-04-01.
+    """
+    if not 1 <= start_month <= 12:
+        raise ValueError(f"Invalid fiscal start month: {start_month}")
+    return _range(year, start_month, 12)
+
+def period_range(period, year, number=None, fiscal_start_month=1):
+    """Return (start, end) bounds for 'month', 'quarter', 'year' or 'fiscal_year'"""
+    if period == 'month':
+        return month_range(year, number)
+    if period == 'quarter':
+        return quarter_range(year, number)
+    if period == 'year':
+        return year_range(year)
+    if period == 'fiscal_year':
+        return fiscal_year_range(year, fiscal_start_month)
+    raise ValueError(f"Unknown period: {period}")
+
+def month_start_of(value):
+    """Return (year, month) if value is exactly the start of a month, else None.
+
+    Accepts 'YYYY-MM-01' or 'YYYY-MM-01 00:00:00'.
+    """
+    if not isinstance(value, str) or value[7:] not in ('-01', '-01 00:00:00'):
+        return None
+    try:
+        return date.fromisoformat(value[:10]).year, int(value[5:7])
+    except ValueError:
+        return None
+
+def month_end_of(value):
+    """Return (year, month) if value is the last second of a month, else None.
+
+    Only 'YYYY-MM-DD 23:59:59' on a month's final day qualifies, since an
+    inclusive bound of 'YYYY-MM-DD' excludes that day's later timestamps.
+    """
+    if not isinstance(value, str) or value[10:] != ' 23:59:59':
+        return None
+    try:
+        day = date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+    if _first_of(day.year, day.month + 1).toordinal() - day.toordinal() != 1:
+        return None
+    return day.year, day.month
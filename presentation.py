@@ -0,0 +1,130 @@
+# Text rendering for the CLI and GUI. Managers return plain data; only callers
+# that want a table pay for string formatting, and for importing tabulate.
+
+TRANSACTION_HEADERS = ['ID', 'User ID', 'Type', 'Category', 'Amount',
+                       'Description', 'Date']
+
+def render_table(rows, headers):
+    """Render rows as a grid table; amounts are passed in already formatted"""
+    from tabulate import tabulate
+    return tabulate(rows, headers=headers, tablefmt='grid', floatfmt='.2f')
+
+def render_transactions(transactions):
+    """Render Transaction rows (any iterable) as a grid table"""
+    rows = [
+        [t.id, t.user_id, t.type, t.category, format_money(t.amount), t.description,
+         t.date]
+        for t in transactions
+    ]
+    return render_table(rows, TRANSACTION_HEADERS)
+
+def render_budgets(budgets):
+    """Render (category, amount, month, year) budget rows"""
+    rows = [[category, format_money(amount), month, year]
+            for category, amount, month, year in budgets]
+    return render_table(rows, ['Category', 'Budget Amount', 'Month', 'Year'])
+
+def render_rules(rules):
+    """Render CategoryRule rows"""
+    return render_table(rules, ['ID', 'Pattern', 'Category', 'Priority'])
+
+def render_recurring(rules):
+    """Render RecurringTransaction rows"""
+    rows = [
+        [r.id, r.type, r.category, format_money(r.amount), r.description or '',
+         f"every {r.interval_count} {r.interval_unit}{'s' if r.interval_count > 1 else ''}",
+         r.start_date[:10], (r.end_date or '')[:10], (r.next_due or 'ended')[:10]]
+        for r in rules
+    ]
+    return render_table(rows, ['ID', 'Type', 'Category', 'Amount', 'Description',
+                               'Repeats', 'Start', 'End', 'Next Due'])
+
+def _status_label(status):
+    return 'EXCEEDED!' if status.exceeded else 'Within budget'
+
+def render_budget_status(statuses):
+    """Render BudgetStatus records for a single month"""
+    rows = [
+        [s.category, format_money(s.budget), format_money(s.spent),
+         f"{s.percentage:.1f}%", _status_label(s)]
+        for s in statuses
+    ]
+    return render_table(rows, ['Category', 'Budget', 'Spent', 'Used %', 'Status'])
+
+def render_budget_history(statuses):
+    """Render BudgetStatus records spanning several months"""
+    rows = [
+        [f"{s.year}-{s.month:02d}", s.category, format_money(s.budget),
+         format_money(s.spent), f"{s.percentage:.1f}%", _status_label(s)]
+        for s in statuses
+    ]
+    return render_table(rows, ['Month', 'Category', 'Budget', 'Spent', 'Used %',
+                               'Status'])
+
+CURRENCY_SYMBOLS = {'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥'}
+
+def format_money(amount):
+    """Format a Money as '$12.50', or '12.50 CHF' for currencies without a symbol"""
+    symbol = CURRENCY_SYMBOLS.get(getattr(amount, 'currency', 'USD'))
+    return f"{symbol}{amount:.2f}" if symbol else f"{amount:.2f} {amount.currency}"
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+
+def _totals_header(title, income, expenses):
+    report = f"\n{title}\n"
+    report += "=" * 40 + "\n\n"
+    report += f"Total Income: {format_money(income)}\n"
+    report += f"Total Expenses: {format_money(expenses)}\n"
+    report += f"Net Savings: {format_money(income - expenses)}\n\n"
+    return report
+
+def render_monthly_report(summary):
+    """Render a reports.MonthlySummary"""
+    report = _totals_header(
+        f"Monthly Financial Report - {summary.month}/{summary.year}",
+        summary.income, summary.expenses)
+
+    if summary.expenses_by_category:
+        expenses = summary.expenses
+        expense_data = [
+            [category, format_money(amount),
+             f"{(amount/expenses*100):.1f}%" if expenses > 0 else "0%"]
+            for category, amount in summary.expenses_by_category
+        ]
+        report += "Expenses Breakdown:\n"
+        report += render_table(expense_data, ['Category', 'Amount', 'Percentage'])
+    return report
+
+def render_yearly_report(summary):
+    """Render a reports.YearlySummary"""
+    if summary.fiscal_start_month == 1:
+        title = f"Yearly Financial Report - {summary.year}"
+    else:
+        title = f"Fiscal Year Report - {summary.start} to {summary.end}"
+    report = _totals_header(title, summary.income, summary.expenses)
+
+    if summary.months:
+        monthly_breakdown = [
+            [MONTH_NAMES[int(month[5:7]) - 1],
+             format_money(income),
+             format_money(expenses),
+             format_money(income - expenses)]
+            for month, income, expenses in summary.months
+        ]
+        report += "Monthly Breakdown:\n"
+        report += render_table(monthly_breakdown,
+                               ['Month', 'Income', 'Expenses', 'Savings'])
+    return report
+
+def render_category_analysis(categories):
+    """Render reports.CategoryStats rows"""
+    if not categories:
+        return "No transaction data available for analysis."
+    analysis_data = [
+        [s.category, s.count, format_money(s.total), format_money(s.average),
+         format_money(s.minimum), format_money(s.maximum)]
+        for s in categories
+    ]
+    return render_table(analysis_data, ['Category', 'Count', 'Total', 'Average',
+                                        'Minimum', 'Maximum'])
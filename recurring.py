@@ -0,0 +1,233 @@
+"""Recurring transactions, such as rent, salaries and subscriptions.
+
+A recurring rule repeats a transaction every N days, weeks, months or years
+from its start date, optionally up to an end date (inclusive, by day).
+Monthly and yearly rules keep the start date's day, clamped to short
+months: a rule starting on 31 January falls on 29 February in 2024 and on
+31 March again.
+
+run_scheduler materialises every due occurrence, for every user, as
+ordinary transactions. It reads only due rules through the index on
+next_due, and writes each batch of occurrences in one transaction together
+with their rules' new next_due, so a rerun finds nothing left to do and a
+run after downtime catches up on every missed occurrence:
+
+    RecurringManager(db_path).run_scheduler()  # -> {'rules': 3, 'transactions': 5}
+"""
+import calendar
+import sqlite3
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from cache import get_cache
+from database import get_pool
+from defaults import DEFAULT_SCHEDULER_BATCH_SIZE, INTERVAL_UNITS
+from fx import base_currency
+from money import Money
+from rollups import RollupDelta
+from transactions import (current_timestamp, deferred_search_index, normalize_date,
+                          validate_row)
+
+INSERT_OCCURRENCE = """
+    INSERT INTO transactions
+        (user_id, type, category, amount_cents, description, date, currency, recurring_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT DO NOTHING
+"""
+
+class RecurringTransaction(NamedTuple):
+    """One row of the recurring_transactions table"""
+    id: int
+    type: str
+    category: str
+    amount: Money
+    description: Optional[str]
+    interval_unit: str
+    interval_count: int
+    start_date: str
+    end_date: Optional[str]
+    next_due: Optional[str]
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from a row selected with RECURRING_COLUMNS"""
+        id, type, category, cents, currency, *rest = row
+        return cls(id, type, category, Money(cents, currency), *rest)
+
+RECURRING_COLUMNS = ('id, type, category, amount_cents, currency, description, '
+                     'interval_unit, interval_count, start_date, end_date, next_due')
+
+def occurrence_date(start, unit, every, n):
+    """The date of occurrence n (0 for the first) of a rule, as stored text"""
+    start = datetime.fromisoformat(start)
+    if unit == 'day':
+        return (start + timedelta(days=every * n)).isoformat(' ')
+    if unit == 'week':
+        return (start + timedelta(weeks=every * n)).isoformat(' ')
+    months = start.month - 1 + every * n * (12 if unit == 'year' else 1)
+    year, month = start.year + months // 12, months % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return start.replace(year=year, month=month, day=day).isoformat(' ')
+
+def _next_due(rule_start, unit, every, end_date, n):
+    """Occurrence n, or None if it falls after end_date"""
+    due = occurrence_date(rule_start, unit, every, n)
+    return None if end_date and due[:10] > end_date[:10] else due
+
+class RecurringManager:
+    def __init__(self, db_path='finance.db'):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self.cache = get_cache(db_path)
+
+    def add_recurring(self, user_id, type, category, amount, description=None,
+                      interval='month', every=1, start_date=None, end_date=None,
+                      currency=None):
+        """Add a recurring transaction, first due on start_date (now by default).
+
+        The currency defaults to the user's base currency. Occurrences already
+        due are materialised by the next scheduler run.
+        """
+        conn = self.pool.acquire()
+        try:
+            if interval not in INTERVAL_UNITS:
+                raise ValueError(f"invalid interval {interval!r}")
+            if int(every) < 1:
+                raise ValueError(f"every must be at least 1, got {every!r}")
+            type, category, cents, description, start_date, currency = validate_row(
+                (type, category, amount, description, start_date, currency),
+                base_currency(conn, user_id))
+            start_date = start_date or current_timestamp()
+            try:
+                end_date = normalize_date(end_date)
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid end date {end_date!r}")
+            if end_date and end_date[:10] < start_date[:10]:
+                raise ValueError("end date is before the start date")
+            conn.execute("""
+                INSERT INTO recurring_transactions
+                    (user_id, type, category, amount_cents, currency, description,
+                     interval_unit, interval_count, start_date, end_date, next_due)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, type, category, cents, currency, description, interval,
+                  int(every), start_date, end_date, start_date))
+            conn.commit()
+            return True
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error adding recurring transaction: {e}")
+            return False
+        finally:
+            self.pool.release(conn)
+
+    def delete_recurring(self, user_id, recurring_id):
+        """Stop a recurring transaction; occurrences already added are kept"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute(
+                'DELETE FROM recurring_transactions WHERE id = ? AND user_id = ?',
+                (recurring_id, user_id))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            print(f"Error deleting recurring transaction: {e}")
+            return False
+        finally:
+            self.pool.release(conn)
+
+    def get_recurring(self, user_id):
+        """Return a user's recurring transactions, soonest due first, or None on error"""
+        conn = self.pool.acquire()
+        try:
+            return [RecurringTransaction.from_row(row) for row in conn.execute(f"""
+                SELECT {RECURRING_COLUMNS} FROM recurring_transactions
+                WHERE user_id = ?
+                ORDER BY next_due IS NULL, next_due, id
+            """, (user_id,))]
+        except sqlite3.Error as e:
+            print(f"Error retrieving recurring transactions: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
+
+    def run_scheduler(self, as_of=None, batch_size=DEFAULT_SCHEDULER_BATCH_SIZE):
+        """Add every occurrence due by as_of (now by default), for all users.
+
+        Occurrences are added batch_size at a time, each batch in one write
+        transaction; a rule with more due than fit is left due, with its
+        progress saved, and continued in the next batch. Returns a dict with
+        the number of 'rules' that were due and of 'transactions' added, or
+        None on error.
+        """
+        result = {'rules': 0, 'transactions': 0}
+        conn = self.pool.acquire()
+        try:
+            as_of = normalize_date(as_of) or current_timestamp()
+            while True:
+                # IMMEDIATE takes the write lock before reading, so concurrent
+                # runs cannot both materialise the same due rules
+                conn.execute('BEGIN IMMEDIATE')
+                rules = conn.execute("""
+                    SELECT id, user_id, type, category, amount_cents, currency,
+                           description, interval_unit, interval_count, start_date,
+                           end_date, next_due, occurrences
+                    FROM recurring_transactions
+                    WHERE next_due <= ?
+                    ORDER BY next_due
+                    LIMIT ?
+                """, (as_of, batch_size)).fetchall()
+                if not rules:
+                    conn.rollback()
+                    return result
+
+                rows = []
+                updates = []
+                finished = 0
+                for (id, user_id, type, category, cents, currency, description, unit,
+                     every, start, end, due, n) in rules:
+                    # Catch up on every occurrence missed since the last run, up
+                    # to the batch size; the rest wait for the next batch
+                    while due is not None and due <= as_of and len(rows) < batch_size:
+                        rows.append((user_id, type, category, cents, description, due,
+                                     currency, id))
+                        n += 1
+                        due = _next_due(start, unit, every, end, n)
+                    updates.append((due, n, id))
+                    if due is None or due > as_of:
+                        finished += 1
+                    if len(rows) >= batch_size:
+                        break
+                # In user and date order the index and search index writes are
+                # sequential rather than scattered across every user's entries
+                rows.sort(key=lambda row: (row[0], row[5]))
+
+                last_id = conn.execute(
+                    'SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+                with deferred_search_index(conn):
+                    added = conn.executemany(INSERT_OCCURRENCE, rows).rowcount
+                conn.executemany("""
+                    UPDATE recurring_transactions SET next_due = ?, occurrences = ?
+                    WHERE id = ?
+                """, updates)
+                delta = RollupDelta()
+                if added == len(rows):
+                    for user_id, type, category, cents, _, date, currency, _ in rows:
+                        delta.add(user_id, type, category, cents, date, currency)
+                else:
+                    # Some occurrences already existed; count only the new rows
+                    for row in conn.execute("""
+                        SELECT user_id, type, category, amount_cents, date, currency
+                        FROM transactions WHERE id > ?
+                    """, (last_id,)):
+                        delta.add(*row)
+                touched = delta.touched()
+                delta.apply(conn)
+                conn.commit()
+                self.cache.invalidate_months(touched)
+                result['rules'] += finished
+                result['transactions'] += added
+        except (sqlite3.Error, ValueError) as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"Error running recurring transactions: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
@@ -1,10 +1,194 @@
 import sqlite3
 from datetime import datetime
-from tabulate import tabulate
+from typing import NamedTuple
+from cache import get_cache, month_number, month_span
+from database import get_pool
+from fx import FxManager, MissingRateError, base_currency, month_end
+from money import DEFAULT_CURRENCY, Money
+from periods import (month_range, year_range, fiscal_year_range, month_start_of,
+                     month_end_of)
+from presentation import (render_monthly_report, render_yearly_report,
+                          render_category_analysis)
+
+class PeriodTotal(NamedTuple):
+    """Aggregates for one (month, type, category) group of transactions"""
+    month: str  # 'YYYY-MM'
+    type: str
+    category: str
+    count: int
+    total: Money
+    minimum: Money
+    maximum: Money
+
+    @classmethod
+    def from_row(cls, row, currency=DEFAULT_CURRENCY):
+        """Build from a row whose amounts are in cents"""
+        month, type, category, count, total, minimum, maximum = row
+        return cls(month, type, category, count, Money(total, currency),
+                   Money(minimum, currency), Money(maximum, currency))
+
+class MonthlySummary(NamedTuple):
+    year: int
+    month: int
+    income: Money
+    expenses: Money
+    expenses_by_category: list  # [(category, total)]
+
+class YearlySummary(NamedTuple):
+    year: int
+    start: str
+    end: str
+    fiscal_start_month: int
+    income: Money
+    expenses: Money
+    months: list  # [('YYYY-MM', income, expenses)]
+
+class CategoryStats(NamedTuple):
+    category: str
+    count: int
+    total: Money
+    average: Money
+    minimum: Money
+    maximum: Money
+
+    @classmethod
+    def from_row(cls, row, currency=DEFAULT_CURRENCY):
+        """Build from (category, count, total, minimum, maximum) with amounts in cents"""
+        category, count, total, minimum, maximum = row
+        total = Money(total, currency)
+        return cls(category, count, total, total / count, Money(minimum, currency),
+                   Money(maximum, currency))
+
+def convert_groups(rows, currency, factor, by_month=True):
+    """Merge per-currency aggregate rows into groups in one currency.
+
+    rows are ('YYYY-MM', key..., currency, count, total, minimum, maximum),
+    amounts in cents. Each row is converted at its month-end rate, using
+    factor(currency, date) from FxManager.rate_to, then rows sharing a key (and
+    month, if by_month) are combined. Returns {key: [count, total, minimum, maximum]}.
+    """
+    groups = {}
+    for month, *key, source, count, total, minimum, maximum in rows:
+        if source != currency:
+            rate = factor(source, month_end(month))
+            total = round(total * rate)
+            minimum = round(minimum * rate)
+            maximum = round(maximum * rate)
+        key = (month, *key) if by_month else tuple(key)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [count, total, minimum, maximum]
+        else:
+            group[0] += count
+            group[1] += total
+            group[2] = min(group[2], minimum)
+            group[3] = max(group[3], maximum)
+    return groups
+
+def _zero(totals):
+    """Money(0) in the currency of a list of PeriodTotal rows"""
+    return Money(0, totals[0].total.currency if totals else DEFAULT_CURRENCY)
+
+def summarize_month(totals, year, month):
+    """Derive a MonthlySummary from PeriodTotal rows"""
+    key = f"{year}-{month:02d}"
+    income = expenses = _zero(totals)
+    by_category = {}
+    for row in totals:
+        if row.month != key:
+            continue
+        if row.type == 'income':
+            income += row.total
+        elif row.type == 'expense':
+            expenses += row.total
+            by_category[row.category] = by_category.get(row.category, 0) + row.total
+    return MonthlySummary(year, month, income, expenses, sorted(by_category.items()))
+
+def summarize_year(totals, year, start, end, fiscal_start_month=1):
+    """Derive a YearlySummary from PeriodTotal rows"""
+    zero = _zero(totals)
+    months = {}
+    for row in totals:
+        income, expenses = months.get(row.month, (zero, zero))
+        if row.type == 'income':
+            income += row.total
+        elif row.type == 'expense':
+            expenses += row.total
+        months[row.month] = (income, expenses)
+    breakdown = [(month, income, expenses)
+                 for month, (income, expenses) in sorted(months.items())]
+    return YearlySummary(year, start, end, fiscal_start_month,
+                         sum((row[1] for row in breakdown), zero),
+                         sum((row[2] for row in breakdown), zero), breakdown)
+
+def summarize_categories(totals):
+    """Derive per-category expense CategoryStats from PeriodTotal rows"""
+    stats = {}
+    for row in totals:
+        if row.type != 'expense':
+            continue
+        current = stats.get(row.category)
+        if current is None:
+            stats[row.category] = [row.count, row.total, row.minimum, row.maximum]
+        else:
+            current[0] += row.count
+            current[1] += row.total
+            current[2] = min(current[2], row.minimum)
+            current[3] = max(current[3], row.maximum)
+    result = [CategoryStats(category, count, total, total / count, minimum, maximum)
+              for category, (count, total, minimum, maximum) in stats.items()]
+    result.sort(key=lambda s: s.total, reverse=True)
+    return result
 
 class ReportGenerator:
     def __init__(self, db_path='finance.db'):
         self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self.cache = get_cache(db_path)
+        self.fx = FxManager(db_path)
+
+    def get_period_totals(self, user_id, start, end):
+        """Read PeriodTotal rows for [start, end).
+
+        Monthly, yearly and category reports are all derived from this one
+        intermediate result. Whole-month periods are read from the
+        monthly_category_totals rollup; anything else scans transactions.
+        Amounts are in the user's base currency, converted per month and
+        currency at the month-end rate.
+        """
+        return self.cache.get_or_compute(
+            user_id, 'period_totals', month_span(start, end), (start, end),
+            lambda: self._read_period_totals(user_id, start, end))
+
+    def _read_period_totals(self, user_id, start, end):
+        first = month_start_of(start)
+        last = month_start_of(end)
+        conn = self.pool.acquire()
+        try:
+            base = base_currency(conn, user_id)
+            if first and last:
+                rows = conn.execute("""
+                    SELECT printf('%04d-%02d', year, month), type, category,
+                           currency, count, total, minimum, maximum
+                    FROM monthly_category_totals
+                    WHERE user_id = ? AND (year, month) >= (?, ?)
+                    AND (year, month) < (?, ?)
+                """, (user_id, *first, *last)).fetchall()
+            else:
+                rows = conn.execute("""
+                    SELECT substr(date, 1, 7) AS month, type, category, currency,
+                           COUNT(*), SUM(amount_cents), MIN(amount_cents),
+                           MAX(amount_cents)
+                    FROM transactions
+                    WHERE user_id = ? AND type IN ('income', 'expense')
+                    AND date >= ? AND date < ?
+                    GROUP BY month, type, category, currency
+                """, (user_id, start, end)).fetchall()
+            groups = convert_groups(rows, base, self.fx.rate_to(base))
+            return [PeriodTotal.from_row(key + tuple(group), base)
+                    for key, group in groups.items()]
+        finally:
+            self.pool.release(conn)
 
     def generate_monthly_report(self, user_id, month=None, year=None):
         """Generate a monthly financial report"""
@@ -12,182 +196,148 @@ class ReportGenerator:
             current_date = datetime.now()
             month = month or current_date.month
             year = year or current_date.year
+        current = month_number(year, month)
+        return self.cache.get_or_compute(
+            user_id, 'monthly_report', (current, current), (),
+            lambda: self._monthly_report(user_id, month, year))
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
+    def _monthly_report(self, user_id, month, year):
         try:
-            # Get total income
-            cursor.execute("""
-                SELECT COALESCE(SUM(amount), 0) 
-                FROM transactions 
-                WHERE user_id = ? 
-                AND type = 'income' 
-                AND strftime('%m', date) = ? 
-                AND strftime('%Y', date) = ?
-            """, (user_id, str(month).zfill(2), str(year)))
-            total_income = cursor.fetchone()[0]
-
-            # Get total expenses
-            cursor.execute("""
-                SELECT COALESCE(SUM(amount), 0) 
-                FROM transactions 
-                WHERE user_id = ? 
-                AND type = 'expense' 
-                AND strftime('%m', date) = ? 
-                AND strftime('%Y', date) = ?
-            """, (user_id, str(month).zfill(2), str(year)))
-            total_expenses = cursor.fetchone()[0]
-
-            # Get expenses by category
-            cursor.execute("""
-                SELECT category, SUM(amount) 
-                FROM transactions 
-                WHERE user_id = ? 
-                AND type = 'expense' 
-                AND strftime('%m', date) = ? 
-                AND strftime('%Y', date) = ? 
-                GROUP BY category
-            """, (user_id, str(month).zfill(2), str(year)))
-            expenses_by_category = cursor.fetchall()
-
-            # Format the report
-            report = f"\nMonthly Financial Report - {month}/{year}\n"
-            report += "=" * 40 + "\n\n"
-            report += f"Total Income: ${total_income:.2f}\n"
-            report += f"Total Expenses: ${total_expenses:.2f}\n"
-            report += f"Net Savings: ${(total_income - total_expenses):.2f}\n\n"
-
-            # Add expenses breakdown
-            if expenses_by_category:
-                expense_data = [
-                    [category, f"${amount:.2f}", 
-                     f"{(amount/total_expenses*100):.1f}%" if total_expenses > 0 else "0%"]
-                    for category, amount in expenses_by_category
-                ]
-                report += "Expenses Breakdown:\n"
-                report += tabulate(expense_data, 
-                                 headers=['Category', 'Amount', 'Percentage'], 
-                                 tablefmt='grid')
-
-            return report
-
-        except sqlite3.Error as e:
+            totals = self.get_period_totals(user_id, *month_range(year, month))
+        except (sqlite3.Error, MissingRateError) as e:
             print(f"Error generating monthly report: {e}")
             return None
-        finally:
-            conn.close()
+        return render_monthly_report(summarize_month(totals, year, month))
 
-    def generate_yearly_report(self, user_id, year=None):
-        """Generate a yearly financial report"""
+    def generate_yearly_report(self, user_id, year=None, fiscal_start_month=1):
+        """Generate a yearly financial report, optionally for a fiscal year"""
         if not year:
             year = datetime.now().year
+        start, end = fiscal_year_range(year, fiscal_start_month)
+        return self.cache.get_or_compute(
+            user_id, 'yearly_report', month_span(start, end), (),
+            lambda: self._yearly_report(user_id, year, start, end, fiscal_start_month))
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
+    def _yearly_report(self, user_id, year, start, end, fiscal_start_month):
         try:
-            # Get monthly totals
-            cursor.execute("""
-                SELECT 
-                    strftime('%m', date) as month,
-                    SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as income,
-                    SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as expenses
-                FROM transactions 
-                WHERE user_id = ? AND strftime('%Y', date) = ? 
-                GROUP BY month 
-                ORDER BY month
-            """, (user_id, str(year)))
-            monthly_data = cursor.fetchall()
-
-            # Get yearly totals
-            cursor.execute("""
-                SELECT 
-                    SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as total_income,
-                    SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as total_expenses
-                FROM transactions 
-                WHERE user_id = ? AND strftime('%Y', date) = ?
-            """, (user_id, str(year)))
-            yearly_totals = cursor.fetchone()
-            total_income, total_expenses = yearly_totals
-
-            # Format the report
-            report = f"\nYearly Financial Report - {year}\n"
-            report += "=" * 40 + "\n\n"
-            report += f"Total Income: ${total_income:.2f}\n"
-            report += f"Total Expenses: ${total_expenses:.2f}\n"
-            report += f"Net Savings: ${(total_income - total_expenses):.2f}\n\n"
-
-            # Add monthly breakdown
-            if monthly_data:
-                month_names = ['January', 'February', 'March', 'April', 'May', 'June',
-                             'July', 'August', 'September', 'October', 'November', 
-                             'December']
-                monthly_breakdown = [
-                    [month_names[int(month)-1], 
-                     f"${income:.2f}", 
-                     f"${expenses:.2f}", 
-                     f"${income - expenses:.2f}"]
-                    for month, income, expenses in monthly_data
-                ]
-                report += "Monthly Breakdown:\n"
-                report += tabulate(monthly_breakdown, 
-                                 headers=['Month', 'Income', 'Expenses', 'Savings'], 
-                                 tablefmt='grid')
-
-            return report
-
-        except sqlite3.Error as e:
+            totals = self.get_period_totals(user_id, start, end)
+        except (sqlite3.Error, MissingRateError) as e:
             print(f"Error generating yearly report: {e}")
             return None
-        finally:
-            conn.close()
+        return render_yearly_report(
+            summarize_year(totals, year, start, end, fiscal_start_month))
+
+    def generate_report_bundle(self, user_id, month=None, year=None):
+        """Generate the monthly, yearly and category reports from one read.
+
+        Returns a dict with 'monthly', 'yearly' and 'category_analysis'
+        reports; the category analysis covers the whole year.
+        """
+        if not month or not year:
+            current_date = datetime.now()
+            month = month or current_date.month
+            year = year or current_date.year
+        start, end = year_range(year)
+        return self.cache.get_or_compute(
+            user_id, 'report_bundle', month_span(start, end), (month,),
+            lambda: self._report_bundle(user_id, month, year, start, end))
+
+    def _report_bundle(self, user_id, month, year, start, end):
+        try:
+            totals = self.get_period_totals(user_id, start, end)
+        except (sqlite3.Error, MissingRateError) as e:
+            print(f"Error generating report bundle: {e}")
+            return None
+        return {
+            'monthly': render_monthly_report(summarize_month(totals, year, month)),
+            'yearly': render_yearly_report(summarize_year(totals, year, start, end)),
+            'category_analysis': render_category_analysis(summarize_categories(totals)),
+        }
 
     def generate_category_analysis(self, user_id, start_date=None, end_date=None):
         """Generate a detailed analysis of spending by category"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self.cache.get_or_compute(
+            user_id, 'category_analysis',
+            month_span(start_date, end_date, end_exclusive=False), (start_date, end_date),
+            lambda: self._category_analysis(user_id, start_date, end_date))
 
+    def _category_analysis(self, user_id, start_date, end_date):
+        first = month_start_of(start_date) if start_date else ()
+        last = month_end_of(end_date) if end_date else ()
+        if first is not None and last is not None:
+            return self._category_analysis_from_rollup(user_id, first, last)
+
+        # Rows in the base currency are summed over the whole period; other
+        # currencies are kept apart per month so each converts at its own rate
         query = """
-            SELECT 
+            SELECT
+                MAX(substr(date, 1, 7)),
                 category,
+                currency,
                 COUNT(*) as transaction_count,
-                SUM(amount) as total_amount,
-                AVG(amount) as avg_amount,
-                MIN(amount) as min_amount,
-                MAX(amount) as max_amount
-            FROM transactions 
-            WHERE user_id = ? AND type = 'expense'
+                SUM(amount_cents) as total_amount,
+                MIN(amount_cents) as min_amount,
+                MAX(amount_cents) as max_amount
+            FROM transactions
+            WHERE user_id = ?1 AND type = 'expense'
         """
-        params = [user_id]
+        params = []
 
         if start_date:
-            query += " AND date >= ?"
             params.append(start_date)
+            query += f" AND date >= ?{len(params) + 2}"
         if end_date:
-            query += " AND date <= ?"
             params.append(end_date)
+            query += f" AND date <= ?{len(params) + 2}"
 
-        query += " GROUP BY category ORDER BY total_amount DESC"
+        query += """
+            GROUP BY category, currency,
+                     CASE WHEN currency = ?2 THEN '' ELSE substr(date, 1, 7) END
+        """
+        return self._category_stats(user_id, query, params)
 
+    def _category_analysis_from_rollup(self, user_id, first, last):
+        """Category analysis over whole months, (year, month) bounds inclusive"""
+        bounds = ""
+        params = []
+        # Numbered, since both halves of the query share the bounds
+        for operator, bound in (('>=', first), ('<=', last)):
+            if bound:
+                bounds += (f" AND (year, month) {operator} "
+                           f"(?{len(params) + 3}, ?{len(params) + 4})")
+                params.extend(bound)
+        # Base-currency groups are summed in SQL; other currencies come back one
+        # row per month, already aggregated by the rollup, to convert in Python
+        query = f"""
+            SELECT '', category, currency, SUM(count), SUM(total), MIN(minimum),
+                   MAX(maximum)
+            FROM monthly_category_totals
+            WHERE user_id = ?1 AND type = 'expense' AND currency = ?2 {bounds}
+            GROUP BY category
+            UNION ALL
+            SELECT printf('%04d-%02d', year, month), category, currency, count, total,
+                   minimum, maximum
+            FROM monthly_category_totals
+            WHERE user_id = ?1 AND type = 'expense' AND currency != ?2 {bounds}
+        """
+        return self._category_stats(user_id, query, params)
+
+    def _category_stats(self, user_id, query, params):
+        """Run a per-currency category query and render it in the base currency.
+
+        The query takes the user id and base currency as ?1 and ?2, followed by params.
+        """
+        conn = self.pool.acquire()
         try:
-            cursor.execute(query, params)
-            categories = cursor.fetchall()
-
-            if categories:
-                analysis_data = [
-                    [category, count, f"${total:.2f}", 
-                     f"${avg:.2f}", f"${min:.2f}", f"${max:.2f}"]
-                    for category, count, total, avg, min, max in categories
-                ]
-                return tabulate(analysis_data, 
-                               headers=['Category', 'Count', 'Total', 'Average', 
-                                       'Minimum', 'Maximum'], 
-                               tablefmt='grid')
-            return "No transaction data available for analysis."
-
-        except sqlite3.Error as e:
+            base = base_currency(conn, user_id)
+            rows = conn.execute(query, [user_id, base] + params).fetchall()
+            groups = convert_groups(rows, base, self.fx.rate_to(base), by_month=False)
+            categories = [CategoryStats.from_row(key + tuple(group), base)
+                          for key, group in groups.items()]
+            categories.sort(key=lambda s: s.total, reverse=True)
+            return render_category_analysis(categories)
+        except (sqlite3.Error, MissingRateError) as e:
             print(f"Error generating category analysis: {e}")
             return None
         finally:
-            conn.close()
\ No newline at end of file
+            self.pool.release(conn)
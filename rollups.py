@@ -0,0 +1,210 @@
+# Materialised aggregates kept current by TransactionManager inside the same
+# database transaction as each write, so balances and monthly totals never
+# need a scan over a user's full history. Maintaining them from Python lets a
+# bulk import apply one upsert per touched month instead of a trigger per row.
+# Like transactions.amount_cents, every rollup amount is in integer cents, and
+# every rollup is keyed by currency so reports can convert each one apart.
+
+from money import DEFAULT_CURRENCY
+from periods import month_range
+
+class RollupDelta:
+    """Accumulates signed changes to the rollup tables to apply in one go"""
+
+    def __init__(self):
+        self.months = {}      # (user_id, 'YYYY-MM', currency) -> [income, expenses]
+        self.categories = {}  # (user_id, 'YYYY-MM', type, category, currency) -> group
+
+    def add(self, user_id, type, category, amount, date, currency=DEFAULT_CURRENCY,
+            sign=1):
+        """Record a row, amount in cents, with a stored 'YYYY-MM-DD ...' date"""
+        if type not in ('income', 'expense'):
+            return
+        month = date[:7]
+        totals = self.months.get((user_id, month, currency))
+        if totals is None:
+            totals = self.months[(user_id, month, currency)] = [0, 0]
+        totals[0 if type == 'income' else 1] += sign * amount
+
+        key = (user_id, month, type, category, currency)
+        group = self.categories.get(key)
+        if group is None:
+            group = self.categories[key] = [0, 0, None, None, False]
+        group[0] += sign
+        group[1] += sign * amount
+        if sign > 0:
+            group[2] = amount if group[2] is None else min(group[2], amount)
+            group[3] = amount if group[3] is None else max(group[3], amount)
+        else:
+            # Min/max cannot be un-applied; recompute the group afterwards
+            group[4] = True
+
+    def remove(self, user_id, type, category, amount, date, currency=DEFAULT_CURRENCY):
+        self.add(user_id, type, category, amount, date, currency, sign=-1)
+
+    def touched(self):
+        """Return {user_id: set of month numbers} for cache invalidation"""
+        touched = {}
+        for user_id, month, _ in self.months:
+            touched.setdefault(user_id, set()).add(int(month[0:4]) * 12 + int(month[5:7]) - 1)
+        return touched
+
+    def apply(self, conn):
+        """Upsert the accumulated changes; the caller commits"""
+        if not self.months:
+            return
+        months = []
+        users = {}
+        for (user_id, month, currency), (income, expenses) in self.months.items():
+            months.append((user_id, int(month[0:4]), int(month[5:7]), currency,
+                           income, expenses))
+            user_totals = users.setdefault((user_id, currency), [0, 0])
+            user_totals[0] += income
+            user_totals[1] += expenses
+
+        conn.executemany("""
+            INSERT INTO monthly_totals (user_id, year, month, currency, income, expenses)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, year, month, currency) DO UPDATE SET
+                income = income + excluded.income,
+                expenses = expenses + excluded.expenses
+        """, months)
+        conn.executemany("""
+            INSERT INTO user_balances (user_id, currency, income, expenses)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, currency) DO UPDATE SET
+                income = income + excluded.income,
+                expenses = expenses + excluded.expenses
+        """, [key + tuple(totals) for key, totals in users.items()])
+
+        groups = []
+        recompute = []
+        for (user_id, month, type, category, currency), (count, total, minimum, maximum,
+                                                        removed) in self.categories.items():
+            key = (user_id, int(month[0:4]), int(month[5:7]), type, category, currency)
+            groups.append(key + (count, total, minimum, maximum))
+            if removed:
+                recompute.append(key)
+        conn.executemany("""
+            INSERT INTO monthly_category_totals
+                (user_id, year, month, type, category, currency,
+                 count, total, minimum, maximum)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, year, month, type, category, currency) DO UPDATE SET
+                count = count + excluded.count,
+                total = total + excluded.total,
+                minimum = MIN(minimum, COALESCE(excluded.minimum, minimum)),
+                maximum = MAX(maximum, COALESCE(excluded.maximum, maximum))
+        """, groups)
+        if recompute:
+            self._recompute_extremes(conn, recompute)
+        self.months.clear()
+        self.categories.clear()
+
+    @staticmethod
+    def _recompute_extremes(conn, keys):
+        """Refresh min/max of groups that lost rows, dropping emptied groups"""
+        for user_id, year, month, type, category, currency in keys:
+            start, end = month_range(year, month)
+            conn.execute("""
+                UPDATE monthly_category_totals SET
+                    minimum = (SELECT MIN(amount_cents) FROM transactions
+                               WHERE user_id = ?1 AND category = ?5 AND type = ?4
+                               AND date >= ?7 AND date < ?8 AND currency = ?6),
+                    maximum = (SELECT MAX(amount_cents) FROM transactions
+                               WHERE user_id = ?1 AND category = ?5 AND type = ?4
+                               AND date >= ?7 AND date < ?8 AND currency = ?6)
+                WHERE user_id = ?1 AND year = ?2 AND month = ?3
+                AND type = ?4 AND category = ?5 AND currency = ?6
+            """, (user_id, year, month, type, category, currency, start, end))
+        conn.executemany("""
+            DELETE FROM monthly_category_totals
+            WHERE user_id = ? AND year = ? AND month = ? AND type = ? AND category = ?
+            AND currency = ? AND count <= 0
+        """, keys)
+
+LIVE_MONTHLY_TOTALS = """
+    SELECT user_id,
+           CAST(strftime('%Y', date) AS INTEGER) AS year,
+           CAST(strftime('%m', date) AS INTEGER) AS month,
+           currency,
+           COALESCE(SUM(CASE WHEN type = 'income' THEN amount_cents END), 0),
+           COALESCE(SUM(CASE WHEN type = 'expense' THEN amount_cents END), 0)
+    FROM transactions
+    WHERE user_id IS NOT NULL AND type IN ('income', 'expense')
+    GROUP BY user_id, year, month, currency
+"""
+
+LIVE_CATEGORY_TOTALS = """
+    SELECT user_id,
+           CAST(strftime('%Y', date) AS INTEGER) AS year,
+           CAST(strftime('%m', date) AS INTEGER) AS month,
+           type, category, currency, COUNT(*), SUM(amount_cents), MIN(amount_cents),
+           MAX(amount_cents)
+    FROM transactions
+    WHERE user_id IS NOT NULL AND type IN ('income', 'expense')
+    GROUP BY user_id, year, month, type, category, currency
+"""
+
+def rebuild_rollups(conn):
+    """Recompute every rollup table from the transactions table; the caller commits"""
+    conn.execute('DELETE FROM monthly_category_totals')
+    conn.execute('DELETE FROM monthly_totals')
+    conn.execute('DELETE FROM user_balances')
+    conn.execute(f"""
+        INSERT INTO monthly_category_totals
+            (user_id, year, month, type, category, currency,
+             count, total, minimum, maximum)
+        {LIVE_CATEGORY_TOTALS}
+    """)
+    conn.execute(f"""
+        INSERT INTO monthly_totals (user_id, year, month, currency, income, expenses)
+        {LIVE_MONTHLY_TOTALS}
+    """)
+    conn.execute("""
+        INSERT INTO user_balances (user_id, currency, income, expenses)
+        SELECT user_id, currency, SUM(income), SUM(expenses)
+        FROM monthly_totals
+        GROUP BY user_id, currency
+    """)
+
+def check_rollups(conn):
+    """Compare rollups with live sums; return a list of mismatch descriptions"""
+    mismatches = []
+    live = {row[:4]: row[4:] for row in conn.execute(LIVE_MONTHLY_TOTALS)}
+    stored = {row[:4]: row[4:] for row in conn.execute(
+        'SELECT user_id, year, month, currency, income, expenses FROM monthly_totals')}
+
+    live_users = {}
+    for key in sorted(set(live) | set(stored), key=lambda k: tuple(str(x) for x in k)):
+        expected = live.get(key, (0, 0))
+        actual = stored.get(key, (0, 0))
+        user_totals = live_users.setdefault((key[0], key[3]), [0, 0])
+        user_totals[0] += expected[0]
+        user_totals[1] += expected[1]
+        if tuple(expected) != tuple(actual):
+            mismatches.append(f"monthly_totals user {key[0]} {key[1]}-{key[2]} {key[3]}: "
+                              f"expected {expected}, found {actual}")
+
+    balances = {row[:2]: row[2:] for row in conn.execute(
+        'SELECT user_id, currency, income, expenses FROM user_balances')}
+    for key in sorted(set(live_users) | set(balances), key=lambda k: tuple(str(x) for x in k)):
+        expected = tuple(live_users.get(key, (0, 0)))
+        actual = balances.get(key, (0, 0))
+        if expected != tuple(actual):
+            mismatches.append(f"user_balances user {key[0]} {key[1]}: "
+                              f"expected {expected}, found {actual}")
+
+    live = {row[:6]: row[6:] for row in conn.execute(LIVE_CATEGORY_TOTALS)}
+    stored = {row[:6]: row[6:] for row in conn.execute("""
+        SELECT user_id, year, month, type, category, currency,
+               count, total, minimum, maximum
+        FROM monthly_category_totals
+    """)}
+    for key in sorted(set(live) | set(stored), key=lambda k: tuple(str(x) for x in k)):
+        expected = live.get(key)
+        actual = stored.get(key)
+        if expected is None or tuple(expected) != tuple(actual or ()):
+            mismatches.append(f"monthly_category_totals {key}: "
+                              f"expected {expected}, found {actual}")
+    return mismatches
@@ -0,0 +1,181 @@
+"""Rule-based categorisation of transactions from their descriptions.
+
+Each user keeps rules mapping a pattern to a category, with a priority. A
+rule matches a description when its pattern, ignoring case, starts a word in
+it: 'tesco' matches 'TESCO STORES 2231' and 'Tescos', but not 'Atesco'.
+When several rules match, the highest priority wins, then the oldest rule.
+
+A user's rules are compiled into one regular expression shaped like a trie
+of the patterns, so a description is scanned once however many rules there
+are, instead of being tested against each rule in turn:
+
+    categoriser = RuleManager(db_path).get_categoriser(user_id)
+    categoriser.categorise('TESCO STORES 2231')  # -> 'Groceries'
+"""
+import re
+import sqlite3
+import threading
+import weakref
+from typing import NamedTuple
+from database import get_pool
+
+DEFAULT_CATEGORY = 'Uncategorized'
+
+class CategoryRule(NamedTuple):
+    """One row of the category_rules table"""
+    id: int
+    pattern: str
+    category: str
+    priority: int
+
+def _trie_pattern(node):
+    """Regex source matching the longest path through a trie of characters"""
+    branches = [re.escape(char) + _trie_pattern(child)
+                for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    return f"(?:{body})?" if '' in node else body
+
+class Categoriser:
+    """A user's rules compiled into one matcher"""
+
+    def __init__(self, rules=()):
+        """rules are (pattern, category, priority), oldest first"""
+        best = {}
+        for order, (pattern, category, priority) in enumerate(rules):
+            pattern = pattern.strip().lower()
+            rank = (-priority, order, category)
+            if pattern and (pattern not in best or rank < best[pattern]):
+                best[pattern] = rank
+
+        trie = {}
+        for pattern in best:
+            node = trie
+            for char in pattern:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        # Tried once per word start, the regex finds the longest pattern
+        # there; a shorter pattern that it extends matched too, so each
+        # pattern is ranked as the best of itself and its prefixes
+        self._ranks = {pattern: min(best[pattern[:end]] for end in range(1, len(pattern) + 1)
+                                    if pattern[:end] in best)
+                       for pattern in best}
+        self._regex = re.compile(rf"(?<!\w)(?=({_trie_pattern(trie)}))") if best else None
+
+    def __len__(self):
+        return len(self._ranks)
+
+    def categorise(self, description, default=None):
+        """Return the category of the best rule matching description, else default"""
+        if self._regex is None or not description:
+            return default
+        found = None
+        for match in self._regex.finditer(description.lower()):
+            rank = self._ranks[match.group(1)]
+            if found is None or rank < found:
+                found = rank
+        return default if found is None else found[2]
+
+    def fill(self, row, default=DEFAULT_CATEGORY):
+        """Return a transaction row (a mapping or a sequence in ROW_FIELDS order)
+        with a missing category filled in from its description"""
+        if isinstance(row, dict):
+            if row.get('category'):
+                return row
+            return dict(row, category=self.categorise(row.get('description'), default))
+        if len(row) < 2 or row[1]:
+            return row
+        description = row[3] if len(row) > 3 else None
+        return (row[0], self.categorise(description, default)) + tuple(row[2:])
+
+# One {user_id: (rules_version, Categoriser)} per connection pool
+_categorisers = weakref.WeakKeyDictionary()
+_categorisers_lock = threading.Lock()
+
+class RuleManager:
+    def __init__(self, db_path='finance.db'):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+
+    def add_rule(self, user_id, pattern, category, priority=0):
+        """Add a rule, or update the category and priority of the same pattern"""
+        pattern = pattern.strip().lower()
+        category = category.strip()
+        if not pattern or not category:
+            print("Error adding rule: pattern and category are required")
+            return False
+        conn = self.pool.acquire()
+        try:
+            conn.execute("""
+                INSERT INTO category_rules (user_id, pattern, category, priority)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, pattern) DO UPDATE SET
+                    category = excluded.category,
+                    priority = excluded.priority
+            """, (user_id, pattern, category, int(priority)))
+            conn.execute('UPDATE users SET rules_version = rules_version + 1 WHERE id = ?',
+                         (user_id,))
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"Error adding rule: {e}")
+            return False
+        finally:
+            self.pool.release(conn)
+
+    def delete_rule(self, user_id, rule_id):
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute('DELETE FROM category_rules WHERE id = ? AND user_id = ?',
+                                  (rule_id, user_id))
+            conn.execute('UPDATE users SET rules_version = rules_version + 1 WHERE id = ?',
+                         (user_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            print(f"Error deleting rule: {e}")
+            return False
+        finally:
+            self.pool.release(conn)
+
+    def get_rules(self, user_id):
+        """Return a user's rules, highest priority first, or None on error"""
+        conn = self.pool.acquire()
+        try:
+            return [CategoryRule(*row) for row in conn.execute("""
+                SELECT id, pattern, category, priority FROM category_rules
+                WHERE user_id = ?
+                ORDER BY priority DESC, id
+            """, (user_id,))]
+        except sqlite3.Error as e:
+            print(f"Error retrieving rules: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
+
+    def get_categoriser(self, user_id, conn=None):
+        """Return the user's compiled Categoriser, recompiling after rule changes.
+
+        Pass conn to check for changes on a connection the caller already holds.
+        """
+        if conn is None:
+            conn = self.pool.acquire()
+            try:
+                return self.get_categoriser(user_id, conn)
+            finally:
+                self.pool.release(conn)
+        row = conn.execute('SELECT rules_version FROM users WHERE id = ?',
+                           (user_id,)).fetchone()
+        version = row[0] if row else 0
+        with _categorisers_lock:
+            cached = _categorisers.setdefault(self.pool, {}).get(user_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        categoriser = Categoriser(conn.execute("""
+            SELECT pattern, category, priority FROM category_rules
+            WHERE user_id = ? ORDER BY id
+        """, (user_id,)))
+        with _categorisers_lock:
+            _categorisers.setdefault(self.pool, {})[user_id] = (version, categoriser)
+        return categoriser
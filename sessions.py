@@ -0,0 +1,144 @@
+import hashlib
+import hmac
+import os
+import sqlite3
+import time
+from database import get_pool
+from defaults import DEFAULT_SESSION_TTL
+
+# The CLI keeps the current token here between invocations
+DEFAULT_SESSION_FILE = os.environ.get(
+    'FINANCE_SESSION_FILE', os.path.join(os.path.expanduser('~'), '.finance_session'))
+
+class SessionManager:
+    """Issues and validates signed, expiring login tokens.
+
+    A token is '<session id>.<user id>.<expiry>.<signature>', signed with
+    HMAC-SHA256 using a key stored in the settings table. Validating one
+    checks the signature and expiry, then that the session has not been
+    revoked, so bcrypt only runs when logging in.
+    """
+
+    def __init__(self, db_path='finance.db'):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self._key = None
+
+    def _signing_key(self, conn):
+        """Load the signing key, generating it the first time any session starts"""
+        if self._key is None:
+            query = "SELECT value FROM settings WHERE name = 'session_key'"
+            row = conn.execute(query).fetchone()
+            if row is None:
+                import secrets
+                conn.execute("""
+                    INSERT OR IGNORE INTO settings (name, value) VALUES ('session_key', ?)
+                """, (secrets.token_bytes(32),))
+                conn.commit()
+                row = conn.execute(query).fetchone()
+            self._key = row[0]
+        return self._key
+
+    def _sign(self, key, payload):
+        return hmac.new(key, payload.encode('ascii'), hashlib.sha256).hexdigest()
+
+    def create_session(self, user_id, ttl=DEFAULT_SESSION_TTL):
+        """Start a session for an authenticated user and return its token"""
+        import secrets
+        now = int(time.time())
+        session_id = secrets.token_hex(16)
+        conn = self.pool.acquire()
+        try:
+            key = self._signing_key(conn)
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+            conn.execute("""
+                INSERT INTO sessions (id, user_id, created_at, expires_at)
+                VALUES (?, ?, ?, ?)
+            """, (session_id, user_id, now, now + ttl))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error creating session: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
+        payload = f"{session_id}.{user_id}.{now + ttl}"
+        return f"{payload}.{self._sign(key, payload)}"
+
+    def validate_token(self, token):
+        """Return the user_id for a valid, unexpired, unrevoked token, else None"""
+        if not token:
+            return None
+        try:
+            session_id, user_id, expires_at, signature = token.split('.')
+            user_id, expires_at = int(user_id), int(expires_at)
+        except ValueError:
+            return None
+        if expires_at <= time.time():
+            return None
+
+        conn = self.pool.acquire()
+        try:
+            expected = self._sign(self._signing_key(conn), token.rpartition('.')[0])
+            # As bytes: compare_digest rejects str with non-ASCII characters
+            if not hmac.compare_digest(signature.encode(), expected.encode()):
+                return None
+            row = conn.execute(
+                'SELECT 1 FROM sessions WHERE id = ? AND user_id = ?',
+                (session_id, user_id)).fetchone()
+            return user_id if row else None
+        except sqlite3.Error as e:
+            print(f"Error validating session: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
+
+    def revoke_token(self, token):
+        """End the session a token belongs to"""
+        session_id = (token or '').split('.')[0]
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            print(f"Error revoking session: {e}")
+            return False
+        finally:
+            self.pool.release(conn)
+
+    def revoke_user_sessions(self, user_id):
+        """End every session of a user; returns how many were revoked"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+            conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            print(f"Error revoking sessions: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
+
+def save_token(token, path=None):
+    """Write a token to the session file, readable only by the current user"""
+    path = path or DEFAULT_SESSION_FILE
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # The mode above only applies when the file is created
+    os.chmod(path, 0o600)
+    with os.fdopen(fd, 'w') as file:
+        file.write(token)
+
+def load_token(path=None):
+    """Return the token in the session file, or None if there is none or it is unreadable"""
+    try:
+        with open(path or DEFAULT_SESSION_FILE, encoding='ascii') as file:
+            return file.read().strip() or None
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def clear_token(path=None):
+    """Remove the session file"""
+    try:
+        os.remove(path or DEFAULT_SESSION_FILE)
+    except FileNotFoundError:
+        pass
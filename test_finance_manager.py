@@ -1,18 +1,47 @@
 import pytest
+import asyncio
+import itertools
 import os
-from finance_manager import FinanceManager
+import io
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from async_service import AsyncFinanceService
+from batch_reports import iter_statements
+from cache import ResultCache, configure_cache
+from database import ConnectionPool, get_pool, configure_pool, close_all_pools
+import sessions
+import transactions
+import write_behind
+from click.testing import CliRunner
+from finance_manager import FinanceManager, cli
+from finance_gui import BackgroundWorker, PageWindow, TransactionGrid
+from migrations import LATEST_VERSION, current_version
+from ingest import ingest_file, normalise, read_ofx, read_qif, read_statement
+from rules import Categoriser
+from rollups import check_rollups
+from periods import month_range, quarter_range, year_range, fiscal_year_range
 from transactions import TransactionManager
 from budget import BudgetManager
 from reports import ReportGenerator
+from sessions import SessionManager
+from collections import deque
 from datetime import datetime
+from decimal import Decimal
+from hypothesis import HealthCheck, given, settings, strategies as st
+from money import Money
 
 @pytest.fixture
 def test_db():
     """Create a test database and clean it up after tests"""
     db_path = 'test_finance.db'
     yield db_path
-    if os.path.exists(db_path):
-        os.remove(db_path)
+    close_all_pools()
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
 
 @pytest.fixture
 def finance_manager(test_db):
@@ -58,6 +87,7 @@ def test_transaction_management(finance_manager, test_user):
     assert transactions is not None
     assert 'Salary' in transactions
     assert 'Food' in transactions
+    assert '$5000.00' in transactions and '$100.00' in transactions
 
     # Test balance calculation
     balance = tm.get_balance(user_id)
@@ -117,4 +147,1127 @@ def test_report_generation(finance_manager, test_user):
     analysis = rg.generate_category_analysis(user_id)
     assert analysis is not None
     assert 'Food' in analysis
-    assert 'Entertainment' in analysis
\ No newline at end of file
+    assert 'Entertainment' in analysis
+
+def test_connection_pool(finance_manager, test_user):
+    """Test that managers share long-lived, configured pool connections"""
+    pool = get_pool(finance_manager.db_path)
+    tm = TransactionManager(finance_manager.db_path)
+    assert tm.pool is pool
+
+    with pool.connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        # Nested borrows on one thread share the same connection
+        with pool.connection() as inner:
+            assert inner is conn
+    with pool.connection() as again:
+        assert again is conn
+
+    # Inside a caller's transaction, a helper's commit and rollback apply to
+    # a savepoint: an inner failure leaves the outer work, and the outer
+    # transaction, intact
+    user_id = test_user['user_id']
+    insert = ("INSERT INTO transactions (user_id, type, category, amount_cents, "
+              "description) VALUES (?, 'expense', 'Test', 100, ?)")
+    with pool.connection() as conn:
+        conn.execute('BEGIN')
+        conn.execute(insert, (user_id, 'outer'))
+        assert tm.add_transaction(user_id, 'expense', 'Test', 2, 'helper')
+        with pool.connection() as inner:
+            inner.execute('BEGIN')
+            inner.execute(insert, (user_id, 'failed'))
+            inner.rollback()
+        assert conn.in_transaction
+        assert sorted(row[0] for row in conn.execute(
+            "SELECT description FROM transactions WHERE category = 'Test'")) == [
+            'helper', 'outer']
+        conn.rollback()
+        assert conn.execute(
+            "SELECT COUNT(*) FROM transactions WHERE category = 'Test'").fetchone()[0] == 0
+
+    # Concurrent writers draw from the pool without losing rows
+    user_id = test_user['user_id']
+    def worker():
+        for _ in range(20):
+            assert tm.add_transaction(user_id, 'expense', 'Food', 1, 'Snack')
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert tm.get_balance(user_id) == -160
+    assert pool._created <= pool.size
+
+    # A borrower waiting on a full pool wakes up when configure() makes room,
+    # and a connection borrowed before configure() is closed when returned
+    small = ConnectionPool(finance_manager.db_path, size=1, timeout=5)
+    held = small.acquire()
+    got = []
+    def waiter_borrows():
+        got.append(small.acquire())
+        small.release(got[-1])
+    waiter = threading.Thread(target=waiter_borrows)
+    waiter.start()
+    time.sleep(0.1)
+    small.configure(size=2, timeout=5)
+    waiter.join(2)
+    assert got and got[0] is not held
+    small.release(held)
+    with pytest.raises(sqlite3.ProgrammingError):
+        held.execute('SELECT 1')
+    assert small._created == 1
+    small.close()
+
+def test_schema_migrations_upgrade_legacy_database(test_db):
+    """Test that a pre-migration database is upgraded in place"""
+    conn = sqlite3.connect(test_db)
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL, password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER, type TEXT NOT NULL, category TEXT NOT NULL,
+            amount REAL NOT NULL, description TEXT,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE budgets (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER, category TEXT NOT NULL, amount REAL NOT NULL,
+            month INTEGER NOT NULL, year INTEGER NOT NULL);
+        INSERT INTO transactions (user_id, type, category, amount)
+            VALUES (1, 'expense', 'Food', 12.5);
+        INSERT INTO budgets (user_id, category, amount, month, year)
+            VALUES (1, 'Food', 100, 1, 2024), (1, 'Food', 150, 1, 2024);
+    """)
+    conn.close()
+
+    manager = FinanceManager(test_db)
+    with manager.pool.connection() as conn:
+        assert current_version(conn) == LATEST_VERSION
+        indexes = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert 'idx_transactions_user_type_date' in indexes
+        assert 'idx_transactions_user_category_date' in indexes
+        # Duplicate budgets collapse to the latest row, now in integer cents
+        assert conn.execute(
+            'SELECT amount_cents, currency FROM budgets').fetchall() == [(15000, 'USD')]
+
+    # Existing rows survive and setting the budget again updates in place
+    assert manager.transaction_manager.get_balance(1) == -12.5
+    assert manager.budget_manager.set_budget(1, 'Food', 175, 1, 2024)
+    with manager.pool.connection() as conn:
+        assert conn.execute(
+            'SELECT amount_cents FROM budgets').fetchall() == [(17500,)]
+
+    # Re-running setup is a no-op
+    FinanceManager(test_db)
+    with manager.pool.connection() as conn:
+        assert conn.execute(
+            'SELECT COUNT(*) FROM schema_version').fetchone()[0] == LATEST_VERSION
+
+def test_period_ranges():
+    """Test half-open period bounds used by report and budget filters"""
+    assert month_range(2024, 2) == ('2024-02-01', '2024-03-01')
+    assert month_range(2024, 12) == ('2024-12-01', '2025-01-01')
+    assert quarter_range(2024, 4) == ('2024-10-01', '2025-01-01')
+    assert year_range(2024) == ('2024-01-01', '2025-01-01')
+    assert fiscal_year_range(2024, 4) == ('2024-04-01', '2025-04-01')
+    with pytest.raises(ValueError):
+        month_range(2024, 13)
+
+def test_report_queries_use_indexes(finance_manager, test_user):
+    """Test that every report and budget query is answered from an index"""
+    user_id = test_user['user_id']
+    now = datetime.now()
+    finance_manager.transaction_manager.add_transaction(user_id, 'expense', 'Food', 10)
+    finance_manager.budget_manager.set_budget(user_id, 'Food', 50, now.month, now.year)
+
+    statements = []
+    with finance_manager.pool.connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            rg = finance_manager.report_generator
+            assert rg.generate_monthly_report(user_id, now.month, now.year)
+            assert rg.generate_yearly_report(user_id, now.year)
+            assert rg.generate_yearly_report(user_id, now.year, fiscal_start_month=4)
+            assert finance_manager.budget_manager.check_budget_status(
+                user_id, now.month, now.year)
+        finally:
+            conn.set_trace_callback(None)
+
+        queries = [s for s in statements
+                   if s.lstrip().upper().startswith('SELECT')
+                   and ('transactions' in s or 'monthly_category_totals' in s)]
+        assert queries
+        for query in queries:
+            assert 'strftime(\'%m\'' not in query
+            plan = ' '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query))
+            assert 'USING' in plan and ('INDEX' in plan or 'PRIMARY KEY' in plan), plan
+            assert 'SCAN' not in plan, plan
+
+def test_bulk_import(finance_manager, test_user, monkeypatch):
+    """Test batched imports keep valid rows and report rejected ones"""
+    tm = finance_manager.transaction_manager
+    user_id = test_user['user_id']
+
+    def rows():
+        yield ('income', 'Salary', 3000, 'Pay', '2024-01-31')
+        yield {'type': 'expense', 'category': 'Food', 'amount': '12.50',
+               'date': '2024-02-01 09:30:00'}
+        yield ('refund', 'Food', 5)                  # bad type
+        yield ('expense', 'Rent', -100)              # bad amount
+        yield ('expense', 'Rent', 1000, None, 'soon')  # bad date
+        for _ in range(7):
+            yield ('expense', 'Coffee', 2.5, None, '2024-02-02')
+
+    result = tm.add_transactions_bulk(user_id, rows(), batch_size=3)
+    assert result['accepted'] == 9
+    assert result['rejected'] == 3
+    assert [row for row, _ in result['errors']] == [3, 4, 5]
+    assert tm.get_balance(user_id) == 3000 - 12.5 - 7 * 2.5
+
+    with finance_manager.pool.connection() as conn:
+        dates = conn.execute(
+            'SELECT date FROM transactions WHERE category = ? ORDER BY id',
+            ('Salary',)).fetchall()
+    assert dates == [('2024-01-31 00:00:00',)]
+
+    # A database error keeps the batches already written and reports the rest
+    with finance_manager.pool.connection() as conn:
+        conn.execute("""
+            CREATE TRIGGER fail_import BEFORE INSERT ON transactions
+            WHEN new.description = 'boom' BEGIN SELECT RAISE(ABORT, 'disk on fire'); END
+        """)
+        conn.commit()
+    rows = [('expense', 'Tea', 1, 'ok', '2024-04-01')] * 3 + [
+        ('expense', 'Tea', 1, 'boom', '2024-04-01')] + [
+        ('expense', 'Tea', 1, 'ok', '2024-04-01')] * 3
+    result = tm.add_transactions_bulk(user_id, rows, batch_size=3)
+    assert (result['accepted'], result['rejected']) == (3, 3)
+    assert result['error'] == 'disk on fire'
+    assert result['errors'] == [(4, 'disk on fire'), (5, 'disk on fire'), (6, 'disk on fire')]
+    assert len(list(tm.iter_transactions(user_id, category='Tea'))) == 3
+    with finance_manager.pool.connection() as conn:
+        conn.execute('DROP TRIGGER fail_import')
+        conn.commit()
+        assert check_rollups(conn) == []
+
+    # Stored errors are capped; on_error still sees every rejected row
+    reported = []
+    monkeypatch.setattr(transactions, 'MAX_STORED_ERRORS', 2)
+    result = tm.add_transactions_bulk(user_id, [('refund', 'Food', 5)] * 4 + [
+        ('expense', 'Food', 1, None, '2024-03-01')],
+        on_error=lambda row_number, reason: reported.append(row_number))
+    assert (result['accepted'], result['rejected']) == (1, 4)
+    assert [row for row, _ in result['errors']] == [1, 2]
+    assert reported == [1, 2, 3, 4]
+
+def test_statement_ingestion(finance_manager, test_user, tmp_path):
+    """Test the streaming CSV/OFX/QIF ingestion pipeline"""
+    tm = finance_manager.transaction_manager
+    user_id = test_user['user_id']
+
+    statement = tmp_path / 'statement.csv'
+    statement.write_text(
+        'Date,Description,Amount\n'
+        '31/01/2024,ACME PAYROLL,"2,500.00"\n'
+        '01/02/2024,TESCO STORES,-45.10\n'
+        '02/02/2024,Mystery,not-a-number\n')
+    result = ingest_file(str(statement), tm, user_id,
+                         category_map={'tesco': 'Groceries', 'payroll': 'Salary'})
+    assert (result['accepted'], result['rejected']) == (2, 1)
+    assert tm.get_balance(user_id) == 2500 - 45.10
+    status = finance_manager.report_generator.generate_category_analysis(user_id)
+    assert 'Groceries' in status
+
+    # One format per file: a US statement is not half-read as day/month
+    us = tmp_path / 'us.csv'
+    us.write_text('Date,Description,Amount\n01/05/2024,A,-1\n01/15/2024,B,-2\n'
+                  '01/06/2024,C,-4\n15/01/2024,D,-8\n')
+    result = ingest_file(str(us), tm, user_id, category_map={'': 'Misc'})
+    assert (result['accepted'], result['rejected']) == (3, 1)
+    assert sorted(t.date for t in tm.iter_transactions(user_id, category='Misc')) == [
+        '2024-01-05 00:00:00', '2024-01-06 00:00:00', '2024-01-15 00:00:00']
+    ambiguous = tmp_path / 'ambiguous.csv'
+    ambiguous.write_text('Date,Description,Amount\n01/05/2024,A,-1\n02/06/2024,B,-2\n')
+    with pytest.raises(ValueError, match='ambiguous date'):
+        normalise(read_statement(str(ambiguous)))
+    result = ingest_file(str(ambiguous), tm, user_id, category_map={'': 'Day first'})
+    assert (result['accepted'], result['rejected']) == (0, 0)
+    assert 'ambiguous date' in result['error']
+    assert not list(tm.iter_transactions(user_id, category='Day first'))
+    result = ingest_file(str(ambiguous), tm, user_id, category_map={'': 'Day first'},
+                         date_format='%d/%m/%Y')
+    assert [t.date for t in tm.iter_transactions(user_id, category='Day first')] == [
+        '2024-06-02 00:00:00', '2024-05-01 00:00:00']
+
+    ofx = io.StringIO(
+        '<OFX><BANKTRANLIST>'
+        '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240203120000.000[-5:EST]'
+        '<TRNAMT>-9.99<NAME>NETFLIX</STMTTRN>'
+        '<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240204<TRNAMT>20.00'
+        '<MEMO>Refund</STMTTRN>'
+        '</BANKTRANLIST></OFX>')
+    assert list(read_ofx(ofx)) == [
+        {'date': '20240203120000', 'amount': '-9.99', 'description': 'NETFLIX'},
+        {'date': '20240204', 'amount': '20.00', 'description': 'Refund'},
+    ]
+
+    qif = io.StringIO('!Type:Bank\nD02/05/2024\nT-12.00\nPCafe\nLDining:Coffee\n^\n')
+    assert list(read_qif(qif)) == [
+        {'date': '02/05/2024', 'amount': '-12.00', 'description': 'Cafe',
+         'category': 'Dining'},
+    ]
+
+def test_transaction_pagination(finance_manager, test_user):
+    """Test keyset pagination and lazy streaming of transactions"""
+    tm = finance_manager.transaction_manager
+    user_id = test_user['user_id']
+    # Several rows share a date so the id tie-breaker matters
+    tm.add_transactions_bulk(user_id, [
+        ('expense', 'Food', i + 1, f'Item {i}', f'2024-03-{1 + i // 3:02d}')
+        for i in range(10)
+    ])
+
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor = tm.get_transactions_page(user_id, page_size=4, cursor=cursor)
+        assert len(rows) <= 4
+        seen.extend(rows)
+        if cursor is None:
+            break
+    assert [row.amount for row in seen] == [10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+    assert seen[0].description == 'Item 9'
+
+    streamed = tm.iter_transactions(user_id, category='Food', page_size=3)
+    assert [row.id for row in streamed] == [row.id for row in seen]
+    resumed = tm.get_transactions_page(user_id, cursor=(seen[2].date, seen[2].id))[0]
+    assert [row.amount for row in resumed] == [7, 6, 5, 4, 3, 2, 1]
+
+def test_budget_status_records(finance_manager, test_user):
+    """Test single-query budget status and multi-month history"""
+    bm = finance_manager.budget_manager
+    tm = finance_manager.transaction_manager
+    user_id = test_user['user_id']
+    bm.set_budget(user_id, 'Food', 100, 1, 2024)
+    bm.set_budget(user_id, 'Fun', 50, 1, 2024)
+    bm.set_budget(user_id, 'Food', 100, 2, 2024)
+    tm.add_transactions_bulk(user_id, [
+        ('expense', 'Food', 60, None, '2024-01-05'),
+        ('expense', 'Food', 70, None, '2024-01-20'),
+        ('expense', 'Fun', 10, None, '2024-01-21'),
+        ('income', 'Food', 500, None, '2024-01-22'),
+        ('expense', 'Food', 30, None, '2024-02-03'),
+    ])
+
+    status = bm.get_budget_status(user_id, 1, 2024)
+    assert [(s.category, s.spent, s.exceeded) for s in status] == [
+        ('Food', 130, True), ('Fun', 10, False)]
+    assert status[0].percentage == 130
+
+    history = bm.get_budget_history(user_id, months=2, month=2, year=2024)
+    assert [(s.year, s.month, s.category, s.spent) for s in history] == [
+        (2024, 1, 'Food', 130), (2024, 1, 'Fun', 10), (2024, 2, 'Food', 30)]
+    assert 'EXCEEDED!' in bm.check_budget_status(user_id, 1, 2024)
+    assert '$130.00' in bm.check_budget_status(user_id, 1, 2024)
+
+def test_report_bundle_single_scan(finance_manager, test_user):
+    """Test the report bundle matches individual reports from a single read"""
+    rg = finance_manager.report_generator
+    user_id = test_user['user_id']
+    finance_manager.transaction_manager.add_transactions_bulk(user_id, [
+        ('income', 'Salary', 3000, None, '2024-03-01'),
+        ('expense', 'Food', 40, None, '2024-03-02'),
+        ('expense', 'Food', 60, None, '2024-04-10'),
+        ('expense', 'Rent', 900, None, '2024-04-01'),
+        ('income', 'Salary', 3000, None, '2024-04-01'),
+    ])
+
+    statements = []
+    with finance_manager.pool.connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            bundle = rg.generate_report_bundle(user_id, 4, 2024)
+        finally:
+            conn.set_trace_callback(None)
+    # One read of the transaction data; the other SELECT is the base currency lookup
+    scans = [s for s in statements
+             if s.lstrip().startswith('SELECT') and 'FROM users' not in s]
+    assert len(scans) == 1
+
+    assert bundle['monthly'] == rg.generate_monthly_report(user_id, 4, 2024)
+    assert bundle['yearly'] == rg.generate_yearly_report(user_id, 2024)
+    assert bundle['category_analysis'] == rg.generate_category_analysis(
+        user_id, '2024-01-01', '2024-12-31 23:59:59')
+    assert 'Total Expenses: $960.00' in bundle['monthly']
+    assert 'Total Income: $6000.00' in bundle['yearly']
+
+def test_rollups_track_writes(finance_manager, test_user):
+    """Test balance and monthly rollups stay in step with every write path"""
+    tm = finance_manager.transaction_manager
+    user_id = test_user['user_id']
+    tm.add_transaction(user_id, 'income', 'Salary', 1000, 'Pay', '2024-05-01')
+    tm.add_transactions_bulk(user_id, [
+        ('expense', 'Food', 20, None, '2024-05-02'),
+        ('expense', 'Food', 30, None, '2024-06-02'),
+    ])
+    rows, _ = tm.get_transactions_page(user_id)
+    june, may = rows[0], rows[1]
+    assert tm.update_transaction(june.id, user_id, type='income', amount=45)
+    assert tm.delete_transaction(may.id, user_id)
+    assert not tm.delete_transaction(may.id, user_id)
+
+    assert tm.get_balance(user_id) == 1045
+    with finance_manager.pool.connection() as conn:
+        assert check_rollups(conn) == []
+        assert conn.execute(
+            'SELECT year, month, income, expenses FROM monthly_totals ORDER BY month'
+        ).fetchall() == [(2024, 5, 100000, 0), (2024, 6, 4500, 0)]
+        conn.execute('UPDATE user_balances SET income = 0')
+        conn.commit()
+
+    assert tm.get_balance(user_id) == 0
+    assert len(finance_manager.rebuild_rollups()) == 1
+    assert finance_manager.rebuild_rollups() == []
+    assert tm.get_balance(user_id) == 1045
+
+def test_category_rollup_matches_raw_scan(finance_manager, test_user):
+    """Test rollup-backed reports agree with raw scans after edits"""
+    tm = finance_manager.transaction_manager
+    rg = finance_manager.report_generator
+    user_id = test_user['user_id']
+    tm.add_transactions_bulk(user_id, [
+        ('expense', 'Food', 5, None, '2024-07-01'),
+        ('expense', 'Food', 50, None, '2024-07-15'),
+        ('expense', 'Food', 20, None, '2024-08-01'),
+        ('expense', 'Fuel', 35, None, '2024-07-20'),
+    ])
+    rows = list(tm.iter_transactions(user_id, category='Food'))
+    # Removing the July maximum and minimum forces a min/max recompute
+    july_max = next(r for r in rows if r.amount == 50)
+    july_min = next(r for r in rows if r.amount == 5)
+    assert tm.delete_transaction(july_max.id, user_id)
+    assert tm.update_transaction(july_min.id, user_id, category='Fuel')
+
+    with finance_manager.pool.connection() as conn:
+        assert check_rollups(conn) == []
+        assert conn.execute("""
+            SELECT count, total, minimum, maximum FROM monthly_category_totals
+            WHERE user_id = ? AND year = 2024 AND month = 7 AND category = 'Fuel'
+        """, (user_id,)).fetchone() == (2, 4000, 500, 3500)
+        assert conn.execute("""
+            SELECT COUNT(*) FROM monthly_category_totals
+            WHERE user_id = ? AND month = 7 AND category = 'Food'
+        """, (user_id,)).fetchone() == (0,)
+
+    # Whole-month ranges come from the rollup, others from a raw scan
+    rollup = rg.generate_category_analysis(user_id, '2024-07-01', '2024-08-31 23:59:59')
+    raw = rg.generate_category_analysis(user_id, '2024-06-30', '2024-08-31 23:59:59')
+    assert rollup == raw
+    assert rg.generate_category_analysis(user_id) == rollup
+
+def test_session_tokens(finance_manager, test_user):
+    """Test that sessions validate without bcrypt and can expire or be revoked"""
+    sm = finance_manager.session_manager
+    user_id = test_user['user_id']
+
+    assert finance_manager.login(test_user['username'], 'wrong') is None
+    token = finance_manager.login(test_user['username'], test_user['password'])
+    assert sm.validate_token(token) == user_id
+
+    # Tampering with any part of the token breaks the signature
+    session_id, uid, expires_at, signature = token.split('.')
+    assert sm.validate_token(f"{session_id}.{uid}.{int(expires_at) + 3600}.{signature}") is None
+    assert sm.validate_token(f"{session_id}.{user_id + 1}.{expires_at}.{signature}") is None
+    assert sm.validate_token('garbage') is None
+    assert sm.validate_token(None) is None
+    assert sm.validate_token('a.1.9999999999.é') is None
+
+    # A different manager on the same database shares the signing key
+    assert SessionManager(finance_manager.db_path).validate_token(token) == user_id
+
+    assert sm.revoke_token(token)
+    assert sm.validate_token(token) is None
+
+    expired = sm.create_session(user_id, ttl=-1)
+    assert sm.validate_token(expired) is None
+
+    tokens = [sm.create_session(user_id) for _ in range(3)]
+    assert sm.revoke_user_sessions(user_id) == 3
+    assert all(sm.validate_token(t) is None for t in tokens)
+
+def test_session_file(tmp_path):
+    """Test the session file is private even if it existed, and bad files are ignored"""
+    path = str(tmp_path / 'session')
+    with open(path, 'w') as file:
+        file.write('old')
+    os.chmod(path, 0o644)
+    sessions.save_token('token', path)
+    assert sessions.load_token(path) == 'token'
+    if os.name == 'posix':
+        assert os.stat(path).st_mode & 0o777 == 0o600
+    with open(path, 'wb') as file:
+        file.write(b'\xff\xfe')
+    assert sessions.load_token(path) is None
+
+def test_cli_uses_saved_session(tmp_path, monkeypatch):
+    """Test that CLI commands reuse the login session instead of prompting"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sessions, 'DEFAULT_SESSION_FILE', str(tmp_path / 'session'))
+    runner = CliRunner()
+    try:
+        runner.invoke(cli, ['register', '--username', 'alice', '--password', 'pw'])
+        result = runner.invoke(cli, ['login', '--username', 'alice', '--password', 'pw'])
+        assert 'Login successful!' in result.output
+        assert (tmp_path / 'session').stat().st_mode & 0o077 == 0
+
+        result = runner.invoke(cli, ['add-transaction', '--type', 'expense',
+                                     '--category', 'Food', '--amount', '12.5',
+                                     '--description', 'Lunch'])
+        assert result.exit_code == 0
+        assert 'Transaction added successfully!' in result.output
+        assert 'Username' not in result.output
+
+        runner.invoke(cli, ['logout'])
+        assert not (tmp_path / 'session').exists()
+        # Without a session the command falls back to prompting for credentials
+        result = runner.invoke(cli, ['monthly-report'], input='alice\nwrong\n')
+        assert 'Username' in result.output
+        assert 'Authentication failed!' in result.output
+    finally:
+        close_all_pools()
+
+def test_cli_batch_shares_one_manager(tmp_path, monkeypatch):
+    """Test that batch runs every line against one FinanceManager and session"""
+    monkeypatch.setattr(sessions, 'DEFAULT_SESSION_FILE', str(tmp_path / 'session'))
+    db_path = str(tmp_path / 'batch.db')
+    FinanceManager(db_path).register_user('bob', 'pw')
+
+    created = []
+    original_init = FinanceManager.__init__
+    def counting_init(self, *args, **kwargs):
+        created.append(self)
+        original_init(self, *args, **kwargs)
+    monkeypatch.setattr(FinanceManager, '__init__', counting_init)
+
+    script = "\n".join([
+        "# three transactions and a budget",
+        "add-transaction --type income --category Salary --amount 1000 --description Pay",
+        "add-transaction --type expense --category Food --amount 40 --description 'Weekly shop'",
+        "",
+        "add-transaction --type expense --category Food",  # would prompt: fails
+        "set-budget --category Food --amount 100 --month 1 --year 2024",
+        "no-such-command",
+    ]) + "\n"
+    runner = CliRunner()
+    try:
+        result = runner.invoke(cli, ['--db', db_path, 'batch',
+                                     '--username', 'bob', '--password', 'pw'],
+                               input=script)
+        assert result.exit_code == 1
+        assert result.output.count('Transaction added successfully!') == 2
+        assert 'Budget set successfully!' in result.output
+        assert 'Line 5 failed' in result.output
+        assert 'Line 7 failed' in result.output
+        assert '2 lines failed.' in result.output
+        assert len(created) == 1
+
+        user_id = created[0].authenticate_user('bob', 'pw')
+        assert created[0].transaction_manager.get_balance(user_id) == 960
+    finally:
+        close_all_pools()
+
+def test_cli_failures_stop_batch(tmp_path, monkeypatch):
+    """Test that failing commands exit non-zero and stop a --stop-on-error batch"""
+    monkeypatch.setattr(sessions, 'DEFAULT_SESSION_FILE', str(tmp_path / 'session'))
+    db_path = str(tmp_path / 'failures.db')
+    FinanceManager(db_path).register_user('carol', 'pw')
+    runner = CliRunner()
+    try:
+        result = runner.invoke(cli, ['--db', db_path, 'rules', '--delete', '999',
+                                     '--username', 'carol', '--password', 'pw'])
+        assert result.exit_code == 1 and 'Rule not found!' in result.output
+
+        script = "rules --delete 999\nrecurring --delete 999\n"
+        result = runner.invoke(cli, ['--db', db_path, 'batch', '--stop-on-error',
+                                     '--username', 'carol', '--password', 'pw'],
+                               input=script)
+        assert result.exit_code == 1
+        assert 'Rule not found!' in result.output
+        assert 'Recurring transaction not found!' not in result.output
+        assert '1 lines failed.' in result.output
+
+        # A malformed cursor is a usage error, not a crash
+        for cursor in ('2024|zz', 'zz|1', '7'):
+            result = runner.invoke(cli, ['--db', db_path, 'view-transactions',
+                                         '--after', cursor, '--username', 'carol',
+                                         '--password', 'pw'])
+            assert result.exit_code == 2 and 'expected DATE|ID' in result.output
+
+        # An unexpected exception fails its line only
+        monkeypatch.setattr(FinanceManager, 'rebuild_rollups',
+                            lambda self: (_ for _ in ()).throw(ValueError('boom')))
+        result = runner.invoke(cli, ['--db', db_path, 'batch',
+                                     '--username', 'carol', '--password', 'pw'],
+                               input="rebuild\nrules\n")
+        assert result.exit_code == 1
+        assert "ValueError('boom')" in result.output
+        assert 'Line 1 failed' in result.output and 'Line 2 failed' not in result.output
+    finally:
+        close_all_pools()
+
+def test_startup_skips_heavy_imports_and_ddl(finance_manager):
+    """Test that importing the CLI is lazy and a current schema runs no DDL"""
+    check = ("import sys, finance_manager; "
+             "print(sorted({'bcrypt', 'tabulate', 'transactions', 'budget', 'reports', "
+             "'ingest', 'sessions', 'batch_reports', 'export', 'recurring'} "
+             "& set(sys.modules)))")
+    result = subprocess.run([sys.executable, '-c', check], capture_output=True,
+                            text=True, check=True)
+    assert result.stdout.strip() == '[]'
+    # The CLI's option defaults are the ones the modules use
+    import batch_reports, export, ingest, recurring, finance_manager as cli_module
+    assert (cli_module.DEFAULT_BATCH_SIZE, cli_module.DEFAULT_PAGE_SIZE) == (
+        transactions.DEFAULT_BATCH_SIZE, transactions.DEFAULT_PAGE_SIZE)
+    assert cli_module.STATEMENT_FORMATS == ingest.FORMATS
+    assert cli_module.DEFAULT_SESSION_TTL == sessions.DEFAULT_SESSION_TTL
+    assert cli_module.DEFAULT_CHUNK_SIZE == batch_reports.DEFAULT_CHUNK_SIZE
+    assert cli_module.DEFAULT_EXPORT_BATCH_SIZE == export.DEFAULT_EXPORT_BATCH_SIZE
+    assert cli_module.EXPORT_FORMATS == tuple(export.EXPORT_FORMATS)
+    assert (cli_module.INTERVAL_UNITS, cli_module.DEFAULT_SCHEDULER_BATCH_SIZE) == (
+        recurring.INTERVAL_UNITS, recurring.DEFAULT_SCHEDULER_BATCH_SIZE)
+
+    with get_pool(finance_manager.db_path).connection() as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == LATEST_VERSION
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            FinanceManager(finance_manager.db_path)
+        finally:
+            conn.set_trace_callback(None)
+    assert statements == ['PRAGMA user_version']
+
+def test_async_service_group_commits(finance_manager, test_user, monkeypatch):
+    """Test that concurrent async writes land in a few group commits"""
+    user_id = test_user['user_id']
+    tm = finance_manager.transaction_manager
+    groups = []
+    original = TransactionManager.add_transactions_group
+    def counting_group(self, items):
+        groups.append(len(items))
+        return original(self, items)
+    monkeypatch.setattr(TransactionManager, 'add_transactions_group', counting_group)
+
+    async def scenario():
+        async with AsyncFinanceService(finance_manager.db_path) as service:
+            results = await asyncio.gather(*(
+                service.add_transaction(user_id, 'expense', 'Food', 1.0, f'item {i}',
+                                        '2024-03-05')
+                for i in range(200)))
+            rejected = await service.add_transaction(user_id, 'expense', 'Food', -5)
+            balance = await service.get_balance(user_id)
+            report = await service.generate_monthly_report(user_id, 3, 2024)
+            return results, rejected, balance, report
+
+    results, rejected, balance, report = asyncio.run(scenario())
+    assert all(results) and len(results) == 200
+    assert rejected is False
+    assert balance == -200
+    assert 'Total Expenses: $200.00' in report
+    assert sum(groups) == 201
+    assert len(groups) < 10
+    assert tm.get_balance(user_id) == -200
+
+def test_write_behind_cancelled_future(finance_manager, test_user):
+    """Test that a cancelled queued row is skipped and the writer keeps going"""
+    user_id = test_user['user_id']
+    tm = finance_manager.transaction_manager
+    # A long delay keeps the first rows queued while one is cancelled
+    queue = tm.enable_write_behind(batch_size=100, max_delay=0.5)
+    kept = tm.queue_transaction(user_id, 'expense', 'Food', 1.0, 'kept', '2024-02-10')
+    cancelled = tm.queue_transaction(user_id, 'expense', 'Food', 2.0, 'cancelled',
+                                     '2024-02-10')
+    assert cancelled.cancel()
+    assert kept.result(timeout=5) is True
+    later = tm.queue_transaction(user_id, 'expense', 'Food', 4.0, 'later', '2024-02-10')
+    assert later.result(timeout=5) is True
+    last = tm.queue_transaction(user_id, 'expense', 'Food', 8.0, 'last', '2024-02-10')
+    assert queue in write_behind._open_queues
+    tm.close()
+    assert queue._thread.is_alive() is False
+    assert queue not in write_behind._open_queues
+    assert last.result(timeout=5) is True
+    assert tm.get_balance(user_id) == -13
+
+def test_write_behind_stress(finance_manager, test_user):
+    """Test that 32 producer threads lose no rows through the write-behind queue"""
+    user_id = test_user['user_id']
+    tm = finance_manager.transaction_manager
+    tm.enable_write_behind(batch_size=100, max_delay=0.01)
+    threads, per_thread = 32, 50
+    futures = []
+    futures_lock = threading.Lock()
+
+    def producer(worker):
+        mine = [tm.queue_transaction(user_id, 'expense', f'Cat{worker % 4}', 1.0,
+                                     f'worker {worker} row {i}', '2024-02-10')
+                for i in range(per_thread)]
+        with futures_lock:
+            futures.extend(mine)
+
+    workers = [threading.Thread(target=producer, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    rejected = tm.queue_transaction(user_id, 'expense', 'Food', 'not a number')
+    tm.close()
+
+    assert all(future.result(timeout=5) for future in futures)
+    assert rejected.result(timeout=5) is False
+    with get_pool(finance_manager.db_path).connection() as conn:
+        count = conn.execute('SELECT COUNT(*) FROM transactions WHERE user_id = ?',
+                             (user_id,)).fetchone()[0]
+        assert check_rollups(conn) == []
+    assert count == threads * per_thread
+    assert tm.get_balance(user_id) == -threads * per_thread
+    with pytest.raises(RuntimeError):
+        tm.write_queue.submit(user_id, 'expense', 'Food', 1.0)
+
+def test_batch_statements(finance_manager, test_user, tmp_path):
+    """Test that statements are written per user by parallel read-only workers"""
+    tm = finance_manager.transaction_manager
+    finance_manager.register_user('second', 'pw')
+    finance_manager.register_user('third', 'pw')
+    tm.add_transaction(test_user['user_id'], 'expense', 'Food', 42.0, 'Dinner', '2024-05-02')
+    tm.add_transaction(2, 'income', 'Salary', 900.0, 'Pay', '2024-05-01')
+
+    results = list(iter_statements(finance_manager.db_path, str(tmp_path), 5, 2024,
+                                   workers=2, chunk_size=1))
+    assert sorted(r.user_id for r in results) == [1, 2, 3]
+    assert all(r.error is None for r in results)
+    first = (tmp_path / 'statement_1.txt').read_text()
+    assert first.startswith('Statement for testuser - 5/2024')
+    assert 'Total Expenses: $42.00' in first
+    assert 'Total Income: $900.00' in (tmp_path / 'statement_2.txt').read_text()
+
+    # Reconfiguring changes the pool in place, so managers already holding
+    # it, and connections borrowed before, follow the new settings
+    tm = finance_manager.transaction_manager
+    borrowed = tm.pool.acquire()
+    pool = configure_pool(finance_manager.db_path, size=1, read_only=True)
+    assert tm.pool is pool is get_pool(finance_manager.db_path)
+    assert borrowed.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 3
+    tm.pool.release(borrowed)
+    with pytest.raises(sqlite3.ProgrammingError):
+        borrowed.execute('SELECT 1')
+    with get_pool(finance_manager.db_path).connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 3
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM users")
+    assert not tm.add_transaction(1, 'expense', 'Food', 5)
+
+def test_numpy_analytics(finance_manager, test_user):
+    """Test vectorised percentiles, rolling averages and trends against plain Python"""
+    np = pytest.importorskip('numpy')
+    from analytics import (AnalyticsEngine, category_percentiles, rolling_averages,
+                           trend_slopes)
+    user_id = test_user['user_id']
+    rows = [('expense', 'Food', amount, None, f'2024-{month:02d}-1{day} 12:00:00')
+            for month, amounts in ((1, [10, 20, 30]), (2, [40]), (4, [50, 70]))
+            for day, amount in enumerate(amounts)]
+    rows += [('expense', 'Rent', 500, None, f'2024-{month:02d}-01') for month in (1, 2, 3, 4)]
+    rows.append(('income', 'Salary', 1000, None, '2024-01-01'))
+    finance_manager.transaction_manager.add_transactions_bulk(user_id, rows)
+
+    data = AnalyticsEngine(finance_manager.db_path).load(user_id)
+    assert data.category_names == ['Food', 'Rent']
+    assert len(data.amounts) == 10
+
+    food, rent = category_percentiles(data, (50, 90))
+    food_amounts = [10, 20, 30, 40, 50, 70]
+    assert food.category == 'Food' and food.count == 6
+    assert food.values == pytest.approx(tuple(np.percentile(food_amounts, [50, 90])))
+    assert rent.values == (500, 500)
+
+    rolling = rolling_averages(data, (3, 12))
+    assert rolling.months == ['2024-01', '2024-02', '2024-03', '2024-04']
+    assert list(rolling.totals) == [560, 540, 500, 620]
+    assert np.isnan(rolling.averages[3][:2]).all()
+    assert list(rolling.averages[3][2:]) == pytest.approx([(560 + 540 + 500) / 3,
+                                                           (540 + 500 + 620) / 3])
+    assert np.isnan(rolling.averages[12]).all()
+
+    trends = dict(trend_slopes(data))
+    assert trends['Rent'] == pytest.approx(0)
+    assert trends['Food'] == pytest.approx(np.polyfit([0, 1, 2, 3], [60, 40, 0, 120], 1)[0])
+
+def test_analytics_multi_currency(finance_manager, test_user, tmp_path):
+    """Test analytics convert amounts to the base currency at month-end rates"""
+    pytest.importorskip('numpy')
+    from analytics import AnalyticsEngine, category_percentiles, rolling_averages
+    user_id = test_user['user_id']
+    tm = finance_manager.transaction_manager
+    fx = finance_manager.fx_manager
+    rates = tmp_path / 'rates.csv'
+    rates.write_text('date,currency,rate\n'
+                     '2024-05-01,EUR,1.10\n2024-05-31,EUR,1.20\n2024-06-30,EUR,1.25\n')
+    assert fx.import_csv(str(rates)) == 3
+    tm.add_transaction(user_id, 'expense', 'Travel', 100, None, '2024-05-10', 'EUR')
+    tm.add_transaction(user_id, 'expense', 'Travel', 50, None, '2024-05-20')
+    tm.add_transaction(user_id, 'expense', 'Travel', 10, None, '2024-06-05', 'EUR')
+    engine = AnalyticsEngine(finance_manager.db_path)
+
+    data = engine.load(user_id)
+    assert data.currency == 'USD'
+    assert list(rolling_averages(data, (1,)).totals) == pytest.approx([170, 12.5])
+    travel, = category_percentiles(data, (0, 100))
+    assert travel.values == pytest.approx((12.5, 120))
+
+    assert fx.set_base_currency(user_id, 'EUR')
+    data = engine.load(user_id)
+    assert data.currency == 'EUR'
+    assert sorted(data.amounts) == pytest.approx([10, 41.67, 100])
+
+    # No GBP rate: fail rather than add pounds to euros
+    tm.add_transaction(user_id, 'expense', 'Travel', 5, None, '2024-06-07', 'GBP')
+    assert engine.load(user_id) is None
+
+def test_result_cache_invalidation(finance_manager, test_user):
+    """Test cached reports survive unrelated writes and are dropped by related ones"""
+    user_id = test_user['user_id']
+    tm = finance_manager.transaction_manager
+    rg = finance_manager.report_generator
+    bm = finance_manager.budget_manager
+    cache = configure_cache(finance_manager.db_path)
+    tm.add_transaction(user_id, 'expense', 'Food', 10.0, None, '2024-06-10')
+    bm.set_budget(user_id, 'Food', 5.0, 6, 2024)
+
+    june = rg.generate_monthly_report(user_id, 6, 2024)
+    warning = bm.check_budget_status(user_id, 6, 2024)
+    assert rg.generate_monthly_report(user_id, 6, 2024) is june
+    assert cache.stats().hits == 1
+
+    # Another month or another user leaves June's entries alone
+    tm.add_transaction(user_id, 'expense', 'Food', 99.0, None, '2024-07-10')
+    tm.add_transaction(user_id + 1, 'expense', 'Food', 99.0, None, '2024-06-10')
+    assert rg.generate_monthly_report(user_id, 6, 2024) is june
+    yearly = rg.generate_yearly_report(user_id, 2024)
+    assert 'Total Expenses: $109.00' in yearly
+
+    tm.add_transaction(user_id, 'expense', 'Food', 1.0, None, '2024-06-11')
+    assert 'Total Expenses: $11.00' in rg.generate_monthly_report(user_id, 6, 2024)
+    assert 'Total Expenses: $110.00' in rg.generate_yearly_report(user_id, 2024)
+    bm.set_budget(user_id, 'Food', 50.0, 6, 2024)
+    assert bm.check_budget_status(user_id, 6, 2024) != warning
+    assert cache.stats().invalidations > 0
+
+    small = ResultCache(max_entries=2, ttl=0.05)
+    for key in 'abc':
+        small.get_or_compute(1, key, None, (), lambda: key)
+    assert small.stats().size == 2 and small.stats().evictions == 1
+    time.sleep(0.06)
+    assert small.get_or_compute(1, 'c', None, (), lambda: 'fresh') == 'fresh'
+
+_property_users = itertools.count(1000)
+
+@settings(max_examples=50, deadline=None,
+          suppress_health_check=[HealthCheck.function_scoped_fixture])
+@given(st.lists(st.tuples(st.decimals(min_value='0.01', max_value='1000000', places=2),
+                          st.integers(1, 12), st.booleans()), min_size=1, max_size=40))
+def test_money_sums_are_exact(finance_manager, rows):
+    """Test stored sums equal exact decimal sums, whether amounts arrive as text or floats"""
+    user_id = next(_property_users)
+    tm = finance_manager.transaction_manager
+    tm.add_transactions_bulk(user_id, [
+        ('expense', 'Misc', float(amount) if as_float else str(amount), None,
+         f'2024-{month:02d}-15') for amount, month, as_float in rows])
+    expected = sum(amount for amount, _, _ in rows)
+
+    balance = tm.get_balance(user_id)
+    assert isinstance(balance, Money) and balance.to_decimal() == -expected
+    rg = finance_manager.report_generator
+    rollup = rg.get_period_totals(user_id, '2024-01-01', '2025-01-01')
+    scan = rg.get_period_totals(user_id, '2024-01-01', '2024-12-31 23:59:59')
+    assert sum(t.total for t in rollup).to_decimal() == expected
+    assert sum(t.total for t in scan).to_decimal() == expected
+    assert Money.parse(Decimal('0.1')) + Money.parse(0.2) == Decimal('0.3')
+
+def test_multi_currency_reports(finance_manager, test_user, tmp_path):
+    """Test reports, budgets and balances convert to the base currency at month-end rates"""
+    user_id = test_user['user_id']
+    tm = finance_manager.transaction_manager
+    rg = finance_manager.report_generator
+    bm = finance_manager.budget_manager
+    fx = finance_manager.fx_manager
+    rates = tmp_path / 'rates.csv'
+    rates.write_text('date,currency,rate\n'
+                     '2024-05-01,EUR,1.10\n2024-05-31,EUR,1.20\n2024-06-30,EUR,1.25\n'
+                     '2024-06-30,GBP,1.50\n')
+    assert fx.import_csv(str(rates)) == 4
+
+    tm.add_transaction(user_id, 'expense', 'Travel', 100, None, '2024-05-10', 'EUR')
+    tm.add_transaction(user_id, 'expense', 'Travel', 50, None, '2024-05-20')
+    tm.add_transaction(user_id, 'expense', 'Travel', 10, None, '2024-06-05', 'GBP')
+    assert 'Total Expenses: $170.00' in rg.generate_monthly_report(user_id, 5, 2024)
+    yearly = rg.get_period_totals(user_id, '2024-01-01', '2025-01-01')
+    assert sum(t.total for t in yearly) == Money(18500)
+    scan = rg.get_period_totals(user_id, '2024-05-01', '2024-06-30 23:59:59')
+    assert sorted(scan) == sorted(yearly)
+    analysis = rg.generate_category_analysis(user_id, '2024-01-01', '2024-12-31')
+    assert '$185.00' in analysis and '$15.00' in analysis
+
+    assert fx.set_base_currency(user_id, 'eur')
+    assert 'Total Expenses: €141.67' in rg.generate_monthly_report(user_id, 5, 2024)
+    assert tm.add_transaction(user_id, 'income', 'Salary', 1000, None, '2024-06-01')
+    # Balances convert at the latest rate: USD at 1/1.25, GBP at 1.50/1.25
+    assert tm.get_balance(user_id) == Money(100000 - 10000 - 4000 - 1200, 'EUR')
+    bm.set_budget(user_id, 'Travel', 20, 6, 2024)
+    status, = bm.get_budget_status(user_id, 6, 2024)
+    assert status.budget == Money(2000, 'EUR') and status.spent == Money(1200, 'EUR')
+
+    # No JPY rate yet: reports fail rather than mixing currencies
+    tm.add_transaction(user_id, 'expense', 'Travel', 500, None, '2024-06-07', 'JPY')
+    assert rg.generate_monthly_report(user_id, 6, 2024) is None
+    assert rg.generate_monthly_report(user_id, 5, 2024) is not None
+    with finance_manager.pool.connection() as conn:
+        assert check_rollups(conn) == []
+
+def test_gui_paging_and_background_worker(finance_manager, test_user, monkeypatch):
+    """Test the GUI's page window holds a bounded slice and the worker calls back on Tk"""
+    user_id = test_user['user_id']
+    tm = finance_manager.transaction_manager
+    tm.add_transactions_bulk(user_id, [
+        ('expense', 'Food', 1 + i % 50, f'item {i}',
+         f'2024-01-01 00:{i // 60:02d}:{i % 60:02d}') for i in range(1050)])
+    expected = [t.id for t in tm.iter_transactions(user_id)]
+
+    window = PageWindow(page_size=100, max_pages=3)
+    shown = deque()
+
+    def load(request, at_end):
+        index, cursor = request
+        rows, next_cursor = tm.get_transactions_page(user_id, window.page_size, cursor)
+        drop = window.add(index, rows, next_cursor)
+        ids = [row.id for row in rows]
+        if at_end:
+            shown.extend(ids)
+            for _ in range(drop):
+                shown.popleft()
+        else:
+            shown.extendleft(reversed(ids))
+            for _ in range(drop):
+                shown.pop()
+        assert len(shown) <= 300 and list(shown) == expected[window.first * 100:][:len(shown)]
+
+    while (request := window.next_page()) is not None:
+        load(request, at_end=True)
+    assert window.last_page == 10 and list(shown) == expected[-250:]
+    while (request := window.previous_page()) is not None:
+        load(request, at_end=False)
+    assert list(shown) == expected[:300]
+
+    class Root:
+        def __init__(self):
+            self.scheduled = []
+        def after(self, delay, callback):
+            self.scheduled.append(callback)
+        def config(self, **options):
+            pass
+
+    root = Root()
+    worker = BackgroundWorker(root)
+    results = []
+    worker.submit(threading.get_ident, on_done=results.append)
+    worker.submit(lambda: 1 / 0, on_error=results.append)
+    while root.scheduled:
+        time.sleep(0.01)
+        root.scheduled.pop(0)()
+    worker.shutdown()
+    assert results[0] != threading.get_ident() and isinstance(results[1], ZeroDivisionError)
+
+    class ClosedGrid:
+        def winfo_exists(self):
+            return False
+    # A page or error arriving after the grid's window closed is dropped
+    closed = ClosedGrid()
+    TransactionGrid._show(closed, 0, tm.get_transactions_page(user_id, 10))
+    TransactionGrid._failed(closed, sqlite3.Error('gone'))
+    assert closed._loading is False
+
+def test_transaction_search(finance_manager, test_user):
+    """Test full-text search stays in step with writes and pages by offset"""
+    user_id = test_user['user_id']
+    finance_manager.register_user('searcher', 'password123')
+    other_id = finance_manager.authenticate_user('searcher', 'password123')
+    tm = finance_manager.transaction_manager
+    tm.add_transactions_bulk(user_id, [
+        ('expense', 'Groceries', 10 + i, f'Corner grocery store #{i}', '2024-02-01')
+        for i in range(5)] + [('expense', 'Dining', 30, 'Café Müller', '2024-02-02'),
+                              ('expense', 'Fun', 20, 'Dining out', '2024-01-15')])
+    tm.add_transaction(user_id, 'expense', 'Transport', 12, 'Train ticket "return"')
+    tm.add_transaction(other_id, 'expense', 'Groceries', 99, 'Corner grocery store')
+
+    def search(query, **options):
+        rows, next_offset = tm.search_transactions(user_id, query, **options)
+        return [row.description for row in rows], next_offset
+
+    found, next_offset = search('groc store', limit=3)
+    assert len(found) == 3 and next_offset == 3
+    rest, next_offset = search('groc store', limit=3, offset=3)
+    assert len(rest) == 2 and next_offset is None
+    assert sorted(found + rest) == [f'Corner grocery store #{i}' for i in range(5)]
+    assert search('cafe muller')[0] == ['Café Müller']
+    # Whole words in the description outrank newer matches on the category
+    assert search('dining')[0] == ['Dining out', 'Café Müller']
+    assert search('"return" OR')[0] == []
+    assert search('ticket "return"')[0] == ['Train ticket "return"']
+    assert search('   ') == ([], None)
+
+    train = next(tm.iter_transactions(user_id, category='Transport'))
+    assert tm.update_transaction(train.id, user_id, description='Bus pass')
+    assert search('train')[0] == [] and search('bus')[0] == ['Bus pass']
+    assert tm.delete_transaction(train.id, user_id)
+    assert search('bus')[0] == []
+
+def test_rule_categorisation(finance_manager, test_user, tmp_path):
+    """Test compiled rules pick the best match and fill categories on write"""
+    categoriser = Categoriser([('amazon', 'Shopping', 0), ('amazon prime', 'Streaming', 5),
+                               ('prime', 'Other', 1), ('uber', 'Travel', 0),
+                               ('uber eats', 'Dining', 0), ('Café', 'Coffee', 0)])
+    assert categoriser.categorise('AMAZON MKTP') == 'Shopping'
+    # A longer pattern, a later word and a shorter pattern each win on priority
+    assert categoriser.categorise('Amazon Prime Video') == 'Streaming'
+    assert categoriser.categorise('UBER EATS 123') == 'Travel'
+    assert categoriser.categorise('prime amazon') == 'Other'
+    assert categoriser.categorise('Subaru') is None
+    assert categoriser.categorise('CAFÉ NERO') == 'Coffee'
+    assert categoriser.categorise('ticket', default='Other') == 'Other'
+
+    user_id = test_user['user_id']
+    rm = finance_manager.rule_manager
+    tm = finance_manager.transaction_manager
+    assert rm.add_rule(user_id, 'Tesco', 'Groceries')
+    assert rm.add_rule(user_id, 'netflix', 'Fun', priority=2)
+    assert rm.add_rule(user_id, 'netflix', 'Streaming', priority=3)
+    assert [(r.pattern, r.category) for r in rm.get_rules(user_id)] == [
+        ('netflix', 'Streaming'), ('tesco', 'Groceries')]
+    assert len(rm.get_categoriser(user_id)) == 2
+
+    assert tm.add_transaction(user_id, 'expense', None, 5, 'TESCO EXPRESS', categorise=True)
+    tm.add_transactions_bulk(user_id, [
+        ('expense', None, 9.99, 'Netflix.com'), ('expense', 'Fun', 3, 'Netflix'),
+        {'type': 'expense', 'amount': 1, 'description': 'Unknown shop'}], categorise=True)
+    statement = tmp_path / 'statement.csv'
+    statement.write_text('Date,Description,Amount\n14/02/2024,TESCO STORES,-45.10\n')
+    ingest_file(str(statement), tm, user_id, category_map={'stores': 'Household'})
+    rule = next(r for r in rm.get_rules(user_id) if r.pattern == 'tesco')
+    assert rm.delete_rule(user_id, rule.id)
+    assert tm.add_transaction(user_id, 'expense', '', 2, 'Tesco', categorise=True)
+    assert [(t.description, t.category) for t in tm.iter_transactions(user_id)
+            if t.date < '2024-06'] == [('TESCO STORES', 'Household')]
+    assert sorted((t.description, t.category) for t in tm.iter_transactions(user_id)
+                  if t.date >= '2024-06') == [
+        ('Netflix', 'Fun'), ('Netflix.com', 'Streaming'), ('TESCO EXPRESS', 'Groceries'),
+        ('Tesco', 'Uncategorized'), ('Unknown shop', 'Uncategorized')]
+
+def test_snapshot_export(finance_manager, test_user, tmp_path):
+    """Test full and incremental columnar exports, including deletions"""
+    ds = pytest.importorskip('pyarrow.dataset')
+    from export import SnapshotExporter
+    user_id = test_user['user_id']
+    tm = finance_manager.transaction_manager
+    tm.add_transactions_bulk(user_id, [
+        ('expense', 'Food', 10, 'Lunch', '2024-01-05 12:00:00'),
+        ('expense', 'Rent', 500, 'Flat', '2024-02-01 09:00:00'),
+        ('income', 'Pay', 900, 'Salary', '2024-02-25 09:00:00')])
+    finance_manager.budget_manager.set_budget(user_id, 'Food', 100, 1, 2024)
+    tm.update_transaction(1, user_id, amount=10)
+    exporter = SnapshotExporter(finance_manager.db_path)
+    target = str(tmp_path / 'export')
+
+    def logged():
+        with finance_manager.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM export_changes').fetchone()[0]
+    # Nothing is logged before the first export, and exports prune what they read
+    assert logged() == 0
+    result = exporter.export(target, user_id)
+    assert (result['snapshot'], result['incremental']) == (1, False)
+    assert (result['transactions'], result['budgets']) == (3, 1)
+    table = ds.dataset(f"{target}/transactions", partitioning='hive').to_table()
+    assert sorted(zip(table['year'].to_pylist(), table['month'].to_pylist(),
+                      table['amount_cents'].to_pylist())) == [
+        (2024, 1, 1000), (2024, 2, 50000), (2024, 2, 90000)]
+
+    ids = {t.description: t.id for t in tm.iter_transactions(user_id)}
+    tm.update_transaction(ids['Flat'], user_id, amount=550)
+    tm.delete_transaction(ids['Lunch'], user_id)
+    tm.add_transaction(user_id, 'expense', 'Fun', 20, 'Cinema', '2024-03-02 20:00:00')
+    cinema = max(t.id for t in tm.iter_transactions(user_id))
+    result = exporter.export(target, user_id)
+    assert (result['snapshot'], result['incremental']) == (2, True)
+    assert (result['transactions'], result['budgets']) == (3, 0)
+    table = ds.dataset(f"{target}/transactions", partitioning='hive').to_table()
+    latest = sorted((row['id'], row['deleted'], row['amount_cents'])
+                    for row in table.to_pylist() if row['snapshot'] == 2)
+    assert latest == [(ids['Lunch'], True, None), (ids['Flat'], False, 55000),
+                      (cinema, False, 2000)]
+    assert logged() == 0
+
+    result = exporter.export(target, user_id)
+    assert (result['snapshot'], result['transactions'], result['files']) == (3, 0, [])
+    # A directory keeps one scope, and a full export starts it again
+    assert exporter.export(target) is None
+    result = exporter.export(target, incremental=False, format='arrow')
+    assert (result['snapshot'], result['transactions']) == (1, 3)
+    table = ds.dataset(f"{target}/transactions", format='arrow',
+                       partitioning='hive').to_table()
+    assert sorted(table['description'].to_pylist()) == ['Cinema', 'Flat', 'Salary']
+
+def test_recurring_transactions(finance_manager, test_user, monkeypatch):
+    """Test the scheduler catches up, clamps month ends and never adds twice"""
+    user_id = test_user['user_id']
+    rm = finance_manager.recurring_manager
+    tm = finance_manager.transaction_manager
+    assert rm.add_recurring(user_id, 'expense', 'Rent', 950, 'Rent', start_date='2024-01-31')
+    assert rm.add_recurring(user_id, 'income', 'Salary', 2000, 'Pay', interval='week',
+                            every=2, start_date='2024-01-05', end_date='2024-02-16')
+    assert not rm.add_recurring(user_id, 'expense', 'Rent', 950, interval='fortnight')
+    assert not rm.add_recurring(user_id, 'expense', 'Rent', 950, start_date='2024-02-01',
+                                end_date='2024-01-01')
+
+    # Nothing is due yet; then one run catches up on three months
+    assert rm.run_scheduler('2023-12-31') == {'rules': 0, 'transactions': 0}
+    assert rm.run_scheduler('2024-03-31', batch_size=1) == {'rules': 2, 'transactions': 7}
+    assert rm.run_scheduler('2024-03-31') == {'rules': 0, 'transactions': 0}
+    assert sorted((t.date[:10], t.category) for t in tm.iter_transactions(user_id)) == [
+        ('2024-01-05', 'Salary'), ('2024-01-19', 'Salary'), ('2024-01-31', 'Rent'),
+        ('2024-02-02', 'Salary'), ('2024-02-16', 'Salary'), ('2024-02-29', 'Rent'),
+        ('2024-03-31', 'Rent')]
+    assert [(r.category, r.next_due) for r in rm.get_recurring(user_id)] == [
+        ('Rent', '2024-04-30 00:00:00'), ('Salary', None)]
+
+    # Even with its progress lost, a rule does not add an occurrence twice
+    with finance_manager.pool.connection() as conn:
+        conn.execute("UPDATE recurring_transactions SET next_due = start_date, "
+                     "occurrences = 0 WHERE category = 'Rent'")
+        conn.commit()
+        assert rm.run_scheduler('2024-04-30') == {'rules': 1, 'transactions': 1}
+        assert check_rollups(conn) == []
+    rent = rm.get_recurring(user_id)[0]
+    assert rm.delete_recurring(user_id, rent.id)
+    assert rm.run_scheduler('2025-01-01') == {'rules': 0, 'transactions': 0}
+    assert len(list(tm.iter_transactions(user_id))) == 8
+
+    # batch_size bounds the rows per write: a daily rule after long downtime
+    # is written in several batches, saving its progress after each
+    assert rm.add_recurring(user_id, 'expense', 'Coffee', 3, interval='day',
+                            start_date='2024-01-01')
+    commits = []
+    invalidate = rm.cache.invalidate_months
+    monkeypatch.setattr(rm.cache, 'invalidate_months',
+                        lambda touched: commits.append(touched) or invalidate(touched))
+    assert rm.run_scheduler('2024-01-10', batch_size=4) == {'rules': 1, 'transactions': 10}
+    assert len(commits) == 3
+    coffee = rm.get_recurring(user_id)[0]
+    assert coffee.next_due == '2024-01-11 00:00:00'
+    assert len(list(tm.iter_transactions(user_id, category='Coffee'))) == 10
@@ -1,39 +1,370 @@
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
 import sqlite3
-from tabulate import tabulate
+import threading
+from cache import get_cache
+from database import get_pool
+from defaults import DEFAULT_BATCH_SIZE, DEFAULT_PAGE_SIZE
+from fx import FxManager, MissingRateError, base_currency
+from money import DEFAULT_CURRENCY, Money, to_cents
+from presentation import render_transactions
+from rollups import RollupDelta
+from rules import DEFAULT_CATEGORY, RuleManager
+
+TRANSACTION_TYPES = ('income', 'expense')
+ROW_FIELDS = ('type', 'category', 'amount', 'description', 'date', 'currency')
+DEFAULT_STREAM_PAGE_SIZE = 1000
+MAX_STORED_ERRORS = 1000
+
+INSERT_TRANSACTION = """
+    INSERT INTO transactions
+        (user_id, type, category, amount_cents, description, date, currency)
+    VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)
+"""
+
+class Transaction(NamedTuple):
+    """One row of the transactions table"""
+    id: int
+    user_id: int
+    type: str
+    category: str
+    amount: Money
+    description: Optional[str]
+    date: str
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from a row selected with TRANSACTION_COLUMNS"""
+        id, user_id, type, category, cents, description, date, currency = row
+        return cls(id, user_id, type, category, Money(cents, currency), description, date)
+
+TRANSACTION_COLUMNS = 'id, user_id, type, category, amount_cents, description, date, currency'
+
+def current_timestamp():
+    """Now in UTC, formatted like SQLite's CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def normalize_date(value):
+    """Return a date/datetime as the 'YYYY-MM-DD HH:MM:SS' text stored in the database"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        parsed = datetime.fromisoformat(value)
+        # Fast path: already in storage format, no need to re-render
+        if len(value) == 19 and value[10] == ' ':
+            return value
+        if len(value) == 10:
+            return value + ' 00:00:00'
+        value = parsed
+    elif not isinstance(value, datetime):
+        # datetime.date
+        value = datetime(value.year, value.month, value.day)
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+def normalize_currency(currency, amount=None, default=DEFAULT_CURRENCY):
+    """Return an ISO 4217 code such as 'USD', taken from a Money amount if not given"""
+    if not currency:
+        return amount.currency if isinstance(amount, Money) else default
+    code = str(currency).strip().upper()
+    if len(code) != 3 or not code.isalpha():
+        raise ValueError(f"invalid currency {currency!r}")
+    return code
+
+def search_expression(text, prefix=True):
+    """Turn free text into an FTS5 query matching rows with every word.
+
+    Each word is quoted, so FTS5 operators and punctuation in the text are
+    searched for literally instead of raising a syntax error. With prefix,
+    each word also matches longer words starting with it.
+    """
+    star = '*' if prefix else ''
+    return ' '.join('"{}"{}'.format(word.replace('"', '""'), star) for word in text.split())
+
+def validate_row(row, default_currency=DEFAULT_CURRENCY):
+    """Validate one transaction row (a mapping or a sequence in ROW_FIELDS order).
+
+    Returns the (type, category, amount_cents, description, date, currency)
+    values to insert, or raises ValueError describing why the row was rejected.
+    The currency defaults to the amount's if it is a Money, else default_currency.
+    """
+    if isinstance(row, dict):
+        values = [row.get(field) for field in ROW_FIELDS]
+    else:
+        values = list(row) + [None] * (len(ROW_FIELDS) - len(row))
+        if len(values) > len(ROW_FIELDS):
+            raise ValueError(f"expected at most {len(ROW_FIELDS)} fields")
+    type, category, amount, description, date, currency = values
+
+    if type not in TRANSACTION_TYPES:
+        raise ValueError(f"invalid type {type!r}")
+    if not category or not str(category).strip():
+        raise ValueError("missing category")
+    cents = to_cents(amount)
+    if cents <= 0:
+        raise ValueError(f"amount must be positive, got {amount!r}")
+    currency = normalize_currency(currency, amount, default_currency)
+    try:
+        date = normalize_date(date)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid date {date!r}")
+    return (type, str(category).strip(), cents, description, date, currency)
+
+# transactions_fts rowids are user_id * SEARCH_USER_STRIDE + id (migration 11)
+SEARCH_USER_STRIDE = 1 << 32
+
+INDEX_NEW_ROWS = f"""
+    INSERT INTO transactions_fts (rowid, description, category)
+    SELECT user_id * {SEARCH_USER_STRIDE} + id, description, category FROM transactions
+    WHERE id > ? AND user_id IS NOT NULL
+"""
+
+# bm25() would need each word's document count over every user's rows, a scan
+# of the whole index per query. Instead each tier (?1-?3) reads only the
+# user's rowid range, newest first, and the UNION ALL stops as soon as the page
+# is full, so the prefix tier, the costliest, often never runs
+SEARCH_TRANSACTIONS = """
+    WITH matches AS (
+        SELECT 0 AS tier, rowid FROM (
+            SELECT rowid FROM transactions_fts
+            WHERE transactions_fts MATCH ?1 AND rowid >= ?4 AND rowid < ?5
+            ORDER BY rowid DESC)
+        UNION ALL
+        SELECT 1, rowid FROM (
+            SELECT rowid FROM transactions_fts
+            WHERE transactions_fts MATCH ?2 AND rowid >= ?4 AND rowid < ?5
+            ORDER BY rowid DESC)
+        UNION ALL
+        SELECT 2, rowid FROM (
+            SELECT rowid FROM transactions_fts
+            WHERE transactions_fts MATCH ?3 AND rowid >= ?4 AND rowid < ?5
+            ORDER BY rowid DESC)
+        LIMIT ?6 OFFSET ?7
+    )
+    SELECT t.id, t.user_id, t.type, t.category, t.amount_cents,
+           t.description, t.date, t.currency
+    FROM matches m
+    JOIN transactions t ON t.id = m.rowid - ?4
+    ORDER BY m.tier, m.rowid DESC
+"""
+
+@contextmanager
+def deferred_search_index(conn):
+    """Index the rows inserted in the block with one statement, not a trigger per row.
+
+    Must run inside the caller's write transaction, which holds the write
+    lock, so no other connection's inserts can go unindexed meanwhile.
+    """
+    conn.execute('INSERT INTO fts_deferred DEFAULT VALUES')
+    last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+    yield
+    conn.execute(INDEX_NEW_ROWS, (last_id,))
+    conn.execute('DELETE FROM fts_deferred')
 
 class TransactionManager:
     def __init__(self, db_path='finance.db'):
         self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self.cache = get_cache(db_path)
+        self.fx = FxManager(db_path)
+        self.rules = RuleManager(db_path)
+        self.write_queue = None
+        self._write_queue_lock = threading.Lock()
+
+    def enable_write_behind(self, batch_size=None, max_delay=None):
+        """Start write-behind mode: queue_transaction goes through one writer thread"""
+        from write_behind import (WriteBehindQueue, DEFAULT_WRITE_BATCH_SIZE,
+                                  DEFAULT_WRITE_DELAY)
+        with self._write_queue_lock:
+            if self.write_queue is None or self.write_queue.closed:
+                self.write_queue = WriteBehindQueue(
+                    self,
+                    DEFAULT_WRITE_BATCH_SIZE if batch_size is None else batch_size,
+                    DEFAULT_WRITE_DELAY if max_delay is None else max_delay)
+            return self.write_queue
+
+    def queue_transaction(self, user_id, type, category, amount, description=None,
+                          date=None):
+        """Queue a transaction for group commit and return a Future.
 
-    def add_transaction(self, user_id, type, category, amount, description=None):
-        """Add a new transaction"""
-        conn = sqlite3.connect(self.db_path)
+        The Future resolves to True once the row is committed, or False if it
+        was rejected. Write-behind mode is started with defaults if needed.
+        """
+        write_queue = self.write_queue
+        if write_queue is None or write_queue.closed:
+            write_queue = self.enable_write_behind()
+        return write_queue.submit(user_id, type, category, amount, description, date)
+
+    def flush_writes(self, timeout=None):
+        """Block until every queued transaction has been committed"""
+        if self.write_queue is not None:
+            self.write_queue.flush(timeout)
+
+    def close(self):
+        """Commit queued transactions and stop the write-behind writer"""
+        if self.write_queue is not None:
+            self.write_queue.close()
+
+    def add_transaction(self, user_id, type, category, amount, description=None,
+                        date=None, currency=None, categorise=False):
+        """Add a new transaction, dated now unless a date is given.
+
+        The currency defaults to the user's base currency. With categorise, a
+        missing category is filled in from the user's rules (see rules.py).
+        """
+        conn = self.pool.acquire()
         cursor = conn.cursor()
 
         try:
-            cursor.execute("""
-                INSERT INTO transactions (user_id, type, category, amount, description)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, type, category, amount, description))
+            if categorise and not category:
+                category = self.rules.get_categoriser(user_id, conn).categorise(
+                    description, DEFAULT_CATEGORY)
+            date = normalize_date(date) or current_timestamp()
+            cents = to_cents(amount)
+            currency = normalize_currency(currency, amount,
+                                          base_currency(conn, user_id))
+            cursor.execute(INSERT_TRANSACTION, (user_id, type, category, cents,
+                                                description, date, currency))
+            delta = RollupDelta()
+            delta.add(user_id, type, category, cents, date, currency)
+            touched = delta.touched()
+            delta.apply(conn)
             conn.commit()
+            self.cache.invalidate_months(touched)
             return True
-        except sqlite3.Error as e:
+        except (sqlite3.Error, ValueError) as e:
             print(f"Error adding transaction: {e}")
             return False
         finally:
-            conn.close()
+            self.pool.release(conn)
+
+    def add_transactions_bulk(self, user_id, rows, batch_size=DEFAULT_BATCH_SIZE,
+                              categorise=False, on_error=None):
+        """Insert many transactions from any iterable, one transaction per batch.
+
+        Rows are validated first; invalid rows are skipped and reported rather
+        than aborting their batch. With categorise, missing categories are
+        filled in from the user's rules first. Returns a dict with 'accepted'
+        and 'rejected' counts and 'errors' as (row_number, reason) pairs, the
+        first MAX_STORED_ERRORS of them; on_error(row_number, reason), if
+        given, is called for every rejected row.
+
+        A database error stops the import: batches already committed stay,
+        the failed batch's rows are rejected, and 'error' holds the message
+        (it is None otherwise).
+        """
+        result = {'accepted': 0, 'rejected': 0, 'errors': [], 'error': None}
+        batch = []
+        batch_rows = []
+
+        def reject(row_number, reason):
+            result['rejected'] += 1
+            # A file of bad rows must not grow the result without bound
+            if len(result['errors']) < MAX_STORED_ERRORS:
+                result['errors'].append((row_number, reason))
+            if on_error is not None:
+                on_error(row_number, reason)
+
+        def flush(conn):
+            delta = RollupDelta()
+            conn.execute('BEGIN')
+            with deferred_search_index(conn):
+                conn.executemany(INSERT_TRANSACTION, batch)
+            for values in batch:
+                delta.add(user_id, values[1], values[2], values[3], values[5], values[6])
+            touched = delta.touched()
+            delta.apply(conn)
+            conn.commit()
+            result['accepted'] += len(batch)
+            self.cache.invalidate_months(touched)
+            batch.clear()
+            batch_rows.clear()
+
+        now = current_timestamp()
+        conn = self.pool.acquire()
+        try:
+            default_currency = base_currency(conn, user_id)
+            categoriser = self.rules.get_categoriser(user_id, conn) if categorise else None
+            for row_number, row in enumerate(rows, start=1):
+                try:
+                    if categoriser is not None:
+                        row = categoriser.fill(row)
+                    values = validate_row(row, default_currency)
+                except ValueError as e:
+                    reject(row_number, str(e))
+                    continue
+                if values[4] is None:
+                    values = values[:4] + (now,) + values[5:]
+                batch.append((user_id,) + values)
+                batch_rows.append(row_number)
+                if len(batch) >= batch_size:
+                    flush(conn)
+            if batch:
+                flush(conn)
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"Error importing transactions: {e}")
+            for row_number in batch_rows:
+                reject(row_number, str(e))
+            result['error'] = str(e)
+        finally:
+            self.pool.release(conn)
+        return result
+
+    def add_transactions_group(self, items):
+        """Insert transactions for any number of users under a single commit.
+
+        items are (user_id, type, category, amount, description, date) tuples,
+        typically small writes from concurrent callers grouped together.
+        Returns one entry per item, True or the reason it was rejected, or
+        None if the group could not be committed.
+        """
+        results = []
+        delta = RollupDelta()
+        currencies = {}
+        now = current_timestamp()
+        conn = self.pool.acquire()
+        try:
+            conn.execute('BEGIN')
+            with deferred_search_index(conn):
+                for user_id, *row in items:
+                    try:
+                        if user_id not in currencies:
+                            currencies[user_id] = base_currency(conn, user_id)
+                        values = validate_row(row, currencies[user_id])
+                        if values[4] is None:
+                            values = values[:4] + (now,) + values[5:]
+                        conn.execute(INSERT_TRANSACTION, (user_id,) + values)
+                    except (sqlite3.IntegrityError, ValueError) as e:
+                        results.append(str(e))
+                        continue
+                    delta.add(user_id, values[0], values[1], values[2], values[4],
+                              values[5])
+                    results.append(True)
+            touched = delta.touched()
+            delta.apply(conn)
+            conn.commit()
+            self.cache.invalidate_months(touched)
+            return results
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Error adding transactions: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
 
     def update_transaction(self, transaction_id, user_id, type=None, category=None, 
                           amount=None, description=None):
         """Update an existing transaction"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.acquire()
         cursor = conn.cursor()
 
         try:
             # Get current transaction data
             cursor.execute("""
-                SELECT type, category, amount, description 
+                SELECT type, category, amount_cents, description, date, currency
                 FROM transactions 
                 WHERE id = ? AND user_id = ?
             """, (transaction_id, user_id))
@@ -45,48 +376,65 @@ class TransactionManager:
             # Update with new values or keep current ones
             new_type = type if type else current[0]
             new_category = category if category else current[1]
-            new_amount = amount if amount else current[2]
+            new_amount = to_cents(amount) if amount else current[2]
             new_description = description if description else current[3]
+            new_currency = amount.currency if isinstance(amount, Money) else current[5]
 
             cursor.execute("""
                 UPDATE transactions 
-                SET type = ?, category = ?, amount = ?, description = ? 
+                SET type = ?, category = ?, amount_cents = ?, description = ?,
+                    currency = ?
                 WHERE id = ? AND user_id = ?
-            """, (new_type, new_category, new_amount, new_description, 
+            """, (new_type, new_category, new_amount, new_description, new_currency,
                   transaction_id, user_id))
+            delta = RollupDelta()
+            delta.remove(user_id, *current[:3], current[4], current[5])
+            delta.add(user_id, new_type, new_category, new_amount, current[4], new_currency)
+            touched = delta.touched()
+            delta.apply(conn)
             conn.commit()
+            self.cache.invalidate_months(touched)
             return True
-        except sqlite3.Error as e:
+        except (sqlite3.Error, ValueError) as e:
             print(f"Error updating transaction: {e}")
             return False
         finally:
-            conn.close()
+            self.pool.release(conn)
 
     def delete_transaction(self, transaction_id, user_id):
         """Delete a transaction"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.acquire()
         cursor = conn.cursor()
 
         try:
+            cursor.execute("""
+                SELECT type, category, amount_cents, date, currency FROM transactions
+                WHERE id = ? AND user_id = ?
+            """, (transaction_id, user_id))
+            current = cursor.fetchone()
+            if not current:
+                return False
+
             cursor.execute("""
                 DELETE FROM transactions 
                 WHERE id = ? AND user_id = ?
             """, (transaction_id, user_id))
+            delta = RollupDelta()
+            delta.remove(user_id, *current)
+            touched = delta.touched()
+            delta.apply(conn)
             conn.commit()
-            return cursor.rowcount > 0
+            self.cache.invalidate_months(touched)
+            return True
         except sqlite3.Error as e:
             print(f"Error deleting transaction: {e}")
             return False
         finally:
-            conn.close()
+            self.pool.release(conn)
 
-    def get_transactions(self, user_id, start_date=None, end_date=None, 
-                        transaction_type=None, category=None):
-        """Get transactions with optional filters"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        query = "SELECT * FROM transactions WHERE user_id = ?"
+    def _filter_clause(self, user_id, start_date, end_date, transaction_type, category):
+        """Build the WHERE clause shared by the transaction listing queries"""
+        query = "WHERE user_id = ?"
         params = [user_id]
 
         if start_date:
@@ -101,46 +449,124 @@ class TransactionManager:
         if category:
             query += " AND category = ?"
             params.append(category)
+        return query, params
 
-        query += " ORDER BY date DESC"
+    def get_transactions_page(self, user_id, page_size=DEFAULT_PAGE_SIZE, cursor=None,
+                              start_date=None, end_date=None, transaction_type=None,
+                              category=None):
+        """Get one page of transactions, newest first.
 
+        cursor is the (date, id) of the last row of the previous page. Returns
+        (rows, next_cursor) where rows are Transaction tuples and next_cursor
+        is None on the last page.
+        """
+        where, params = self._filter_clause(user_id, start_date, end_date,
+                                            transaction_type, category)
+        if cursor:
+            # Keyset pagination: seek past the previous page via the index
+            where += " AND (date, id) < (?, ?)"
+            params.extend(cursor)
+        params.append(page_size)
+
+        conn = self.pool.acquire()
         try:
-            cursor.execute(query, params)
-            transactions = cursor.fetchall()
-            headers = ['ID', 'User ID', 'Type', 'Category', 'Amount', 
-                      'Description', 'Date']
-            return tabulate(transactions, headers=headers, tablefmt='grid')
+            rows = conn.execute(f"""
+                SELECT {TRANSACTION_COLUMNS} FROM transactions
+                {where}
+                ORDER BY date DESC, id DESC
+                LIMIT ?
+            """, params).fetchall()
         except sqlite3.Error as e:
             print(f"Error retrieving transactions: {e}")
             return None
         finally:
-            conn.close()
+            self.pool.release(conn)
+
+        rows = [Transaction.from_row(row) for row in rows]
+        next_cursor = (rows[-1].date, rows[-1].id) if len(rows) == page_size else None
+        return rows, next_cursor
+
+    def search_transactions(self, user_id, query, limit=DEFAULT_PAGE_SIZE, offset=0):
+        """Full-text search of descriptions and categories, best matches first.
+
+        Every word of query must match the start of a word, so 'groc' finds
+        'Grocery store'. Rows with every word whole in the description rank
+        first, then rows with every word whole in the description or category,
+        then the remaining prefix matches; within each tier the most recently
+        added come first. Returns (rows, next_offset) where next_offset is None
+        on the last page, or None on error.
+        """
+        words = search_expression(query, prefix=False)
+        if not words:
+            return [], None
+        low = int(user_id) * SEARCH_USER_STRIDE
+        conn = self.pool.acquire()
+        try:
+            rows = conn.execute(SEARCH_TRANSACTIONS, (
+                f"description : ({words})",
+                f"({words}) NOT description : ({words})",
+                f"({search_expression(query)}) NOT ({words})",
+                low, low + SEARCH_USER_STRIDE, limit, offset)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error searching transactions: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
+
+        rows = [Transaction.from_row(row) for row in rows]
+        return rows, (offset + limit if len(rows) == limit else None)
+
+    def iter_transactions(self, user_id, start_date=None, end_date=None,
+                          transaction_type=None, category=None,
+                          page_size=DEFAULT_STREAM_PAGE_SIZE):
+        """Lazily yield matching transactions, newest first, one page at a time"""
+        cursor = None
+        while True:
+            page = self.get_transactions_page(user_id, page_size, cursor, start_date,
+                                              end_date, transaction_type, category)
+            if page is None:
+                return
+            rows, cursor = page
+            yield from rows
+            if cursor is None:
+                return
+
+    def get_transactions(self, user_id, start_date=None, end_date=None, 
+                        transaction_type=None, category=None):
+        """Get transactions with optional filters, rendered as a table"""
+        rows = []
+        cursor = None
+        while True:
+            page = self.get_transactions_page(user_id, DEFAULT_STREAM_PAGE_SIZE, cursor,
+                                              start_date, end_date, transaction_type,
+                                              category)
+            if page is None:
+                return None
+            page_rows, cursor = page
+            rows.extend(page_rows)
+            if cursor is None:
+                return render_transactions(rows)
 
     def get_balance(self, user_id):
-        """Calculate current balance"""
-        conn = sqlite3.connect(self.db_path)
+        """Return the current balance from the materialised user_balances rows.
+
+        Balances held in other currencies are converted to the user's base
+        currency at the latest known rate.
+        """
+        conn = self.pool.acquire()
         cursor = conn.cursor()
 
         try:
-            # Calculate total income
+            base = base_currency(conn, user_id)
             cursor.execute("""
-                SELECT COALESCE(SUM(amount), 0) 
-                FROM transactions 
-                WHERE user_id = ? AND type = 'income'
+                SELECT currency, income - expenses FROM user_balances WHERE user_id = ?
             """, (user_id,))
-            total_income = cursor.fetchone()[0]
-
-            # Calculate total expenses
-            cursor.execute("""
-                SELECT COALESCE(SUM(amount), 0) 
-                FROM transactions 
-                WHERE user_id = ? AND type = 'expense'
-            """, (user_id,))
-            total_expenses = cursor.fetchone()[0]
-
-            return total_income - total_expenses
-        except sqlite3.Error as e:
+            factor = self.fx.rate_to(base)
+            today = current_timestamp()[:10]
+            return Money(sum(round(cents * factor(currency, today))
+                             for currency, cents in cursor.fetchall()), base)
+        except (sqlite3.Error, MissingRateError) as e:
             print(f"Error calculating balance: {e}")
             return None
         finally:
-            conn.close()
\ No newline at end of file
+            self.pool.release(conn)
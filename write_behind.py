@@ -0,0 +1,126 @@
+"""Write-behind queue for high-rate transaction inserts.
+
+Producers enqueue rows and get a Future back immediately. One writer thread
+drains the queue and commits rows in groups, whenever batch_size rows are
+waiting or max_delay has passed since the oldest one arrived. SQLite allows
+a single writer anyway, so funnelling every insert through one thread avoids
+lock contention between producers and shares each commit across many rows.
+"""
+import atexit
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+DEFAULT_WRITE_BATCH_SIZE = 500
+DEFAULT_WRITE_DELAY = 0.005  # seconds the oldest queued row may wait
+
+_STOP = object()
+
+# Queues not yet closed; weak, so the exit hook keeps no queue alive
+_open_queues = weakref.WeakSet()
+
+@atexit.register
+def _close_open_queues():
+    """Commit the rows of every queue its owner never closed"""
+    for write_queue in list(_open_queues):
+        write_queue.close()
+
+class WriteBehindQueue:
+    """Single writer thread committing queued transactions in groups"""
+
+    def __init__(self, transaction_manager, batch_size=DEFAULT_WRITE_BATCH_SIZE,
+                 max_delay=DEFAULT_WRITE_DELAY):
+        self.transaction_manager = transaction_manager
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay
+        self.closed = False
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='finance-write-behind',
+                                        daemon=True)
+        self._thread.start()
+        # Queued rows are committed even if the owner never calls close()
+        _open_queues.add(self)
+
+    def submit(self, user_id, type, category, amount, description=None, date=None):
+        """Queue a transaction; the Future resolves to True once it is committed.
+
+        It resolves to False if the row is rejected or its group fails.
+        """
+        future = Future()
+        with self._lock:
+            if self.closed:
+                raise RuntimeError('write-behind queue is closed')
+            self._queue.put(((user_id, type, category, amount, description, date), future))
+        return future
+
+    def flush(self, timeout=None):
+        """Block until every row queued so far has been committed"""
+        marker = Future()
+        with self._lock:
+            if self.closed:
+                return
+            self._queue.put((None, marker))
+        marker.result(timeout)
+
+    def close(self):
+        """Commit everything still queued and stop the writer thread"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+        _open_queues.discard(self)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            group = [item]
+            deadline = time.monotonic() + self.max_delay
+            # Keep collecting until the group is full or the oldest row is due
+            while len(group) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                group.append(item)
+                if item[0] is None:
+                    break  # flush() is waiting; commit now
+            try:
+                self._commit(group)
+            except Exception as e:
+                # Fail this group only; the writer keeps serving later rows
+                for _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _commit(self, group):
+        # Rows whose Future was cancelled while queued are not written; the
+        # rest are marked running, so they can no longer be cancelled
+        group = [(row, future) for row, future in group
+                 if future.set_running_or_notify_cancel()]
+        rows = [row for row, _ in group if row is not None]
+        results, error = [], None
+        if rows:
+            try:
+                results = self.transaction_manager.add_transactions_group(rows) or []
+            except Exception as e:
+                error = e
+        results = iter(results)
+        for row, future in group:
+            if row is None:
+                # flush() marker: everything queued before it is now committed
+                future.set_result(True)
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(next(results, False) is True)